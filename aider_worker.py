@@ -0,0 +1,373 @@
+import contextlib
+import io
+import json
+import logging
+import os
+import queue
+import signal
+import subprocess
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+from process_runner import PROCESS_CHECK_INTERVAL, PROCESS_KILL_GRACE, CommandCancelled, current_cancel_event
+
+logger = logging.getLogger(__name__)
+
+# 常驻 worker 配置
+AIDER_WORKER_MODE = os.getenv("AIDER_WORKER_MODE", "false").lower() == "true"
+AIDER_WORKER_POOL_SIZE = int(os.getenv("AIDER_WORKER_POOL_SIZE", os.getenv("JOB_WORKERS", "2")))
+AIDER_WORKER_MAX_TASKS = int(os.getenv("AIDER_WORKER_MAX_TASKS", "20"))
+AIDER_WORKER_STARTUP_TIMEOUT = float(os.getenv("AIDER_WORKER_STARTUP_TIMEOUT", "120"))
+AIDER_WORKER_PING_TIMEOUT = float(os.getenv("AIDER_WORKER_PING_TIMEOUT", "5"))
+
+# 单条 output 事件的最大字符数，超长的行拆成多条发送
+AIDER_WORKER_LINE_LIMIT = 64 * 1024
+
+
+class AiderWorker:
+    """单个常驻 aider 进程 - 通过 stdin/stdout 的 JSON 行协议接收任务"""
+
+    def __init__(self, env: Dict[str, str]):
+        self.env = env
+        self.process: Optional[subprocess.Popen] = None
+        self.tasks_done = 0
+        self.startup_seconds = 0.0
+        self._replies: "queue.Queue[Optional[Dict[str, Any]]]" = queue.Queue()
+
+    def start(self):
+        """启动 worker 进程并等待 aider 导入完成"""
+        started = time.monotonic()
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__)],
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=None,  # aider 的终端输出直接进入服务日志
+            text=True,
+            bufsize=1,
+            env=self.env,
+            start_new_session=True  # 独立进程组，终止时连同 aider 启动的 git 等子进程一起结束
+        )
+        threading.Thread(target=self._read_replies, name=f"aider-worker-{self.process.pid}", daemon=True).start()
+
+        ready = self._receive(AIDER_WORKER_STARTUP_TIMEOUT)
+        if not ready or ready.get("event") != "ready":
+            self.stop()
+            raise RuntimeError(f"常驻 aider worker 启动失败: {ready}")
+
+        self.startup_seconds = time.monotonic() - started
+        logger.info(f"🔥 常驻 aider worker {self.process.pid} 已就绪，启动耗时 {self.startup_seconds:.2f} 秒")
+
+    def is_alive(self) -> bool:
+        return self.process is not None and self.process.poll() is None
+
+    def ping(self, timeout: float = AIDER_WORKER_PING_TIMEOUT) -> bool:
+        """健康检查"""
+        if not self.is_alive():
+            return False
+        try:
+            self._send({"op": "ping"})
+        except (BrokenPipeError, OSError):
+            return False
+        reply = self._receive(timeout)
+        return bool(reply and reply.get("ok"))
+
+    def run_task(
+        self,
+        cwd: str,
+        args: List[str],
+        message: str,
+        on_output: Optional[Callable[[str], None]] = None,
+        timeout: Optional[float] = None,
+        idle_timeout: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """
+        在指定目录执行一次编码任务；args 为 aider 命令行参数（不含 --message），
+        aider 的输出逐行以 output 事件到达，交给 on_output 处理
+
+        与 run_command 相同：任务被取消、超过 timeout 或连续 idle_timeout 秒没有输出时终止 worker 的整个进程组，
+        分别抛出 CommandCancelled 和 subprocess.TimeoutExpired，worker 不再可用。
+        """
+        self._send({"op": "code", "cwd": cwd, "args": args, "message": message})
+        self.tasks_done += 1
+        cancel_event = current_cancel_event()
+        started = last_output = time.monotonic()
+        while True:
+            try:
+                reply = self._replies.get(timeout=PROCESS_CHECK_INTERVAL)
+            except queue.Empty:
+                now = time.monotonic()
+                if cancel_event is not None and cancel_event.is_set():
+                    self.kill("cancelled")
+                    raise CommandCancelled("任务已取消，已终止常驻 aider worker")
+                if timeout and now - started > timeout:
+                    self.kill("timeout")
+                    raise subprocess.TimeoutExpired(["aider-worker"], timeout)
+                if idle_timeout and now - last_output > idle_timeout:
+                    self.kill("idle")
+                    raise subprocess.TimeoutExpired(["aider-worker"], idle_timeout)
+                continue
+
+            if reply is None:
+                # worker 进程已退出
+                self.stop()
+                return {"success": False, "error": "常驻 aider worker 已退出"}
+            last_output = time.monotonic()
+            if reply.get("event") != "output":
+                return reply
+            if on_output is not None:
+                on_output(reply["line"])
+
+    def kill(self, reason: str):
+        """先 SIGTERM 整个进程组，宽限期后仍未退出则 SIGKILL"""
+        if not self.is_alive():
+            return
+        logger.warning(f"⏹️  终止常驻 aider worker {self.process.pid} ({reason})")
+        try:
+            os.killpg(self.process.pid, signal.SIGTERM)
+            self.process.wait(timeout=PROCESS_KILL_GRACE)
+        except subprocess.TimeoutExpired:
+            os.killpg(self.process.pid, signal.SIGKILL)
+            self.process.wait()
+        except ProcessLookupError:
+            pass
+
+    def stop(self):
+        """结束 worker 进程"""
+        if not self.process:
+            return
+        if self.is_alive():
+            try:
+                self._send({"op": "shutdown"})
+                self.process.wait(timeout=5)
+            except (BrokenPipeError, OSError, subprocess.TimeoutExpired):
+                self.process.kill()
+                self.process.wait()
+
+    def _send(self, message: Dict[str, Any]):
+        self.process.stdin.write(json.dumps(message, ensure_ascii=False) + "\n")
+        self.process.stdin.flush()
+
+    def _receive(self, timeout: float) -> Optional[Dict[str, Any]]:
+        try:
+            return self._replies.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+    def _read_replies(self):
+        """后台读取 worker 的应答，避免阻塞调用方超时判断"""
+        for line in self.process.stdout:
+            try:
+                self._replies.put(json.loads(line))
+            except json.JSONDecodeError:
+                logger.warning(f"⚠️  无法解析 aider worker 输出: {line.strip()}")
+        self._replies.put(None)
+
+
+class AiderWorkerPool:
+    """常驻 aider worker 进程池 - 复用已导入 aider/litellm 的进程，按任务数回收"""
+
+    def __init__(self, size: int = AIDER_WORKER_POOL_SIZE, max_tasks: int = AIDER_WORKER_MAX_TASKS):
+        self.size = max(1, size)
+        self.max_tasks = max(1, max_tasks)
+        self._idle: "queue.Queue[AiderWorker]" = queue.Queue()
+        self._slots = threading.Semaphore(self.size)
+        self._env: Optional[Dict[str, str]] = None
+
+        self._stats_lock = threading.Lock()
+        self._spawned = 0
+        self._recycled = 0
+        self._tasks = 0
+        self._startup_seconds_total = 0.0
+
+    def configure(self, env: Dict[str, str]):
+        """设置 worker 进程的环境变量（API Key、模型等）"""
+        self._env = env
+
+    def prewarm(self):
+        """预先启动所有 worker"""
+        workers = []
+        for _ in range(self.size - self._idle.qsize()):
+            workers.append(self._spawn())
+        for worker in workers:
+            self._idle.put(worker)
+
+    def run(
+        self,
+        cwd: str,
+        args: List[str],
+        message: str,
+        on_output: Optional[Callable[[str], None]] = None,
+        timeout: Optional[float] = None,
+        idle_timeout: Optional[float] = None
+    ) -> Dict[str, Any]:
+        """取出一个健康的 worker 执行任务，执行后按需回收；被取消或超时的 worker 已终止，后台补充新进程"""
+        with self._slots:
+            worker = self._checkout()
+            try:
+                result = worker.run_task(cwd, args, message, on_output=on_output, timeout=timeout, idle_timeout=idle_timeout)
+            except (BrokenPipeError, OSError) as e:
+                worker.stop()
+                return {"success": False, "error": f"常驻 aider worker 通信失败: {e}"}
+            except (CommandCancelled, subprocess.TimeoutExpired):
+                self._retire(worker)
+                threading.Thread(target=self._replenish, name="aider-worker-replenish", daemon=True).start()
+                raise
+
+            with self._stats_lock:
+                self._tasks += 1
+
+            if worker.is_alive() and worker.tasks_done < self.max_tasks:
+                self._idle.put(worker)
+            else:
+                self._retire(worker)
+                # 后台补充新进程，下一个任务无需等待冷启动
+                threading.Thread(target=self._replenish, name="aider-worker-replenish", daemon=True).start()
+            return result
+
+    def stats(self) -> Dict[str, Any]:
+        """统计信息：复用带来的启动时间节省 = 平均启动耗时 × (任务数 - 启动次数)"""
+        with self._stats_lock:
+            average_startup = self._startup_seconds_total / self._spawned if self._spawned else 0.0
+            return {
+                "size": self.size,
+                "idle": self._idle.qsize(),
+                "spawned": self._spawned,
+                "recycled": self._recycled,
+                "tasks": self._tasks,
+                "average_startup_seconds": round(average_startup, 3),
+                "startup_seconds_saved": round(max(0, self._tasks - self._spawned) * average_startup, 3)
+            }
+
+    def shutdown(self):
+        """结束所有空闲 worker"""
+        while True:
+            try:
+                self._idle.get_nowait().stop()
+            except queue.Empty:
+                break
+
+    def _checkout(self) -> AiderWorker:
+        """取出空闲 worker，健康检查失败时替换为新进程"""
+        while True:
+            try:
+                worker = self._idle.get_nowait()
+            except queue.Empty:
+                return self._spawn()
+            if worker.ping():
+                return worker
+            logger.warning("⚠️  常驻 aider worker 健康检查失败，重新启动")
+            self._retire(worker)
+
+    def _spawn(self) -> AiderWorker:
+        worker = AiderWorker(self._env or dict(os.environ))
+        worker.start()
+        with self._stats_lock:
+            self._spawned += 1
+            self._startup_seconds_total += worker.startup_seconds
+        return worker
+
+    def _replenish(self):
+        try:
+            self._idle.put(self._spawn())
+        except Exception as e:
+            logger.error(f"补充常驻 aider worker 失败: {str(e)}")
+
+    def _retire(self, worker: AiderWorker):
+        worker.stop()
+        with self._stats_lock:
+            self._recycled += 1
+
+
+# 进程级共享的常驻 worker 池
+aider_worker_pool = AiderWorkerPool()
+
+
+class _OutputEvents(io.TextIOBase):
+    """替换 worker 进程的 sys.stdout：aider 的输出按行作为 output 事件发回主进程，不在内存中累积"""
+
+    def __init__(self, send: Callable[[Dict[str, Any]], None]):
+        self._send = send
+        self._pending = ""
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, text: str) -> int:
+        self._pending += text
+        *lines, self._pending = self._pending.split("\n")
+        for line in lines:
+            self._emit(line)
+        while len(self._pending) >= AIDER_WORKER_LINE_LIMIT:
+            self._emit(self._pending[:AIDER_WORKER_LINE_LIMIT])
+            self._pending = self._pending[AIDER_WORKER_LINE_LIMIT:]
+        return len(text)
+
+    def finish(self):
+        """发送最后一行不完整的输出"""
+        if self._pending:
+            self._emit(self._pending)
+            self._pending = ""
+
+    def _emit(self, line: str):
+        self._send({"event": "output", "line": line})
+
+
+def _run_code_task(request: Dict[str, Any], send: Callable[[Dict[str, Any]], None], aider_main) -> Dict[str, Any]:
+    """
+    在 worker 进程内执行一次编码任务，aider 的终端输出逐行发回主进程
+
+    通过 aider 自己的命令行入口创建 Coder，参数、aider.conf、.env 和环境变量的处理与子进程模式完全相同。
+    """
+    output = _OutputEvents(send)
+    # stdin 是协议管道，aider 不能从中读取输入
+    stdin = sys.stdin
+    try:
+        os.chdir(request["cwd"])
+        sys.stdin = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            coder = aider_main(request["args"] + ["--no-fancy-input"], return_coder=True)
+            if isinstance(coder, int):
+                return {"event": "done", "success": False, "error": f"aider 启动失败，返回码 {coder}"}
+            coder.run(with_message=request["message"])
+        return {"event": "done", "success": True, "error": None}
+    except SystemExit as e:
+        return {"event": "done", "success": False, "error": f"aider 退出，返回码 {e.code}"}
+    except Exception as e:
+        return {"event": "done", "success": False, "error": f"{type(e).__name__}: {e}"}
+    finally:
+        sys.stdin = stdin
+        output.finish()
+
+
+def main():
+    """worker 进程入口：导入 aider 后循环处理 stdin 上的任务"""
+    # 协议使用原始 stdout，aider 自己的输出全部重定向到 stderr
+    protocol = os.fdopen(os.dup(1), "w", buffering=1)
+    os.dup2(2, 1)
+
+    def reply(message: Dict[str, Any]):
+        protocol.write(json.dumps(message, ensure_ascii=False) + "\n")
+        protocol.flush()
+
+    from aider.main import main as aider_main
+
+    reply({"event": "ready", "pid": os.getpid()})
+
+    for line in sys.stdin:
+        request = json.loads(line)
+        op = request.get("op")
+        if op == "ping":
+            reply({"ok": True})
+        elif op == "shutdown":
+            break
+        elif op == "code":
+            reply(_run_code_task(request, reply, aider_main))
+        else:
+            reply({"success": False, "error": f"未知操作: {op}"})
+
+
+if __name__ == "__main__":
+    main()
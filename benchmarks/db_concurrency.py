@@ -0,0 +1,139 @@
+"""
+数据库并发基准测试 - 对比 SQLite 默认配置与 build_engine 调优配置
+
+模拟 webhook 写入、任务状态更新和事件列表查询并发执行，统计吞吐量、
+p50/p99 延迟以及 "database is locked" 错误数。
+
+用法:
+    python benchmarks/db_concurrency.py --writers 4 --readers 4 --seconds 10 --output bench_db.json
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from sqlalchemy.exc import OperationalError
+from sqlmodel import Session, SQLModel, create_engine, select
+
+from database import build_engine
+from models import Job, WebhookEvent
+
+
+def baseline_engine(url: str):
+    """与改造前 database.py 相同的引擎配置"""
+    return create_engine(url, connect_args={"check_same_thread": False})
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def run(engine, writers: int, readers: int, seconds: float) -> dict:
+    """在给定引擎上并发执行写入和查询"""
+    SQLModel.metadata.create_all(engine)
+    stop = threading.Event()
+    lock = threading.Lock()
+    stats = {"write": [], "read": [], "locked": 0, "errors": 0}
+
+    def record(kind, started):
+        with lock:
+            stats[kind].append(time.perf_counter() - started)
+
+    def writer(worker_id: int):
+        counter = 0
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                with Session(engine) as session:
+                    event = WebhookEvent(
+                        linear_event="Issue", action="update", entity_type="Issue",
+                        entity_id=f"{worker_id}-{counter}", data={"title": "x" * 512}
+                    )
+                    session.add(event)
+                    session.flush()
+                    job = Job(event_id=event.id, payload={"prompt": "y" * 256})
+                    session.add(job)
+                    session.commit()
+                    job.status = "running"
+                    session.add(job)
+                    session.commit()
+                record("write", started)
+            except OperationalError as e:
+                with lock:
+                    stats["locked" if "locked" in str(e) else "errors"] += 1
+            counter += 1
+
+    def reader():
+        while not stop.is_set():
+            started = time.perf_counter()
+            try:
+                with Session(engine) as session:
+                    session.exec(
+                        select(WebhookEvent).order_by(WebhookEvent.created_at.desc(), WebhookEvent.id.desc()).limit(50)
+                    ).all()
+                record("read", started)
+            except OperationalError as e:
+                with lock:
+                    stats["locked" if "locked" in str(e) else "errors"] += 1
+
+    threads = [threading.Thread(target=writer, args=(i,)) for i in range(writers)]
+    threads += [threading.Thread(target=reader) for _ in range(readers)]
+    for thread in threads:
+        thread.start()
+    time.sleep(seconds)
+    stop.set()
+    for thread in threads:
+        thread.join()
+    engine.dispose()
+
+    result = {"locked_errors": stats["locked"], "other_errors": stats["errors"]}
+    for kind in ("write", "read"):
+        latencies = stats[kind]
+        result[kind] = {
+            "ops": len(latencies),
+            "ops_per_second": round(len(latencies) / seconds, 1),
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        }
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description="SQLite 并发基准测试")
+    parser.add_argument("--writers", type=int, default=4)
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--output", help="结果 JSON 文件路径")
+    args = parser.parse_args()
+
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        for name, factory in (("default", baseline_engine), ("tuned", build_engine)):
+            url = f"sqlite:///{os.path.join(tmp, name + '.db')}"
+            print(f"⏱️  运行 {name} 配置...")
+            results[name] = run(factory(url), args.writers, args.readers, args.seconds)
+
+    report = {
+        "benchmark": "db_concurrency",
+        "writers": args.writers,
+        "readers": args.readers,
+        "seconds": args.seconds,
+        "results": results,
+    }
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+    if args.output:
+        Path(args.output).write_text(json.dumps(report, indent=2, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,178 @@
+"""
+Git 后端基准测试 - 比较每个任务在 git 上的开销（subprocess vs pygit2）
+
+每次迭代模拟一个任务在工作树中的全部本地 git 操作:
+1. 取出工作树: 解析 main、检查 HEAD、切换到新分支
+2. 修改 --changed-files 个文件、新增一个文件、删除一个文件后提交（状态、暂存、提交）
+3. 归还工作树: 丢弃修改和未跟踪文件，切回 main
+
+推送和 worktree 增删两种后端都使用 git 命令行，不计入对比。
+
+默认生成一个包含 --files 个文件的合成仓库；--repo 指定已有仓库（例如 WoodenMan）时，
+先用 git clone --shared 复制一份，不修改原仓库。
+
+用法:
+    python benchmarks/git_backends.py --files 20000 --iterations 30
+    python benchmarks/git_backends.py --repo WoodenMan --iterations 30
+"""
+import argparse
+import json
+import logging
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from webhook_ingestion import current_commit, percentile
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+
+def build_synthetic_repo(path: Path, files: int, file_bytes: int, seed: int):
+    """生成按目录分布的 Python 文件并提交到 main"""
+    rng = random.Random(seed)
+    path.mkdir(parents=True)
+    for index in range(files):
+        directory = path / f"pkg{index % 50:02d}" / f"mod{index % 7}"
+        directory.mkdir(parents=True, exist_ok=True)
+        body = "".join(f"value_{index}_{line} = {rng.randint(0, 10 ** 6)}\n" for line in range(max(1, file_bytes // 24)))
+        (directory / f"file_{index}.py").write_text(body)
+    subprocess.run(["git", "init", "-q", "-b", "main"], cwd=path, check=True)
+    subprocess.run(["git", "add", "-A"], cwd=path, check=True)
+    subprocess.run(
+        ["git", "-c", "user.name=bench", "-c", "user.email=bench@example.com", "commit", "-q", "-m", "initial"],
+        cwd=path, check=True
+    )
+
+
+def prepare_repo(args, workdir: Path) -> Path:
+    repo = workdir / "repo"
+    if args.repo:
+        subprocess.run(["git", "clone", "-q", "--shared", "--branch", "main", str(Path(args.repo).resolve()), str(repo)], check=True)
+    else:
+        print(f"🏗️  生成包含 {args.files} 个文件的合成仓库...")
+        build_synthetic_repo(repo, args.files, args.file_bytes, args.seed)
+    for key, value in (("user.name", "bench"), ("user.email", "bench@example.com")):
+        subprocess.run(["git", "config", key, value], cwd=repo, check=True)
+    return repo
+
+
+def run_backend(backend, repo: Path, worktree: Path, iterations: int, changed_files: int, seed: int) -> dict:
+    """在工作树中重复执行一个任务的 git 操作，返回每个阶段的耗时统计"""
+    rng = random.Random(seed)
+    tracked = sorted(str(p.relative_to(worktree)) for p in worktree.rglob("*.py") if ".git" not in p.parts)
+    stages = {"acquire": [], "commit": [], "release": [], "job": []}
+
+    for iteration in range(iterations):
+        job_started = time.perf_counter()
+
+        started = time.perf_counter()
+        base = backend.resolve(str(repo), "main")
+        if backend.head(str(worktree)) != base:
+            backend.checkout_detached(str(worktree), base)
+        backend.create_branch(str(worktree), f"bench-{backend.name}-{iteration}-{os.getpid()}")
+        stages["acquire"].append(time.perf_counter() - started)
+
+        # 模拟 aider 的修改（不计时）
+        edit_started = time.perf_counter()
+        for relative in rng.sample(tracked, changed_files + 1)[:changed_files]:
+            with open(worktree / relative, "a") as f:
+                f.write(f"# edited in iteration {iteration}\n")
+        (worktree / f"new_{iteration}.py").write_text("print('new')\n")
+        (worktree / rng.choice(tracked)).unlink(missing_ok=True)
+        edit_seconds = time.perf_counter() - edit_started
+
+        started = time.perf_counter()
+        commit = backend.commit_all(str(worktree), f"bench commit {iteration}")
+        stages["commit"].append(time.perf_counter() - started)
+        if commit is None:
+            raise RuntimeError("提交失败：没有检测到修改")
+
+        started = time.perf_counter()
+        backend.reset_clean(str(worktree), backend.resolve(str(repo), "main"))
+        stages["release"].append(time.perf_counter() - started)
+
+        stages["job"].append(time.perf_counter() - job_started - edit_seconds)
+
+    return {
+        name: {
+            "mean_ms": round(sum(values) / len(values) * 1000, 3),
+            "p50_ms": round(percentile(values, 0.50) * 1000, 3),
+            "p99_ms": round(percentile(values, 0.99) * 1000, 3),
+        }
+        for name, values in stages.items()
+    }
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="比较 subprocess 与 pygit2 后端的每任务 git 开销")
+    parser.add_argument("--repo", help="已有仓库路径（默认生成合成仓库）")
+    parser.add_argument("--files", type=int, default=20000, help="合成仓库的文件数")
+    parser.add_argument("--file-bytes", type=int, default=2048, help="合成文件的大致大小")
+    parser.add_argument("--iterations", type=int, default=30)
+    parser.add_argument("--changed-files", type=int, default=5, help="每个任务修改的文件数")
+    parser.add_argument("--backends", default="subprocess,pygit2")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="结果 JSON 文件路径，默认 benchmarks/results/git_backends-<commit>.json")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    from git_backend import create_git_backend, run_git
+
+    commit = current_commit()
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        workdir = Path(tmp)
+        repo = prepare_repo(args, workdir)
+        tracked_files = len(run_git(["ls-files"], cwd=str(repo)).stdout.splitlines())
+
+        for name in [item.strip() for item in args.backends.split(",") if item.strip()]:
+            try:
+                backend = create_git_backend(name)
+            except RuntimeError as e:
+                print(f"⚠️  跳过 {name}: {e}")
+                continue
+            worktree = workdir / f"wt-{name}"
+            run_git(["worktree", "add", "-q", "--detach", str(worktree), "main"], cwd=str(repo))
+            print(f"⏱️  {name}: {args.iterations} 次任务，仓库 {tracked_files} 个文件...")
+            results[name] = run_backend(backend, repo, worktree, args.iterations, args.changed_files, args.seed)
+            run_git(["worktree", "remove", "--force", str(worktree)], cwd=str(repo))
+
+    report = {
+        "benchmark": "git_backends",
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "parameters": {
+            "repo": args.repo,
+            "tracked_files": tracked_files,
+            "iterations": args.iterations,
+            "changed_files": args.changed_files,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+    if "subprocess" in results and "pygit2" in results:
+        print("\n📊 pygit2 相对 subprocess:")
+        for stage, stats in results["subprocess"].items():
+            before, after = stats["mean_ms"], results["pygit2"][stage]["mean_ms"]
+            print(f"  {stage}: {before} ms -> {after} ms ({(after - before) / before * 100:+.1f}%)")
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"git_backends-{commit}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False))
+    print(f"💾 结果已保存到 {output}")
+
+
+if __name__ == "__main__":
+    main_cli()
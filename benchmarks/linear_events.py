@@ -0,0 +1,171 @@
+"""
+合成 Linear webhook 事件生成器 - 供基准测试使用
+
+按 Linear 2025 webhook 结构生成带签名的请求体和头部，覆盖：
+- issue_label_added: Issue 更新且新增了 vibe-coding 标签（唯一会入队任务的事件）
+- issue_label_noop: Issue 更新，标签未变化（vibe-coding 早已存在）
+- issue_title_update: Issue 更新，只修改了标题，不含 vibe-coding 标签
+- issue_create: Issue 创建
+- comment_create: Comment 创建
+- reaction_create: Reaction 创建
+"""
+import hashlib
+import hmac
+import json
+import random
+import uuid
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
+
+EVENT_KINDS = (
+    "issue_label_added",
+    "issue_label_noop",
+    "issue_title_update",
+    "issue_create",
+    "comment_create",
+    "reaction_create",
+)
+
+LABEL_POOL = ("bug", "feature", "frontend", "backend", "infra", "docs", "p1", "p2")
+VIBE_CODING = {"id": "label-vibe-coding", "name": "vibe-coding", "color": "#5e6ad2"}
+
+LOREM = (
+    "登录页面在移动端显示异常，提交按钮被键盘遮挡。需要调整布局并补充对应的单元测试，"
+    "同时检查其他表单页面是否存在相同问题。The layout breaks on narrow screens and the "
+    "submit handler fires twice when the user presses enter. "
+)
+
+
+def sign(body: bytes, secret: str) -> str:
+    """与 Linear 相同的签名方式：HMAC-SHA256 十六进制，无前缀"""
+    return hmac.new(secret.encode("utf-8"), body, hashlib.sha256).hexdigest()
+
+
+class LinearEventGenerator:
+    """按给定比例生成带签名的合成 Linear webhook 事件"""
+
+    def __init__(self, secret: Optional[str], relevant_ratio: float = 0.1, seed: int = 42, description_bytes: int = 2000):
+        """
+        Args:
+            secret: 签名密钥，为空时不生成 Linear-Signature 头部
+            relevant_ratio: issue_label_added 事件所占比例，其余类型均分剩余比例
+            seed: 随机种子，保证多次运行生成相同的事件序列
+            description_bytes: Issue 描述的近似长度，用于模拟真实载荷大小
+        """
+        self.secret = secret
+        self.relevant_ratio = relevant_ratio
+        self.random = random.Random(seed)
+        self.description = (LOREM * (description_bytes // len(LOREM.encode("utf-8")) + 1))[:description_bytes]
+        self._counter = 0
+
+    def generate(self, count: int) -> List[Tuple[str, bytes, Dict[str, str]]]:
+        """生成 count 个事件，返回 (事件类型, 请求体, 请求头) 列表"""
+        return list(self.iter_events(count))
+
+    def iter_events(self, count: int) -> Iterator[Tuple[str, bytes, Dict[str, str]]]:
+        others = EVENT_KINDS[1:]
+        for _ in range(count):
+            if self.random.random() < self.relevant_ratio:
+                kind = EVENT_KINDS[0]
+            else:
+                kind = self.random.choice(others)
+            yield self.build(kind)
+
+    def build(self, kind: str) -> Tuple[str, bytes, Dict[str, str]]:
+        """构建指定类型的事件"""
+        self._counter += 1
+        builder = getattr(self, f"_{kind}")
+        entity_type, action, data, updated_from = builder()
+
+        payload = {
+            "action": action,
+            "type": entity_type,
+            "data": data,
+            "url": data.get("url"),
+            "createdAt": _now(),
+            "webhookTimestamp": int(datetime.now(timezone.utc).timestamp() * 1000),
+            "webhookId": str(uuid.uuid4()),
+            "organizationId": "org-benchmark",
+        }
+        if updated_from is not None:
+            payload["updatedFrom"] = updated_from
+
+        body = json.dumps(payload, ensure_ascii=False).encode("utf-8")
+        headers = {
+            "Content-Type": "application/json",
+            "Linear-Delivery": str(uuid.uuid4()),
+            "Linear-Event": entity_type,
+        }
+        if self.secret:
+            headers["Linear-Signature"] = sign(body, self.secret)
+        return kind, body, headers
+
+    def _labels(self, with_vibe_coding: bool) -> List[Dict[str, str]]:
+        names = self.random.sample(LABEL_POOL, self.random.randint(0, 3))
+        labels = [{"id": f"label-{name}", "name": name, "color": "#bec2c8"} for name in names]
+        if with_vibe_coding:
+            labels.append(dict(VIBE_CODING))
+        return labels
+
+    def _issue(self, labels: List[Dict[str, str]]) -> Dict:
+        number = 1000 + self._counter
+        return {
+            # 每个事件使用不同的 Issue，避免触发 30 秒内同实体去重
+            "id": str(uuid.uuid4()),
+            "identifier": f"ENG-{number}",
+            "number": number,
+            "title": f"修复移动端登录表单问题 #{number}",
+            "description": self.description,
+            "priority": self.random.randint(0, 4),
+            "state": {"id": "state-todo", "name": "Todo", "type": "unstarted"},
+            "team": {"id": "team-eng", "key": "ENG", "name": "Engineering"},
+            "assignee": {"id": "user-1", "name": "Allen", "email": "allen@example.com"},
+            "labels": labels,
+            "labelIds": [label["id"] for label in labels],
+            "createdAt": _now(),
+            "updatedAt": _now(),
+            "url": f"https://linear.app/benchmark/issue/ENG-{number}",
+        }
+
+    def _issue_label_added(self):
+        old_labels = self._labels(with_vibe_coding=False)
+        data = self._issue(old_labels + [dict(VIBE_CODING)])
+        return "Issue", "update", data, {"labels": old_labels, "labelIds": [label["id"] for label in old_labels], "updatedAt": _now()}
+
+    def _issue_label_noop(self):
+        labels = self._labels(with_vibe_coding=True)
+        data = self._issue(labels)
+        return "Issue", "update", data, {"labels": labels, "updatedAt": _now()}
+
+    def _issue_title_update(self):
+        data = self._issue(self._labels(with_vibe_coding=False))
+        return "Issue", "update", data, {"title": "旧标题", "updatedAt": _now()}
+
+    def _issue_create(self):
+        return "Issue", "create", self._issue(self._labels(with_vibe_coding=self.random.random() < 0.5)), None
+
+    def _comment_create(self):
+        data = {
+            "id": str(uuid.uuid4()),
+            "body": "看起来是 CSS 的问题，我来跟进。" * 4,
+            "issueId": str(uuid.uuid4()),
+            "issue": {"id": str(uuid.uuid4()), "title": "修复移动端登录表单问题"},
+            "user": {"id": "user-2", "name": "Reviewer"},
+            "createdAt": _now(),
+            "url": f"https://linear.app/benchmark/comment/{self._counter}",
+        }
+        return "Comment", "create", data, None
+
+    def _reaction_create(self):
+        data = {
+            "id": str(uuid.uuid4()),
+            "emoji": self.random.choice(["👍", "🎉", "👀"]),
+            "commentId": str(uuid.uuid4()),
+            "user": {"id": "user-3", "name": "Teammate"},
+            "createdAt": _now(),
+        }
+        return "Reaction", "create", data, None
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="milliseconds").replace("+00:00", "Z")
@@ -0,0 +1,202 @@
+"""
+Prompt 构建基准测试 - 比较旧的字符串拼接与模板引擎在大型 Issue 上的表现
+
+对每个描述大小生成一个合成 Issue（标题/列表/代码块/普通段落混合，附带 --comments 条评论），统计:
+1. 构建 prompt 的耗时（p50/p99）
+2. prompt 的字节数和估算 token 数
+3. prompt 作为单个命令行参数（--message）能否启动进程；Linux 上单个参数超过 128KB 会报 E2BIG
+
+旧实现（按 += 拼接完整描述，不含评论）保留在本文件中作为基线。
+
+用法:
+    python benchmarks/prompt_building.py --sizes 2k,64k,256k,1m,4m --iterations 50
+"""
+import argparse
+import errno
+import json
+import logging
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+from webhook_ingestion import current_commit, percentile
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+WORDS = "lorem ipsum dolor sit amet consectetur adipiscing elit sed do eiusmod tempor incididunt".split()
+
+
+def legacy_issue_prompt(action: str, data: dict) -> str:
+    """改造前的 format_issue_for_aider"""
+    title = data.get("title", "")
+    identifier = data.get("identifier", "")
+    description = data.get("description", "")
+    state = data.get("state", {})
+    team = data.get("team", {})
+    assignee = data.get("assignee", {})
+    url = data.get("url", "")
+    labels = data.get("labels", [])
+
+    prompt = f"Linear Issue {action.upper()}: {identifier} - {title}\n"
+    prompt += f"Team: {team.get('name', 'Unknown')} ({team.get('key', '')})\n"
+    prompt += f"State: {state.get('name', 'Unknown')}\n"
+    if assignee:
+        prompt += f"Assignee: {assignee.get('name', 'Unknown')}\n"
+    if labels:
+        label_names = [label.get("name", "") for label in labels]
+        prompt += f"Labels: {', '.join(label_names)}\n"
+        if any(label.get("name", "").lower() == "vibe-coding" for label in labels):
+            prompt += f"🎯 VIBE-CODING LABEL DETECTED - This issue requires AI coding assistance!\n"
+    if description:
+        prompt += f"Description:\n{description}\n"
+    prompt += f"URL: {url}\n"
+    prompt += f"\n🤖 AI CODING TASK:\n"
+    prompt += f"Please analyze this Linear Issue and implement the requested changes in the WoodenMan project.\n"
+    prompt += f"Focus on the issue description and any specific requirements mentioned.\n"
+    prompt += f"Make sure to create meaningful commits and a clear PR description.\n"
+    return prompt
+
+
+def parse_size(value: str) -> int:
+    units = {"k": 1024, "m": 1024 * 1024}
+    value = value.strip().lower()
+    return int(float(value[:-1]) * units[value[-1]]) if value[-1] in units else int(value)
+
+
+def sentence(rng: random.Random, words: int) -> str:
+    return " ".join(rng.choice(WORDS) for _ in range(words)) + "."
+
+
+def synthetic_description(rng: random.Random, size: int) -> str:
+    """生成接近 size 字节的 Markdown 描述"""
+    blocks, total, index = [], 0, 0
+    while total < size:
+        kind = index % 12
+        if kind == 0:
+            block = f"## Part {index // 12}"
+        elif kind in (3, 7):
+            block = "\n".join(f"- [ ] must {sentence(rng, 8)}" for _ in range(4))
+        elif kind == 10:
+            block = "```python\n" + "\n".join(f"value_{line} = compute({line})" for line in range(30)) + "\n```"
+        else:
+            block = " ".join(sentence(rng, 15) for _ in range(6))
+        blocks.append(block)
+        total += len(block) + 2
+        index += 1
+    return "\n\n".join(blocks)[:size]
+
+
+def synthetic_issue(rng: random.Random, size: int, comments: int, comment_bytes: int) -> dict:
+    return {
+        "id": "issue-id",
+        "identifier": "ENG-1234",
+        "title": "Synthetic large issue",
+        "description": synthetic_description(rng, size),
+        "state": {"name": "Todo"},
+        "team": {"name": "Engineering", "key": "ENG"},
+        "assignee": {"name": "Bench"},
+        "labels": [{"name": "vibe-coding"}, {"name": "backend"}],
+        "url": "https://linear.app/example/issue/ENG-1234",
+        "comments": {"nodes": [
+            {
+                "body": synthetic_description(rng, comment_bytes),
+                "user": {"name": f"user{index % 5}"},
+                "createdAt": f"2025-01-01T00:{index // 60:02d}:{index % 60:02d}Z",
+            }
+            for index in range(comments)
+        ]},
+    }
+
+
+def argv_accepts(prompt: str) -> bool:
+    """prompt 作为单个参数能否启动进程"""
+    try:
+        subprocess.run(["true", "--message", prompt], check=False)
+        return True
+    except OSError as e:
+        if e.errno == errno.E2BIG:
+            return False
+        raise
+
+
+def measure(build, issue: dict, iterations: int) -> dict:
+    timings = []
+    for _ in range(iterations):
+        started = time.perf_counter()
+        prompt = build("update", issue)
+        timings.append(time.perf_counter() - started)
+    from prompts import estimate_tokens
+    return {
+        "p50_ms": round(percentile(timings, 0.50) * 1000, 3),
+        "p99_ms": round(percentile(timings, 0.99) * 1000, 3),
+        "bytes": len(prompt.encode("utf-8")),
+        "tokens": estimate_tokens(prompt),
+        "argv_ok": argv_accepts(prompt),
+    }
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="比较旧的字符串拼接与模板引擎构建 prompt 的耗时和大小")
+    parser.add_argument("--sizes", default="2k,64k,256k,1m,4m", help="描述大小列表，支持 k/m 后缀")
+    parser.add_argument("--comments", type=int, default=50, help="每个 Issue 的评论数")
+    parser.add_argument("--comment-bytes", type=int, default=2000, help="每条评论的大致大小")
+    parser.add_argument("--iterations", type=int, default=50)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", help="结果 JSON 文件路径，默认 benchmarks/results/prompt_building-<commit>.json")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    from prompts import PROMPT_TOKEN_BUDGET, build_issue_prompt
+
+    commit = current_commit()
+    rng = random.Random(args.seed)
+    results = {}
+    for label in [item.strip() for item in args.sizes.split(",") if item.strip()]:
+        issue = synthetic_issue(rng, parse_size(label), args.comments, args.comment_bytes)
+        print(f"⏱️  描述 {label}，{args.comments} 条评论，{args.iterations} 次...")
+        results[label] = {
+            "legacy": measure(legacy_issue_prompt, issue, args.iterations),
+            "engine": measure(build_issue_prompt, issue, args.iterations),
+        }
+
+    report = {
+        "benchmark": "prompt_building",
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "parameters": {
+            "sizes": args.sizes,
+            "comments": args.comments,
+            "comment_bytes": args.comment_bytes,
+            "iterations": args.iterations,
+            "token_budget": PROMPT_TOKEN_BUDGET,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+    print("\n📊 旧实现 -> 模板引擎:")
+    for label, result in results.items():
+        legacy, engine = result["legacy"], result["engine"]
+        print(
+            f"  {label}: {legacy['tokens']} -> {engine['tokens']} tokens, "
+            f"p50 {legacy['p50_ms']} -> {engine['p50_ms']} ms, "
+            f"命令行参数 {'可用' if legacy['argv_ok'] else 'E2BIG'} -> {'可用' if engine['argv_ok'] else 'E2BIG'}"
+        )
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"prompt_building-{commit}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False))
+    print(f"💾 结果已保存到 {output}")
+
+
+if __name__ == "__main__":
+    main_cli()
@@ -0,0 +1,249 @@
+"""
+Webhook 接收基准测试 - 通过本地 ASGI 客户端回放合成的 Linear 事件
+
+流程:
+1. 预先写入 --seed-events 个会入队任务的事件，让事件表有一定数据量
+2. 并发回放混合事件（Issue 标签新增/无变化、标题修改、Issue/Comment/Reaction 创建），
+   统计 POST /webhook/linear 的 p50/p99 延迟和每秒请求数（按事件类型分别统计）
+3. 重复执行 /webhook/events 的各类查询（完整、summary、fields、过滤、游标翻页、按 ID/Delivery 查询）
+
+aider、git 和 gh 全部打桩（后台任务直接返回成功），可离线运行。结果保存为 JSON，
+包含当前提交，便于跨提交对比回归。
+
+用法:
+    python benchmarks/webhook_ingestion.py --events 2000 --concurrency 16 --relevant-ratio 0.1
+    python benchmarks/webhook_ingestion.py --baseline benchmarks/results/webhook_ingestion-<commit>.json
+"""
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter, defaultdict
+from datetime import datetime, timezone
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import httpx
+
+from linear_events import LinearEventGenerator
+
+BENCHMARK_SECRET = "benchmark-webhook-secret"
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+
+def percentile(values, fraction):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def summarize(latencies, elapsed: float) -> dict:
+    return {
+        "requests": len(latencies),
+        "requests_per_second": round(len(latencies) / elapsed, 1) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+    }
+
+
+def current_commit() -> str:
+    result = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True)
+    commit = result.stdout.strip() or "unknown"
+    dirty = subprocess.run(["git", "diff", "--quiet", "HEAD", "--", "."], cwd=ROOT).returncode != 0
+    return f"{commit}-dirty" if dirty else commit
+
+
+def load_app(database_path: str, job_delay: float):
+    """配置离线环境后导入 main，并把 aider/git/gh 调用替换为桩函数"""
+    os.environ["DATABASE_URL"] = f"sqlite:///{database_path}"
+    os.environ["LINEAR_WEBHOOK_SECRET"] = BENCHMARK_SECRET
+    os.environ["AIDER_WORKER_MODE"] = "false"
+
+    import main
+
+    def stub_call_aider(formatted_prompt: str, woodenman_path: str, linear_event_info: dict) -> dict:
+        if job_delay:
+            time.sleep(job_delay)
+        return {
+            "success": True,
+            "output": "stubbed aider run",
+            "pr_result": {"success": True, "pr_url": "https://github.com/example/WoodenMan/pull/1"},
+        }
+
+    main.call_aider_with_linear_event = stub_call_aider
+    return main
+
+
+async def replay(client: httpx.AsyncClient, events, concurrency: int) -> dict:
+    """并发发送事件，返回总体与按类型的延迟统计"""
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = defaultdict(list)
+    statuses = Counter()
+
+    async def send(kind, body, headers):
+        async with semaphore:
+            started = time.perf_counter()
+            response = await client.post("/webhook/linear", content=body, headers=headers)
+            latencies[kind].append(time.perf_counter() - started)
+            status = response.json().get("status") if response.status_code < 500 else None
+            statuses[f"{response.status_code} {status}"] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(send(*event) for event in events))
+    elapsed = time.perf_counter() - started
+
+    all_latencies = [latency for values in latencies.values() for latency in values]
+    return {
+        "overall": summarize(all_latencies, elapsed),
+        "by_kind": {kind: summarize(values, elapsed) for kind, values in sorted(latencies.items())},
+        "statuses": dict(statuses),
+        "seconds": round(elapsed, 3),
+    }
+
+
+async def query_events(client: httpx.AsyncClient, iterations: int, concurrency: int) -> dict:
+    """对 /webhook/events 系列接口计时"""
+    first_page = await client.get("/webhook/events", params={"limit": 50})
+    events = first_page.json()
+    if not events:
+        return {}
+    next_cursor = first_page.headers.get("X-Next-Cursor")
+    sample = events[len(events) // 2]
+
+    queries = {
+        "list": ("/webhook/events", {"limit": 50}),
+        "list_summary": ("/webhook/events", {"limit": 50, "summary": "true"}),
+        "list_fields": ("/webhook/events", {"limit": 200, "fields": "id,action,entity_id,created_at"}),
+        "list_filtered": ("/webhook/events", {"limit": 50, "entity_type": "Issue", "action": "update"}),
+        "list_cursor_page": ("/webhook/events", {"limit": 50, "cursor": next_cursor} if next_cursor else {"limit": 50}),
+        "by_id": (f"/webhook/events/{sample['id']}", {}),
+        "by_linear_delivery": (f"/webhook/events/by-linear/{sample['linear_delivery']}", {}),
+    }
+
+    results = {}
+    semaphore = asyncio.Semaphore(concurrency)
+    for name, (path, params) in queries.items():
+        latencies = []
+        errors = 0
+
+        async def fetch():
+            nonlocal errors
+            async with semaphore:
+                started = time.perf_counter()
+                response = await client.get(path, params=params)
+                latencies.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    errors += 1
+
+        started = time.perf_counter()
+        await asyncio.gather(*(fetch() for _ in range(iterations)))
+        results[name] = {**summarize(latencies, time.perf_counter() - started), "errors": errors}
+    return results
+
+
+async def run(args, main) -> dict:
+    generator = LinearEventGenerator(BENCHMARK_SECRET, relevant_ratio=args.relevant_ratio, seed=args.seed)
+    seed_events = [generator.build("issue_label_added") for _ in range(args.seed_events)]
+    events = generator.generate(args.events)
+
+    transport = httpx.ASGITransport(app=main.app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+        if seed_events:
+            print(f"🌱 预先写入 {len(seed_events)} 个事件...")
+            await replay(client, seed_events, args.concurrency)
+
+        print(f"⏱️  回放 {len(events)} 个 webhook 事件，并发 {args.concurrency}...")
+        webhook = await replay(client, events, args.concurrency)
+
+        print(f"⏱️  查询 /webhook/events，每个查询 {args.query_iterations} 次...")
+        queries = await query_events(client, args.query_iterations, args.concurrency)
+
+    return {"webhook": webhook, "events_queries": queries, "prefilter": main.prefilter_stats.stats()}
+
+
+def compare(report: dict, baseline: dict):
+    """打印与基线结果的对比（正数表示变慢/吞吐下降）"""
+    def rows(results):
+        yield "webhook", results["webhook"]["overall"]
+        for kind, stats in results["webhook"]["by_kind"].items():
+            yield f"webhook:{kind}", stats
+        for name, stats in results["events_queries"].items():
+            yield f"events:{name}", stats
+
+    old = dict(rows(baseline["results"]))
+    print(f"\n📊 与基线 {baseline.get('commit')} 对比:")
+    for name, stats in rows(report["results"]):
+        if name not in old:
+            continue
+        before = old[name]
+        deltas = []
+        for key in ("p50_ms", "p99_ms", "requests_per_second"):
+            if before.get(key):
+                deltas.append(f"{key} {before[key]} -> {stats[key]} ({(stats[key] - before[key]) / before[key] * 100:+.1f}%)")
+        print(f"  {name}: " + ", ".join(deltas))
+
+
+def main_cli():
+    parser = argparse.ArgumentParser(description="Webhook 接收与事件查询基准测试")
+    parser.add_argument("--events", type=int, default=2000, help="回放的 webhook 事件数")
+    parser.add_argument("--seed-events", type=int, default=1000, help="计时前预先写入的事件数")
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--relevant-ratio", type=float, default=0.1, help="新增 vibe-coding 标签事件的比例")
+    parser.add_argument("--query-iterations", type=int, default=200)
+    parser.add_argument("--job-delay", type=float, default=0.0, help="桩任务的模拟耗时（秒）")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--log-level", default="WARNING")
+    parser.add_argument("--output", help="结果 JSON 文件路径，默认 benchmarks/results/webhook_ingestion-<commit>.json")
+    parser.add_argument("--baseline", help="用于对比的历史结果 JSON")
+    args = parser.parse_args()
+
+    commit = current_commit()
+    with tempfile.TemporaryDirectory() as tmp:
+        main = load_app(os.path.join(tmp, "benchmark.db"), args.job_delay)
+        logging.getLogger().setLevel(args.log_level.upper())
+
+        # ASGITransport 不触发 startup 事件，只启动任务队列，不探测 aider、不预热工作树
+        main.job_queue.start()
+        try:
+            results = asyncio.run(run(args, main))
+        finally:
+            main.job_queue.stop()
+
+    report = {
+        "benchmark": "webhook_ingestion",
+        "commit": commit,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "parameters": {
+            "events": args.events,
+            "seed_events": args.seed_events,
+            "concurrency": args.concurrency,
+            "relevant_ratio": args.relevant_ratio,
+            "query_iterations": args.query_iterations,
+            "job_delay": args.job_delay,
+            "seed": args.seed,
+        },
+        "results": results,
+    }
+    print(json.dumps(report, indent=2, ensure_ascii=False))
+
+    output = Path(args.output) if args.output else RESULTS_DIR / f"webhook_ingestion-{commit}.json"
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2, ensure_ascii=False))
+    print(f"💾 结果已保存到 {output}")
+
+    if args.baseline:
+        compare(report, json.loads(Path(args.baseline).read_text()))
+
+
+if __name__ == "__main__":
+    main_cli()
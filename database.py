@@ -1,26 +1,163 @@
 from sqlmodel import SQLModel, create_engine, Session
-from typing import Generator
+from sqlmodel.ext.asyncio.session import AsyncSession
+from sqlalchemy import event, inspect, text
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncEngine, async_sessionmaker, create_async_engine
+from typing import AsyncGenerator, Generator
+import logging
 import os
 
+logger = logging.getLogger(__name__)
+
 # 数据库配置
 DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:///./linear_webhook.db")
 
-# 创建数据库引擎
-engine = create_engine(
-    DATABASE_URL,
-    connect_args={"check_same_thread": False} if "sqlite" in DATABASE_URL else {},
-    echo=False,  # 设置为 True 可以看到 SQL 查询日志
-)
+# SQLite 配置
+SQLITE_JOURNAL_MODE = os.getenv("SQLITE_JOURNAL_MODE", "WAL")
+SQLITE_SYNCHRONOUS = os.getenv("SQLITE_SYNCHRONOUS", "NORMAL")
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("SQLITE_BUSY_TIMEOUT_MS", "5000"))
+SQLITE_CACHE_SIZE_KB = int(os.getenv("SQLITE_CACHE_SIZE_KB", "65536"))
+SQLITE_MMAP_SIZE = int(os.getenv("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+
+# 连接池配置（PostgreSQL 等服务端数据库）
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "20"))
+DB_POOL_TIMEOUT = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+DB_POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record):
+    """每个新连接上设置 SQLite PRAGMA：WAL 让读写互不阻塞，busy_timeout 避免立即报 database is locked"""
+    cursor = dbapi_connection.cursor()
+    try:
+        cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+        cursor.execute(f"PRAGMA journal_mode={SQLITE_JOURNAL_MODE}")
+        cursor.execute(f"PRAGMA synchronous={SQLITE_SYNCHRONOUS}")
+        # 负数表示以 KiB 为单位
+        cursor.execute(f"PRAGMA cache_size=-{SQLITE_CACHE_SIZE_KB}")
+        cursor.execute(f"PRAGMA mmap_size={SQLITE_MMAP_SIZE}")
+        cursor.execute("PRAGMA temp_store=MEMORY")
+    finally:
+        cursor.close()
+
+def build_engine(database_url: str = DATABASE_URL, echo: bool = False) -> Engine:
+    """
+    根据数据库类型创建调优过的引擎
+    
+    - SQLite: WAL、synchronous=NORMAL、busy_timeout、mmap 和缓存大小
+    - 其他数据库: 固定大小的连接池，取用前 pre-ping，定期回收连接
+    """
+    url = make_url(database_url)
+    if url.get_backend_name() == "sqlite":
+        new_engine = create_engine(
+            database_url,
+            connect_args={"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000},
+            echo=echo,  # 设置为 True 可以看到 SQL 查询日志
+        )
+        # 内存数据库不支持 WAL，只对文件数据库设置 PRAGMA
+        if url.database and url.database != ":memory:":
+            event.listen(new_engine, "connect", _apply_sqlite_pragmas)
+        return new_engine
+    
+    return create_engine(
+        database_url,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=True,
+        echo=echo,
+    )
+
+# 同步驱动到异步驱动的映射
+ASYNC_DRIVERS = {
+    "sqlite": "aiosqlite",
+    "postgresql": "asyncpg",
+    "mysql": "aiomysql",
+}
+
+def build_async_engine(database_url: str = DATABASE_URL, echo: bool = False) -> AsyncEngine:
+    """
+    创建异步引擎（sqlite+aiosqlite / postgresql+asyncpg），配置与 build_engine 保持一致
+    
+    供 FastAPI 请求处理使用，数据库等待期间不会阻塞事件循环。
+    """
+    url = make_url(database_url)
+    backend = url.get_backend_name()
+    driver = ASYNC_DRIVERS.get(backend)
+    if driver is None:
+        raise ValueError(f"不支持异步访问的数据库: {backend}")
+    url = url.set(drivername=f"{backend}+{driver}")
+    
+    if backend == "sqlite":
+        new_engine = create_async_engine(
+            url,
+            connect_args={"check_same_thread": False, "timeout": SQLITE_BUSY_TIMEOUT_MS / 1000},
+            echo=echo,
+        )
+        if url.database and url.database != ":memory:":
+            event.listen(new_engine.sync_engine, "connect", _apply_sqlite_pragmas)
+        return new_engine
+    
+    return create_async_engine(
+        url,
+        pool_size=DB_POOL_SIZE,
+        max_overflow=DB_MAX_OVERFLOW,
+        pool_timeout=DB_POOL_TIMEOUT,
+        pool_recycle=DB_POOL_RECYCLE,
+        pool_pre_ping=True,
+        echo=echo,
+    )
+
+# 创建数据库引擎（同步引擎供后台线程使用，异步引擎供请求处理使用）
+engine = build_engine(DATABASE_URL)
+async_engine = build_async_engine(DATABASE_URL)
+
+# 提交后不过期对象，避免在异步上下文中触发隐式懒加载
+async_session_factory = async_sessionmaker(async_engine, class_=AsyncSession, expire_on_commit=False)
 
 def create_db_and_tables():
-    """创建数据库和表"""
+    """创建数据库和表，并为已存在的表补建新增的列和索引"""
     SQLModel.metadata.create_all(engine)
+    add_missing_columns()
+    ensure_indexes()
+
+def add_missing_columns():
+    """create_all 不会修改已存在的表，这里为旧表补充模型中新增的可空列"""
+    inspector = inspect(engine)
+    preparer = engine.dialect.identifier_preparer
+    for table in SQLModel.metadata.sorted_tables:
+        if not inspector.has_table(table.name):
+            continue
+        existing = {column["name"] for column in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing:
+                continue
+            if not column.nullable:
+                logger.warning(f"无法自动添加非空列 {table.name}.{column.name}，请手动迁移")
+                continue
+            column_type = column.type.compile(dialect=engine.dialect)
+            with engine.begin() as conn:
+                conn.execute(text(
+                    f"ALTER TABLE {preparer.quote(table.name)} ADD COLUMN {preparer.quote(column.name)} {column_type}"
+                ))
+            logger.info(f"已为表 {table.name} 添加列 {column.name}")
+
+def ensure_indexes():
+    """create_all 不会修改已存在的表，这里单独补建模型中声明的索引"""
+    for table in SQLModel.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(engine, checkfirst=True)
 
 def get_session() -> Generator[Session, None, None]:
     """获取数据库会话的依赖注入函数"""
     with Session(engine) as session:
         yield session
 
+async def get_async_session() -> AsyncGenerator[AsyncSession, None]:
+    """获取异步数据库会话的依赖注入函数"""
+    async with async_session_factory() as session:
+        yield session
+
 def get_db():
     """向后兼容的数据库会话获取函数"""
     return get_session()
@@ -0,0 +1,153 @@
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterator, List, Set, Tuple, Union
+import logging
+import os
+
+from git_backend import run_git
+from repo_index import EXCLUDED_DIRS, RepoIndex, analyze_source, bm25, get_repo_index, tokenize
+
+logger = logging.getLogger(__name__)
+
+# 文件选择配置
+FILE_SELECTION_TOP_K = int(os.getenv("FILE_SELECTION_TOP_K", "8"))
+FILE_SELECTION_TOKEN_BUDGET = int(os.getenv("FILE_SELECTION_TOKEN_BUDGET", "32000"))
+
+# 粗略估算：平均每 4 个字节约 1 个 token
+BYTES_PER_TOKEN = 4
+
+
+def _is_git_repository(project_path: Path) -> bool:
+    return run_git(["rev-parse", "--verify", "--quiet", "HEAD"], cwd=str(project_path), check=False).returncode == 0
+
+
+def discover_python_files(project_path: Path) -> List[str]:
+    """发现项目中的 Python 文件，返回去重后的相对路径（git 仓库直接使用持久化索引）"""
+    project_path = Path(project_path)
+    if _is_git_repository(project_path):
+        index = get_repo_index(str(project_path))
+        with index.snapshot("HEAD", str(project_path)):
+            return index.files()
+
+    files = set()
+    for path in project_path.rglob("*.py"):
+        relative = path.relative_to(project_path)
+        if not EXCLUDED_DIRS.intersection(relative.parts[:-1]):
+            files.add(relative.as_posix())
+    return sorted(files)
+
+
+class FileIndex:
+    """内存中的文件索引：用于不在 git 仓库中的项目"""
+
+    def __init__(self):
+        self.term_counts: Dict[str, Counter] = {}
+        self.lengths: Dict[str, int] = {}
+        self.sizes: Dict[str, int] = {}
+        self.symbols: Dict[str, Set[str]] = {}
+        self.document_frequency: Counter = Counter()
+
+    @classmethod
+    def build(cls, project_path: Path, files: List[str]) -> "FileIndex":
+        """读取文件内容并构建索引"""
+        index = cls()
+        for relative in files:
+            try:
+                source = (Path(project_path) / relative).read_text(encoding="utf-8", errors="ignore")
+            except OSError:
+                continue
+            index.add(relative, source)
+        return index
+
+    def add(self, relative: str, source: str):
+        """将单个文件加入索引"""
+        terms = Counter(tokenize(source))
+        terms.update(tokenize(relative))
+        self.term_counts[relative] = terms
+        self.lengths[relative] = sum(terms.values())
+        self.sizes[relative] = len(source.encode("utf-8"))
+        self.symbols[relative] = {symbol.lower() for symbol in analyze_source(source)[0]}
+        self.document_frequency.update(terms.keys())
+
+    def rank(self, query: str) -> List[Tuple[str, float]]:
+        """按与查询文本的相关度对文件排序（BM25 + 符号/路径命中加权）"""
+        query_terms = set(tokenize(query))
+        if not query_terms or not self.term_counts:
+            return []
+
+        total = len(self.term_counts)
+        average_length = sum(self.lengths.values()) / total
+        scores = []
+        for relative, terms in self.term_counts.items():
+            score = 0.0
+            for term in query_terms:
+                frequency = terms.get(term)
+                if frequency:
+                    score += bm25(frequency, self.document_frequency[term], total, self.lengths[relative], average_length)
+
+            # 查询中直接提到的符号或文件名更可能是需要修改的文件
+            score += 2.0 * len(query_terms & self.symbols[relative])
+            score += 1.0 * len(query_terms & set(tokenize(Path(relative).stem)))
+            if score > 0:
+                scores.append((relative, score))
+
+        scores.sort(key=lambda item: (-item[1], item[0]))
+        return scores
+
+    def file_count(self) -> int:
+        return len(self.term_counts)
+
+    def size_of(self, relative: str) -> int:
+        return self.sizes.get(relative, 0)
+
+
+@contextmanager
+def file_index(project_path: Path) -> Iterator[Union[RepoIndex, FileIndex]]:
+    """
+    项目的文件索引：git 仓库使用同步到 HEAD 的持久化索引，否则临时构建内存索引
+
+    持久化索引由同一对象库的所有工作树共享，退出前其他工作树不能把它同步到别的提交。
+    """
+    project_path = Path(project_path)
+    if _is_git_repository(project_path):
+        index = get_repo_index(str(project_path))
+        with index.snapshot("HEAD", str(project_path)):
+            yield index
+        return
+    yield FileIndex.build(project_path, discover_python_files(project_path))
+
+
+def select_relevant_files(
+    project_path: str,
+    query: str,
+    top_k: int = FILE_SELECTION_TOP_K,
+    token_budget: int = FILE_SELECTION_TOKEN_BUDGET
+) -> List[str]:
+    """
+    选择与需求最相关的文件
+
+    Args:
+        project_path: 项目（工作树）路径
+        query: 需求文本（例如格式化后的 Issue prompt）
+        top_k: 最多选择的文件数
+        token_budget: 所选文件内容的估算 token 上限
+
+    Returns:
+        相对路径列表，按相关度降序
+    """
+    selected = []
+    used_tokens = 0
+    with file_index(Path(project_path)) as index:
+        for relative, score in index.rank(query):
+            if len(selected) >= top_k:
+                break
+            tokens = index.size_of(relative) // BYTES_PER_TOKEN
+            if used_tokens + tokens > token_budget:
+                continue
+            selected.append(relative)
+            used_tokens += tokens
+        file_count = index.file_count()
+
+    logger.info(f"🎯 选出 {len(selected)}/{file_count} 个相关文件，估算 {used_tokens} tokens: {selected}")
+    return selected
@@ -0,0 +1,281 @@
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from typing import Iterator, List, Optional
+import logging
+import os
+import subprocess
+import time
+
+from metrics import GIT_COMMAND_DURATION
+from process_runner import run_command
+
+try:
+    import pygit2
+except ImportError:  # pygit2 为可选依赖，未安装时只能使用 git 子进程
+    pygit2 = None
+
+logger = logging.getLogger(__name__)
+
+# git 操作后端: subprocess（git 命令行）、pygit2（进程内 libgit2）、auto（已安装 pygit2 时使用）
+GIT_BACKEND = os.getenv("GIT_BACKEND", "auto").lower()
+
+# 单条 git 命令的总时长上限（秒），例如 push 卡在网络上时终止
+GIT_COMMAND_TIMEOUT = float(os.getenv("GIT_COMMAND_TIMEOUT", "300"))
+
+# 仓库没有配置 user.name/user.email 时使用的提交者
+GIT_AUTHOR_NAME = "Linear Webhook Handler"
+GIT_AUTHOR_EMAIL = "webhook@linear.app"
+
+if pygit2 is not None:
+    # 需要从索引删除的文件，以及需要写入索引的文件（新增、修改、类型变化、重命名）
+    _STATUS_DELETED = pygit2.GIT_STATUS_WT_DELETED
+    _STATUS_CHANGED = (
+        pygit2.GIT_STATUS_WT_NEW | pygit2.GIT_STATUS_WT_MODIFIED
+        | pygit2.GIT_STATUS_WT_TYPECHANGE | pygit2.GIT_STATUS_WT_RENAMED
+    )
+
+
+def run_git(
+    args: List[str],
+    cwd: str,
+    check: bool = True,
+    input: Optional[bytes] = None,
+    text: bool = True
+) -> subprocess.CompletedProcess:
+    """在指定目录执行 git 命令，并按子命令记录耗时；当前任务被取消时抛出 CommandCancelled"""
+    started = time.perf_counter()
+    try:
+        return run_command(["git", *args], cwd=cwd, check=check, timeout=GIT_COMMAND_TIMEOUT, input=input, text=text)
+    finally:
+        GIT_COMMAND_DURATION.observe(time.perf_counter() - started, command=args[0])
+
+
+class GitBackend(ABC):
+    """
+    任务流水线使用的 git 操作
+
+    推送、工作树增删仍使用 git 命令行（凭据助手、worktree 元数据由 git 自己维护）；
+    这里只包含每个任务都会执行的本地操作。
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def init_repository(self, path: str, branch: str = "main") -> str:
+        """初始化仓库并将现有文件作为初始提交，返回提交 ID"""
+
+    @abstractmethod
+    def resolve(self, path: str, ref: str) -> str:
+        """解析引用指向的提交 ID"""
+
+    @abstractmethod
+    def head(self, path: str) -> Optional[str]:
+        """HEAD 指向的提交 ID，空仓库返回 None"""
+
+    @abstractmethod
+    def checkout_detached(self, path: str, commit: str):
+        """强制将工作树切换到指定提交（分离 HEAD）"""
+
+    @abstractmethod
+    def create_branch(self, path: str, branch: str, force: bool = False):
+        """
+        基于当前 HEAD 创建分支并切换过去
+
+        分支已存在时抛出 CalledProcessError（与 git checkout -b 一致）；
+        force 为 True 时将已有分支重置到当前 HEAD（与 git checkout -B 一致）。
+        """
+
+    @abstractmethod
+    def reset_clean(self, path: str, commit: str):
+        """丢弃所有修改和未跟踪文件（包括被忽略的文件），并以分离 HEAD 切换到指定提交"""
+
+    @abstractmethod
+    def status(self, path: str) -> List[str]:
+        """有修改（含未跟踪）的文件列表"""
+
+    @abstractmethod
+    def commit_all(self, path: str, message: str) -> Optional[str]:
+        """暂存所有修改（等同 git add -A）并提交，没有修改时返回 None"""
+
+
+class SubprocessGitBackend(GitBackend):
+    """每个操作对应一个或多个 git 子进程"""
+
+    name = "subprocess"
+
+    def init_repository(self, path: str, branch: str = "main") -> str:
+        run_git(["init", "-b", branch], cwd=path)
+        run_git(["config", "user.name", GIT_AUTHOR_NAME], cwd=path)
+        run_git(["config", "user.email", GIT_AUTHOR_EMAIL], cwd=path)
+        run_git(["add", "."], cwd=path)
+        run_git(["commit", "-m", "Initial commit"], cwd=path)
+        return self.resolve(path, "HEAD")
+
+    def resolve(self, path: str, ref: str) -> str:
+        return run_git(["rev-parse", "--verify", f"{ref}^{{commit}}"], cwd=path).stdout.strip()
+
+    def head(self, path: str) -> Optional[str]:
+        result = run_git(["rev-parse", "--verify", "--quiet", "HEAD"], cwd=path, check=False)
+        return result.stdout.strip() or None
+
+    def checkout_detached(self, path: str, commit: str):
+        run_git(["checkout", "--detach", "--force", commit], cwd=path)
+
+    def create_branch(self, path: str, branch: str, force: bool = False):
+        run_git(["checkout", "-B" if force else "-b", branch], cwd=path)
+
+    def reset_clean(self, path: str, commit: str):
+        run_git(["reset", "--hard"], cwd=path)
+        run_git(["clean", "-fdx"], cwd=path)
+        run_git(["checkout", "--detach", "--force", commit], cwd=path)
+
+    def status(self, path: str) -> List[str]:
+        result = run_git(["status", "--porcelain"], cwd=path)
+        return [line[3:] for line in result.stdout.splitlines() if line]
+
+    def commit_all(self, path: str, message: str) -> Optional[str]:
+        if not self.status(path):
+            return None
+        run_git(["add", "-A"], cwd=path)
+        run_git(["commit", "-m", message], cwd=path)
+        return self.resolve(path, "HEAD")
+
+
+class Pygit2GitBackend(GitBackend):
+    """通过 libgit2 在进程内操作仓库：状态、暂存和提交各只扫描一次索引，不再 fork/exec"""
+
+    name = "pygit2"
+
+    def __init__(self):
+        if pygit2 is None:
+            raise RuntimeError("GIT_BACKEND=pygit2 需要安装 pygit2")
+        # libgit2 不能从 promisor 远程按需下载缺失的文件内容，部分克隆的仓库切换提交时交给 git 命令行
+        self._fallback = SubprocessGitBackend()
+
+    def _is_partial_clone(self, repo) -> bool:
+        """git 2.x 新版本只写 remote.<name>.promisor，旧版本写 extensions.partialclone"""
+        config = repo.config
+        if "extensions.partialclone" in config:
+            return True
+        return any(
+            entry.name.startswith("remote.") and entry.name.endswith(".promisor") and entry.value.lower() == "true"
+            for entry in config
+        )
+
+    @contextmanager
+    def _operation(self, command: str, path: str) -> Iterator[None]:
+        """记录耗时；libgit2 错误转换为 CalledProcessError，调用方与子进程后端的错误处理保持一致"""
+        started = time.perf_counter()
+        try:
+            yield
+        except (pygit2.GitError, KeyError, ValueError) as e:
+            raise subprocess.CalledProcessError(1, ["pygit2", command, path], stderr=str(e)) from e
+        finally:
+            GIT_COMMAND_DURATION.observe(time.perf_counter() - started, command=f"pygit2:{command}")
+
+    def _signature(self, repo) -> "pygit2.Signature":
+        try:
+            return repo.default_signature
+        except (KeyError, pygit2.GitError):
+            return pygit2.Signature(GIT_AUTHOR_NAME, GIT_AUTHOR_EMAIL)
+
+    def _stage_and_commit(self, repo, message: str, status: dict) -> str:
+        """按一次 status 扫描的结果更新索引，写入树对象并提交"""
+        index = repo.index
+        for file_path, flags in status.items():
+            if flags & _STATUS_DELETED:
+                index.remove(file_path)
+            elif flags & _STATUS_CHANGED:
+                index.add(file_path)
+        index.write()
+        tree = index.write_tree()
+
+        parents = [] if repo.head_is_unborn else [repo.head.target]
+        signature = self._signature(repo)
+        return str(repo.create_commit("HEAD", signature, signature, message, tree, parents))
+
+    def init_repository(self, path: str, branch: str = "main") -> str:
+        with self._operation("init", path):
+            repo = pygit2.init_repository(path, initial_head=branch)
+            repo.config["user.name"] = GIT_AUTHOR_NAME
+            repo.config["user.email"] = GIT_AUTHOR_EMAIL
+            return self._stage_and_commit(repo, "Initial commit", self._changes(repo))
+
+    def resolve(self, path: str, ref: str) -> str:
+        with self._operation("resolve", path):
+            return str(pygit2.Repository(path).revparse_single(f"{ref}^{{commit}}").id)
+
+    def head(self, path: str) -> Optional[str]:
+        with self._operation("head", path):
+            repo = pygit2.Repository(path)
+            return None if repo.head_is_unborn else str(repo.head.target)
+
+    def checkout_detached(self, path: str, commit: str):
+        with self._operation("checkout", path):
+            repo = pygit2.Repository(path)
+            if self._is_partial_clone(repo):
+                return self._fallback.checkout_detached(path, commit)
+            target = repo.revparse_single(commit)
+            repo.checkout_tree(target, strategy=pygit2.GIT_CHECKOUT_FORCE)
+            repo.set_head(target.id)
+
+    def create_branch(self, path: str, branch: str, force: bool = False):
+        with self._operation("branch", path):
+            repo = pygit2.Repository(path)
+            if not force and repo.branches.local.get(branch) is not None:
+                raise ValueError(f"fatal: a branch named '{branch}' already exists")
+            target = repo.head.target
+            if not repo.head_is_detached and repo.head.name == f"refs/heads/{branch}":
+                # libgit2 拒绝强制更新当前检出的分支，先分离 HEAD（git checkout -B 允许这种情况）
+                repo.set_head(target)
+            reference = repo.branches.local.create(branch, repo[target], force=force)
+            # 工作区内容不变，只需移动 HEAD
+            repo.set_head(reference.name)
+
+    def reset_clean(self, path: str, commit: str):
+        with self._operation("reset_clean", path):
+            repo = pygit2.Repository(path)
+            if self._is_partial_clone(repo):
+                return self._fallback.reset_clean(path, commit)
+            target = repo.revparse_single(commit)
+            # 一次 checkout 完成 reset --hard、clean -fdx 和切换提交
+            repo.checkout_tree(
+                target,
+                strategy=pygit2.GIT_CHECKOUT_FORCE | pygit2.GIT_CHECKOUT_REMOVE_UNTRACKED | pygit2.GIT_CHECKOUT_REMOVE_IGNORED
+            )
+            repo.set_head(target.id)
+
+    def _changes(self, repo) -> dict:
+        """一次扫描工作区与索引，返回有变化的文件及其状态（不含被忽略的文件）"""
+        return {
+            file_path: flags
+            for file_path, flags in repo.status(untracked_files="all", ignored=False).items()
+            if flags & ~pygit2.GIT_STATUS_IGNORED
+        }
+
+    def status(self, path: str) -> List[str]:
+        with self._operation("status", path):
+            return sorted(self._changes(pygit2.Repository(path)))
+
+    def commit_all(self, path: str, message: str) -> Optional[str]:
+        with self._operation("commit", path):
+            repo = pygit2.Repository(path)
+            status = self._changes(repo)
+            if not status:
+                return None
+            return self._stage_and_commit(repo, message, status)
+
+
+def create_git_backend(name: str = GIT_BACKEND) -> GitBackend:
+    """按名称创建 git 后端；auto 在安装了 pygit2 时使用进程内实现"""
+    if name == "auto":
+        name = "pygit2" if pygit2 is not None else "subprocess"
+    if name == "pygit2":
+        return Pygit2GitBackend()
+    if name == "subprocess":
+        return SubprocessGitBackend()
+    raise ValueError(f"不支持的 GIT_BACKEND: {name}，可选 subprocess、pygit2、auto")
+
+
+git_backend = create_git_backend()
+logger.info(f"🔧 git 后端: {git_backend.name}")
@@ -0,0 +1,71 @@
+from collections import OrderedDict
+from sqlmodel import Session
+from sqlalchemy.exc import IntegrityError
+from typing import Optional
+import hashlib
+import logging
+import os
+import threading
+
+from models import IdempotencyKey
+
+logger = logging.getLogger(__name__)
+
+# 进程内最近投递的缓存大小
+IDEMPOTENCY_CACHE_SIZE = int(os.getenv("IDEMPOTENCY_CACHE_SIZE", "10000"))
+
+
+def idempotency_key(linear_delivery: Optional[str], body: bytes) -> str:
+    """优先使用 Linear-Delivery 作为幂等键，缺失时使用请求体的 SHA-256"""
+    if linear_delivery:
+        return linear_delivery
+    return "sha256:" + hashlib.sha256(body).hexdigest()
+
+
+class IdempotencyGuard:
+    """幂等检查 - 进程内 LRU 在前，数据库主键唯一约束兜底"""
+
+    def __init__(self, cache_size: int = IDEMPOTENCY_CACHE_SIZE):
+        self.cache_size = cache_size
+        self._recent: "OrderedDict[str, None]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def seen(self, key: str) -> bool:
+        """检查进程内缓存，不访问数据库"""
+        with self._lock:
+            if key in self._recent:
+                self._recent.move_to_end(key)
+                return True
+            return False
+
+    def remember(self, key: str):
+        """记录已处理的幂等键"""
+        with self._lock:
+            self._recent[key] = None
+            self._recent.move_to_end(key)
+            while len(self._recent) > self.cache_size:
+                self._recent.popitem(last=False)
+
+    def claim(self, session: Session, key: str) -> Optional[IdempotencyKey]:
+        """
+        在当前事务中插入幂等键，由主键唯一约束判断是否重复（单次数据库往返）
+
+        Returns:
+            插入成功返回幂等键记录（随事务提交），重复时返回 None
+        """
+        if self.seen(key):
+            return None
+
+        record = IdempotencyKey(key=key)
+        session.add(record)
+        try:
+            session.flush()
+        except IntegrityError:
+            session.rollback()
+            self.remember(key)
+            return None
+        return record
+
+
+# 进程级共享的幂等检查
+idempotency_guard = IdempotencyGuard()
@@ -1,5 +1,6 @@
-from database import create_tables
+from database import create_db_and_tables
 
 if __name__ == "__main__":
-    create_tables()
-    print("数据库表创建完成！")
+    # 新数据库创建全部表；已有数据库补建新增的表和索引
+    create_db_and_tables()
+    print("数据库表和索引创建完成！")
@@ -0,0 +1,174 @@
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# 任务日志配置
+JOB_LOG_DIR = os.getenv("JOB_LOG_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".job_logs"))
+JOB_LOG_TAIL_LINES = int(os.getenv("JOB_LOG_TAIL_LINES", "200"))
+JOB_LOG_MAX_BYTES = int(os.getenv("JOB_LOG_MAX_BYTES", str(20 * 1024 * 1024)))
+
+# 返回结果中保留的输出行数
+JOB_LOG_SUMMARY_LINES = int(os.getenv("JOB_LOG_SUMMARY_LINES", "20"))
+
+# 日志文件保留：超过天数或超过文件数（从最旧的开始）的日志在任务结束时删除，0 表示不限制
+JOB_LOG_RETENTION_DAYS = float(os.getenv("JOB_LOG_RETENTION_DAYS", "14"))
+JOB_LOG_MAX_FILES = int(os.getenv("JOB_LOG_MAX_FILES", "1000"))
+
+# 当前线程正在写入的任务日志
+_current_log: ContextVar[Optional["JobLog"]] = ContextVar("job_log", default=None)
+
+_active_logs: Dict[int, "JobLog"] = {}
+_active_lock = threading.Lock()
+
+
+def job_log_path(job_id: int) -> Path:
+    return Path(JOB_LOG_DIR) / f"job-{job_id}.log"
+
+
+class JobLog:
+    """任务输出日志 - 逐行写入文件，内存中只保留最近若干行"""
+
+    def __init__(self, path: Optional[Path] = None, tail_lines: int = JOB_LOG_TAIL_LINES, max_bytes: int = JOB_LOG_MAX_BYTES):
+        """
+        Args:
+            path: 日志文件路径，为空时只保留内存中的最近输出
+            tail_lines: 内存环形缓冲区的行数
+            max_bytes: 日志文件大小上限，超过后只更新内存缓冲区
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.lines = 0
+        self.bytes = 0
+        self.truncated = False
+        self._tail: deque = deque(maxlen=max(1, tail_lines))
+        self._lock = threading.Lock()
+        self._file = None
+        if path is not None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            self._file = open(path, "a", encoding="utf-8", buffering=1)
+
+    def write(self, line: str):
+        """追加一行输出"""
+        line = line.rstrip("\n")
+        size = len(line.encode("utf-8")) + 1
+        with self._lock:
+            self.lines += 1
+            self.bytes += size
+            self._tail.append(line)
+            if self._file is None:
+                return
+            if self.bytes <= self.max_bytes:
+                self._file.write(line + "\n")
+            elif not self.truncated:
+                self.truncated = True
+                self._file.write(f"... 日志超过 {self.max_bytes} 字节，后续输出只保留在内存缓冲区中\n")
+
+    def write_text(self, text: str):
+        """按行追加一段文本"""
+        for line in text.splitlines():
+            self.write(line)
+
+    def tail(self, count: Optional[int] = None) -> List[str]:
+        """返回最近 count 行"""
+        with self._lock:
+            lines = list(self._tail)
+        return lines if count is None else lines[-count:]
+
+    def summary(self, count: int = JOB_LOG_SUMMARY_LINES) -> Dict[str, Any]:
+        """输出摘要：总行数、字节数、日志文件路径和最后几行"""
+        return {
+            "output_lines": self.lines,
+            "output_bytes": self.bytes,
+            "log_path": str(self.path) if self.path else None,
+            "truncated": self.truncated,
+            "tail": "\n".join(self.tail(count)),
+        }
+
+    def close(self):
+        with self._lock:
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+
+def current_job_log() -> Optional[JobLog]:
+    return _current_log.get()
+
+
+def get_active_log(job_id: int) -> Optional[JobLog]:
+    """返回正在执行的任务日志"""
+    with _active_lock:
+        return _active_logs.get(job_id)
+
+
+@contextmanager
+def open_job_log(job_id: int) -> Iterator[JobLog]:
+    """为任务创建日志文件并设为当前日志，任务结束后关闭"""
+    job_log = JobLog(job_log_path(job_id))
+    token = _current_log.set(job_log)
+    with _active_lock:
+        _active_logs[job_id] = job_log
+    try:
+        yield job_log
+    finally:
+        with _active_lock:
+            _active_logs.pop(job_id, None)
+        _current_log.reset(token)
+        job_log.close()
+        try:
+            prune_job_logs(JOB_LOG_RETENTION_DAYS, JOB_LOG_MAX_FILES)
+        except OSError as e:
+            logger.warning(f"⚠️  清理任务日志失败: {e}")
+
+
+def prune_job_logs(max_age_days: float = JOB_LOG_RETENTION_DAYS, max_files: int = JOB_LOG_MAX_FILES) -> int:
+    """删除超过保留天数的日志，以及超过文件数上限的最旧日志（执行中的任务除外），返回删除的文件数"""
+    if max_age_days <= 0 and max_files <= 0:
+        return 0
+    directory = Path(JOB_LOG_DIR)
+    if not directory.is_dir():
+        return 0
+
+    with _active_lock:
+        active = {job_log_path(job_id) for job_id in _active_logs}
+    logs = []
+    for path in directory.glob("job-*.log"):
+        if path in active:
+            continue
+        try:
+            logs.append((path.stat().st_mtime, path))
+        except FileNotFoundError:
+            continue
+    logs.sort(reverse=True)
+
+    expired = []
+    cutoff = time.time() - max_age_days * 86400
+    for index, (mtime, path) in enumerate(logs):
+        if (max_age_days > 0 and mtime < cutoff) or (max_files > 0 and index >= max_files):
+            expired.append(path)
+    for path in expired:
+        path.unlink(missing_ok=True)
+    if expired:
+        logger.info(f"🧹 已删除 {len(expired)} 个过期的任务日志")
+    return len(expired)
+
+
+def read_log_tail(job_id: int, count: int = JOB_LOG_TAIL_LINES) -> Optional[List[str]]:
+    """读取任务日志的最后 count 行：执行中的任务直接取内存缓冲区，否则读取日志文件"""
+    active = get_active_log(job_id)
+    if active is not None:
+        return active.tail(count)
+
+    path = job_log_path(job_id)
+    if not path.exists():
+        return None
+    with open(path, encoding="utf-8", errors="replace") as f:
+        return [line.rstrip("\n") for line in deque(f, maxlen=count)]
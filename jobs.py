@@ -0,0 +1,444 @@
+from sqlmodel import Session, select
+from sqlalchemy import and_, func, or_, update
+from typing import Any, Callable, Dict, List, Optional, Sequence
+from datetime import datetime, timedelta
+import logging
+import os
+import random
+import socket
+import threading
+import time
+import uuid
+
+from database import engine
+from job_logs import open_job_log
+from metrics import JOB_DURATION, JOB_QUEUE_WAIT, JOBS_IN_FLIGHT, JOBS_TOTAL
+from models import Job
+from process_runner import cancellation_scope
+from tracing import Trace
+
+logger = logging.getLogger(__name__)
+
+# 任务状态
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+JOB_CANCELLED = "cancelled"
+JOB_SUPERSEDED = "superseded"
+
+# 队列配置
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "2"))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "2.0"))
+JOB_MAX_ATTEMPTS = int(os.getenv("JOB_MAX_ATTEMPTS", "2"))
+
+# 同一合并键的任务在安静期内不执行，期间的新事件会取代排队中的旧任务；总等待时间不超过上限
+JOB_DEBOUNCE_SECONDS = float(os.getenv("JOB_DEBOUNCE_SECONDS", "10"))
+JOB_DEBOUNCE_MAX_SECONDS = float(os.getenv("JOB_DEBOUNCE_MAX_SECONDS", "60"))
+
+# 执行中的任务每 JOB_HEARTBEAT_INTERVAL 秒更新心跳；超过 JOB_HEARTBEAT_TIMEOUT 秒没有心跳的任务视为所属进程已退出，重新入队
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", "15"))
+JOB_HEARTBEAT_TIMEOUT = float(os.getenv("JOB_HEARTBEAT_TIMEOUT", "90"))
+
+# 本进程的标识，记录在领取的任务上
+WORKER_ID = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+
+JobHandler = Callable[[int, Dict[str, Any]], Dict[str, Any]]
+
+
+class JobQueue:
+    """基于数据库的持久化任务队列 - 由固定数量的后台线程消费"""
+
+    def __init__(
+        self,
+        handler: JobHandler,
+        workers: int = JOB_WORKERS,
+        poll_interval: float = JOB_POLL_INTERVAL,
+        max_attempts: int = JOB_MAX_ATTEMPTS,
+        kinds: Optional[Sequence[str]] = None,
+        retry_backoff: float = 0.0,
+        retry_backoff_max: float = 0.0,
+        name: str = "job"
+    ):
+        """
+        初始化任务队列
+
+        Args:
+            handler: 任务处理函数，接收 (job_id, payload)，返回结果字典（包含 success 字段）
+            workers: 后台 worker 线程数量
+            poll_interval: 空闲时轮询数据库的间隔（秒）
+            max_attempts: 任务最多被执行的次数（进程崩溃后重新执行、失败重试都计入）
+            kinds: 只处理这些类型的任务，为空时处理所有类型；多个队列可以共用 jobs 表
+            retry_backoff: 大于 0 时，结果中 retryable 为真的失败任务在 retry_backoff * 2^(n-1) 秒后重试
+            retry_backoff_max: 重试等待时间上限（秒）
+            name: worker 线程名前缀
+        """
+        self.handler = handler
+        self.workers = max(1, workers)
+        self.poll_interval = poll_interval
+        self.max_attempts = max(1, max_attempts)
+        self.kinds = tuple(kinds) if kinds else None
+        self.retry_backoff = retry_backoff
+        self.retry_backoff_max = retry_backoff_max or retry_backoff
+        self.name = name
+
+        self.worker_id = WORKER_ID
+
+        self._threads: List[threading.Thread] = []
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+
+        # 本进程中正在执行的任务的取消信号
+        self._cancel_events: Dict[int, threading.Event] = {}
+        self._cancel_lock = threading.Lock()
+
+    def start(self):
+        """恢复中断的任务并启动 worker 线程和心跳线程"""
+        if self._threads:
+            return
+
+        self._recover_interrupted_jobs()
+        self._stop.clear()
+
+        heartbeat = threading.Thread(target=self._heartbeat_loop, name=f"{self.name}-heartbeat", daemon=True)
+        heartbeat.start()
+        self._threads.append(heartbeat)
+
+        for index in range(self.workers):
+            thread = threading.Thread(
+                target=self._worker_loop,
+                name=f"{self.name}-worker-{index}",
+                daemon=True
+            )
+            thread.start()
+            self._threads.append(thread)
+
+        logger.info(f"🧵 任务队列 {self.name} 已启动，worker 数量: {self.workers}")
+
+    def stop(self, timeout: float = 5.0):
+        """通知 worker 线程退出，正在执行的任务在心跳超时后被恢复"""
+        self._stop.set()
+        self._wakeup.set()
+        for thread in self._threads:
+            thread.join(timeout=timeout)
+        self._threads = []
+        logger.info(f"🛑 任务队列 {self.name} 已停止")
+
+    def enqueue(
+        self,
+        session: Session,
+        event_id: Optional[int],
+        payload: Dict[str, Any],
+        kind: str = "vibe_coding",
+        coalesce_key: Optional[str] = None,
+        debounce: Optional[float] = None
+    ) -> Job:
+        """
+        在给定会话中创建任务并唤醒 worker
+
+        指定 coalesce_key 时任务会等待安静期（debounce 秒，默认 JOB_DEBOUNCE_SECONDS），同一键下尚未开始执行的旧任务
+        被标记为 superseded，其事件 ID 合并到新任务的 payload["event_ids"] 中。
+        """
+        now = datetime.utcnow()
+        job = Job(event_id=event_id, kind=kind, status=JOB_QUEUED, payload=payload, coalesce_key=coalesce_key)
+        debounce = JOB_DEBOUNCE_SECONDS if debounce is None else debounce
+        if coalesce_key and debounce > 0:
+            job.run_after = now + timedelta(seconds=debounce)
+        session.add(job)
+        session.flush()
+
+        if coalesce_key:
+            self._supersede_queued(session, job, now)
+
+        session.commit()
+        session.refresh(job)
+
+        logger.info(f"📥 任务 {job.id} 已入队 (事件 {event_id})")
+        self._wakeup.set()
+        return job
+
+    def _supersede_queued(self, session: Session, job: Job, now: datetime):
+        """用新任务取代同一合并键下排队中的旧任务，并合并事件 ID 与防抖起点"""
+        queued = session.exec(
+            select(Job)
+            .where(Job.coalesce_key == job.coalesce_key)
+            .where(Job.status == JOB_QUEUED)
+            .where(Job.id != job.id)
+        ).all()
+
+        event_ids = []
+        first_queued_at = now
+        for old in queued:
+            # 条件更新：旧任务可能刚被 worker 领取
+            superseded = session.execute(
+                update(Job)
+                .where(Job.id == old.id)
+                .where(Job.status == JOB_QUEUED)
+                .values(status=JOB_SUPERSEDED, superseded_by=job.id, error=f"被任务 {job.id} 取代", finished_at=now)
+            )
+            if superseded.rowcount != 1:
+                continue
+            old_payload = old.payload or {}
+            event_ids.extend(old_payload.get("event_ids") or [old.event_id])
+            if old_payload.get("first_queued_at"):
+                first_queued_at = min(first_queued_at, datetime.fromisoformat(old_payload["first_queued_at"]))
+            else:
+                first_queued_at = min(first_queued_at, old.created_at)
+            logger.info(f"🔀 任务 {old.id} 被任务 {job.id} 取代 ({job.coalesce_key})")
+
+        if not event_ids:
+            return
+
+        job.payload = {
+            **(job.payload or {}),
+            "event_ids": sorted({event_id for event_id in event_ids + [job.event_id] if event_id is not None}),
+            "first_queued_at": first_queued_at.isoformat()
+        }
+        # 事件持续到达时也不会无限推迟
+        if job.run_after is not None:
+            job.run_after = min(job.run_after, first_queued_at + timedelta(seconds=JOB_DEBOUNCE_MAX_SECONDS))
+        session.add(job)
+
+    def cancel(self, session: Session, job_id: int) -> Optional[Job]:
+        """
+        取消任务：排队中的任务直接标记为已取消，执行中的任务终止其子进程组
+
+        Returns:
+            任务的最新状态；任务不存在时返回 None
+        """
+        cancelled = session.execute(
+            update(Job)
+            .where(Job.id == job_id)
+            .where(Job.status == JOB_QUEUED)
+            .values(status=JOB_CANCELLED, error="任务已取消", finished_at=datetime.utcnow())
+        )
+        session.commit()
+        if cancelled.rowcount == 1:
+            logger.info(f"⏹️  排队中的任务 {job_id} 已取消")
+        else:
+            with self._cancel_lock:
+                event = self._cancel_events.get(job_id)
+            if event is not None:
+                event.set()
+                logger.info(f"⏹️  正在终止任务 {job_id} 的子进程")
+
+        job = session.get(Job, job_id)
+        if job is not None:
+            session.refresh(job)
+        return job
+
+    def is_cancelling(self, job_id: int) -> bool:
+        """任务是否已收到取消请求但尚未结束"""
+        with self._cancel_lock:
+            event = self._cancel_events.get(job_id)
+        return event is not None and event.is_set()
+
+    def _filter_kinds(self, statement):
+        return statement.where(Job.kind.in_(self.kinds)) if self.kinds else statement
+
+    def queue_depth(self) -> int:
+        """返回排队中的任务数量"""
+        with Session(engine) as session:
+            return session.exec(self._filter_kinds(select(func.count()).select_from(Job).where(Job.status == JOB_QUEUED))).one()
+
+    def _recover_interrupted_jobs(self) -> int:
+        """
+        将心跳超时的 running 任务重新入队或标记失败，返回处理的任务数
+
+        其他进程（多实例部署、重载时尚未退出的旧进程）正在执行的任务仍在更新心跳，不会被恢复；
+        没有心跳记录的旧任务按开始执行时间判断。
+        """
+        cutoff = datetime.utcnow() - timedelta(seconds=JOB_HEARTBEAT_TIMEOUT)
+        stale = or_(Job.heartbeat_at < cutoff, and_(Job.heartbeat_at.is_(None), Job.started_at < cutoff))
+        recovered = 0
+        with Session(engine) as session:
+            interrupted = session.exec(self._filter_kinds(select(Job).where(Job.status == JOB_RUNNING).where(stale))).all()
+            for job in interrupted:
+                job_id, owner = job.id, job.worker_id
+                if job.attempts < self.max_attempts:
+                    values = {"status": JOB_QUEUED, "worker_id": None, "heartbeat_at": None}
+                else:
+                    values = {"status": JOB_FAILED, "error": "任务执行中断且已达到最大重试次数", "finished_at": datetime.utcnow()}
+                # 条件更新：检查和更新之间任务可能恢复了心跳或已被其他进程恢复
+                updated = session.execute(
+                    update(Job).where(Job.id == job_id).where(Job.status == JOB_RUNNING).where(stale).values(**values)
+                )
+                if updated.rowcount != 1:
+                    continue
+                recovered += 1
+                if values["status"] == JOB_QUEUED:
+                    logger.warning(f"♻️  任务 {job_id} 执行中断（{owner or '未知进程'} 心跳超时），重新入队")
+                else:
+                    logger.error(f"❌ 任务 {job_id} 执行中断且已达到最大重试次数")
+            session.commit()
+        if recovered:
+            self._wakeup.set()
+        return recovered
+
+    def _heartbeat_loop(self):
+        """为本进程正在执行的任务更新心跳，并定期恢复其他进程遗留的任务"""
+        while not self._stop.wait(JOB_HEARTBEAT_INTERVAL):
+            try:
+                with self._cancel_lock:
+                    job_ids = list(self._cancel_events)
+                if job_ids:
+                    with Session(engine) as session:
+                        session.execute(
+                            update(Job)
+                            .where(Job.id.in_(job_ids))
+                            .where(Job.status == JOB_RUNNING)
+                            .where(Job.worker_id == self.worker_id)
+                            .values(heartbeat_at=datetime.utcnow())
+                        )
+                        session.commit()
+                self._recover_interrupted_jobs()
+            except Exception as e:
+                logger.error(f"更新任务心跳失败: {str(e)}")
+
+    def _claim_next(self) -> Optional[Job]:
+        """
+        原子地领取最早的可执行任务，多个 worker/进程之间不会重复领取
+
+        跳过仍在防抖等待中的任务，以及同一合并键已有任务在执行的任务（等其结束后再基于最新状态执行）。
+        领取时记录本进程标识和心跳。
+        """
+        with Session(engine) as session:
+            while True:
+                running_keys = select(Job.coalesce_key).where(Job.status == JOB_RUNNING).where(Job.coalesce_key.is_not(None))
+                job_id = session.exec(
+                    self._filter_kinds(select(Job.id))
+                    .where(Job.status == JOB_QUEUED)
+                    .where(or_(Job.run_after.is_(None), Job.run_after <= datetime.utcnow()))
+                    .where(or_(Job.coalesce_key.is_(None), Job.coalesce_key.not_in(running_keys)))
+                    .order_by(Job.id)
+                    .limit(1)
+                ).first()
+                if job_id is None:
+                    return None
+
+                now = datetime.utcnow()
+                claimed = session.execute(
+                    update(Job)
+                    .where(Job.id == job_id)
+                    .where(Job.status == JOB_QUEUED)
+                    .values(
+                        status=JOB_RUNNING, started_at=now, attempts=Job.attempts + 1,
+                        worker_id=self.worker_id, heartbeat_at=now
+                    )
+                )
+                session.commit()
+
+                # 其他 worker 抢先领取时继续尝试下一个任务
+                if claimed.rowcount == 1:
+                    return session.get(Job, job_id)
+
+    def _owns(self, job: Job) -> bool:
+        """任务仍由本进程持有；心跳中断期间被其他进程恢复的任务不再写回结果"""
+        if job.status == JOB_RUNNING and job.worker_id == self.worker_id:
+            return True
+        logger.warning(f"⚠️  任务 {job.id} 已被 {job.worker_id or '其他进程'} 接管（状态 {job.status}），丢弃本次结果")
+        return False
+
+    def _finish(self, job_id: int, result: Dict[str, Any], error: Optional[str] = None, trace: Optional[Trace] = None, cancelled: bool = False):
+        """保存任务执行结果，以及本次执行各阶段的耗时"""
+        with Session(engine) as session:
+            job = session.get(Job, job_id)
+            if job is None or not self._owns(job):
+                return
+            if trace is not None and job.event_id is not None:
+                session.add_all(trace.to_rows(job.event_id))
+            job.result = result
+            if cancelled:
+                job.status = JOB_CANCELLED
+                job.error = "任务已取消"
+            else:
+                job.status = JOB_SUCCEEDED if result.get("success") else JOB_FAILED
+                job.error = error or (None if result.get("success") else result.get("error"))
+            job.finished_at = datetime.utcnow()
+            session.add(job)
+            session.commit()
+
+    def _retry_delay(self, job: Job, result: Dict[str, Any]) -> Optional[float]:
+        """可重试的失败返回下次执行前的等待时间（指数退避，带抖动），不再重试时返回 None"""
+        if self.retry_backoff <= 0 or not result.get("retryable") or job.attempts >= self.max_attempts:
+            return None
+        delay = min(self.retry_backoff_max, self.retry_backoff * 2 ** (job.attempts - 1))
+        # 抖动避免同时失败的任务（例如触发限流）在同一时刻重试
+        delay *= random.uniform(0.8, 1.2)
+        return max(delay, float(result.get("retry_after") or 0))
+
+    def _retry(self, job_id: int, result: Dict[str, Any], delay: float, trace: Optional[Trace] = None):
+        """保存本次失败的结果，并将任务重新入队等待退避时间"""
+        with Session(engine) as session:
+            job = session.get(Job, job_id)
+            if job is None or not self._owns(job):
+                return
+            if trace is not None and job.event_id is not None:
+                session.add_all(trace.to_rows(job.event_id))
+            job.result = result
+            job.error = result.get("error")
+            job.status = JOB_QUEUED
+            job.run_after = datetime.utcnow() + timedelta(seconds=delay)
+            job.worker_id = None
+            job.heartbeat_at = None
+            session.add(job)
+            session.commit()
+
+    def _worker_loop(self):
+        """worker 主循环：领取任务、执行、保存结果"""
+        while not self._stop.is_set():
+            try:
+                job = self._claim_next()
+            except Exception as e:
+                logger.error(f"领取任务失败: {str(e)}", exc_info=True)
+                job = None
+
+            if job is None:
+                self._wakeup.wait(self.poll_interval)
+                self._wakeup.clear()
+                continue
+
+            logger.info(f"🚀 开始执行任务 {job.id} (第 {job.attempts} 次)")
+            trace = Trace(job_id=job.id)
+            # 防抖等待单独记录，queue_wait 只统计可执行之后的排队时间
+            ready_at = max(job.created_at, min(job.run_after or job.created_at, job.started_at))
+            # 重试任务的 run_after 是退避结束时间，之前的执行和等待已记录在上一次执行的追踪中
+            if ready_at > job.created_at and job.coalesce_key:
+                trace.add("debounce", job.created_at, ready_at, coalesce_key=job.coalesce_key)
+            trace.add("queue_wait", ready_at, job.started_at, attempt=job.attempts)
+            JOB_QUEUE_WAIT.observe((job.started_at - ready_at).total_seconds())
+            JOBS_IN_FLIGHT.inc()
+            started = time.perf_counter()
+            status = JOB_FAILED
+            cancel_event = threading.Event()
+            with self._cancel_lock:
+                self._cancel_events[job.id] = cancel_event
+            try:
+                with open_job_log(job.id), cancellation_scope(cancel_event), trace.activate(), \
+                        trace.span("job", kind=job.kind, attempt=job.attempts):
+                    result = self.handler(job.id, job.payload or {})
+                retry_delay = None if cancel_event.is_set() or result.get("success") else self._retry_delay(job, result)
+                if cancel_event.is_set():
+                    status = JOB_CANCELLED
+                    logger.info(f"⏹️  任务 {job.id} 已取消")
+                elif retry_delay is not None:
+                    status = "retry"
+                    logger.warning(f"🔁 任务 {job.id} 第 {job.attempts} 次执行失败，{retry_delay:.1f} 秒后重试: {result.get('error')}")
+                else:
+                    status = JOB_SUCCEEDED if result.get("success") else JOB_FAILED
+                    logger.info(f"✅ 任务 {job.id} 执行完成: {'成功' if result.get('success') else '失败'}")
+                if retry_delay is not None:
+                    self._retry(job.id, result, retry_delay, trace=trace)
+                else:
+                    self._finish(job.id, result, trace=trace, cancelled=cancel_event.is_set())
+            except Exception as e:
+                logger.error(f"任务 {job.id} 执行出错: {str(e)}", exc_info=True)
+                if cancel_event.is_set():
+                    status = JOB_CANCELLED
+                self._finish(job.id, {"success": False, "error": str(e)}, error=str(e), trace=trace, cancelled=cancel_event.is_set())
+            finally:
+                with self._cancel_lock:
+                    self._cancel_events.pop(job.id, None)
+                JOBS_IN_FLIGHT.dec()
+                JOBS_TOTAL.inc(kind=job.kind, status=status)
+                JOB_DURATION.observe(time.perf_counter() - started, kind=job.kind, status=status)
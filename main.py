@@ -1,6 +1,11 @@
-from fastapi import FastAPI, Depends, HTTPException, Request
+from fastapi import FastAPI, Depends, HTTPException, Request, Response
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from sqlalchemy import and_, or_
 from sqlmodel import Session, select
-from typing import List
+from sqlmodel.ext.asyncio.session import AsyncSession
+from typing import List, Optional
+import asyncio
+import base64
 import json
 import hmac
 import hashlib
@@ -8,159 +13,96 @@ import os
 import logging
 import subprocess
 import tempfile
+import threading
+import time
 import uuid
+from datetime import datetime
 from pathlib import Path
 from dotenv import load_dotenv
 
-from database import get_session, create_db_and_tables
-from models import LinearWebhookPayload, WebhookEvent
-from vibe import Vibe
+from database import create_db_and_tables, engine, get_async_session
+from models import EventSpan, LinearWebhookPayload, WebhookEvent, WebhookEventSummary, Job
+from vibe import Vibe, aider_capabilities, build_aider_env
+from aider_worker import AIDER_WORKER_MODE, aider_worker_pool
+from jobs import JOB_CANCELLED, JOB_DEBOUNCE_SECONDS, JOB_QUEUED, JOB_RUNNING, JobQueue
+from job_logs import JOB_LOG_TAIL_LINES, get_active_log, job_log_path, read_log_tail
+from idempotency import idempotency_guard, idempotency_key
+from payload_store import PAYLOAD_STORAGE, hydrate_events, store_payload
+from prefilter import coalesce_key, loads_payload, prefilter_stats, prefilter_webhook, refresh_coalesce_key
+from tracing import Trace, build_timeline, span
+from process_runner import CommandCancelled
+from metrics import CONTENT_TYPE, PUBLISH_QUEUE_DEPTH, QUEUE_DEPTH, WEBHOOK_DURATION, WEBHOOKS_TOTAL, registry
+from git_backend import git_backend
+from repo_sync import TARGET_REPO_BRANCH, TARGET_REPO_URL, get_repo_sync, stop_repo_syncs
+from pr_client import pr_client
+from publisher import PUBLISH_JOB_KIND, PUBLISH_MAX_ATTEMPTS, PUBLISH_RETRY_BACKOFF, PUBLISH_RETRY_BACKOFF_MAX, PUBLISH_WORKERS, publish_branch, publish_coalesce_key
+from worktree import get_worktree_pool, stop_worktree_pools
+from file_selection import FILE_SELECTION_TOP_K, select_relevant_files
+from prompts import build_prompt
+from result_cache import result_cache
 
 # 优先加载 .env 文件中的环境变量
 load_dotenv()
 
 def format_linear_event_for_aider(event_data: dict) -> str:
-    """将 Linear 事件格式化为 aider prompt"""
-    action = event_data.get("action", "")
-    entity_type = event_data.get("entity_type", "")
-    data = event_data.get("data", {})
-    
-    if entity_type == "Issue":
-        return format_issue_for_aider(action, data)
-    elif entity_type == "Comment":
-        return format_comment_for_aider(action, data)
-    elif entity_type == "Reaction":
-        return format_reaction_for_aider(action, data)
-    else:
-        return f"Linear {entity_type} {action}: {json.dumps(data, ensure_ascii=False, indent=2)}"
-
-def format_issue_for_aider(action: str, data: dict) -> str:
-    """格式化 Issue 事件为 aider prompt"""
-    title = data.get("title", "")
-    identifier = data.get("identifier", "")
-    description = data.get("description", "")
-    state = data.get("state", {})
-    team = data.get("team", {})
-    assignee = data.get("assignee", {})
-    url = data.get("url", "")
-    labels = data.get("labels", [])
-    
-    prompt = f"Linear Issue {action.upper()}: {identifier} - {title}\n"
-    prompt += f"Team: {team.get('name', 'Unknown')} ({team.get('key', '')})\n"
-    prompt += f"State: {state.get('name', 'Unknown')}\n"
-    
-    if assignee:
-        prompt += f"Assignee: {assignee.get('name', 'Unknown')}\n"
-    
-    # 重点显示标签信息，特别是 vibe-coding 标签
-    if labels:
-        label_names = [label.get("name", "") for label in labels]
-        prompt += f"Labels: {', '.join(label_names)}\n"
-        
-        # 特别标注 vibe-coding 标签
-        if any(label.get("name", "").lower() == "vibe-coding" for label in labels):
-            prompt += f"🎯 VIBE-CODING LABEL DETECTED - This issue requires AI coding assistance!\n"
-    
-    if description:
-        prompt += f"Description:\n{description}\n"
-    
-    prompt += f"URL: {url}\n"
-    
-    # 添加 AI 编码指导
-    prompt += f"\n🤖 AI CODING TASK:\n"
-    prompt += f"Please analyze this Linear Issue and implement the requested changes in the WoodenMan project.\n"
-    prompt += f"Focus on the issue description and any specific requirements mentioned.\n"
-    prompt += f"Make sure to create meaningful commits and a clear PR description.\n"
-    
-    return prompt
+    """将 Linear 事件格式化为 aider prompt（按预算截断/摘要长描述和评论串）"""
+    return build_prompt(
+        event_data.get("action", ""),
+        event_data.get("entity_type", ""),
+        event_data.get("data", {})
+    )
 
-def format_comment_for_aider(action: str, data: dict) -> str:
-    """格式化 Comment 事件为 aider prompt"""
-    body = data.get("body", "")
-    user = data.get("user", {})
-    issue = data.get("issue", {})
-    
-    prompt = f"Linear Comment {action.upper()}\n"
-    prompt += f"User: {user.get('name', 'Unknown')}\n"
-    prompt += f"Issue: {issue.get('identifier', 'Unknown')} - {issue.get('title', '')}\n"
-    prompt += f"Comment:\n{body}\n"
-    
-    # 添加 Issue 的更多上下文信息
-    if issue:
-        prompt += f"\nIssue Context:\n"
-        prompt += f"- Issue ID: {issue.get('id', 'Unknown')}\n"
-        prompt += f"- Issue URL: {issue.get('url', 'Unknown')}\n"
-        if issue.get('state'):
-            prompt += f"- Issue State: {issue['state'].get('name', 'Unknown')}\n"
-        if issue.get('team'):
-            prompt += f"- Team: {issue['team'].get('name', 'Unknown')} ({issue['team'].get('key', '')})\n"
-    
-    return prompt
+def prepare_repository(woodenman_path: str):
+    """确保 WoodenMan 仓库存在（按需克隆）且基准分支为最新，返回基于它的工作树预热池"""
+    repo_sync = get_repo_sync(woodenman_path)
+    repo_sync.ensure_fresh()
+    pool = get_worktree_pool(woodenman_path, repo_sync.base_ref)
+    # fetch 到新提交后立即同步空闲工作树
+    repo_sync.add_listener(pool.wake)
+    return pool
 
-def format_reaction_for_aider(action: str, data: dict) -> str:
-    """格式化 Reaction 事件为 aider prompt"""
-    emoji = data.get("emoji", "")
-    user = data.get("user", {})
-    comment = data.get("comment", {})
-    
-    prompt = f"Linear Reaction {action.upper()}: {emoji}\n"
-    prompt += f"User: {user.get('name', 'Unknown')}\n"
-    prompt += f"Comment: {comment.get('body', '')[:100]}{'...' if len(comment.get('body', '')) > 100 else ''}\n"
-    
-    return prompt
-
-def create_branch_and_pr(woodenman_path: str, branch_name: str, pr_title: str, pr_body: str, formatted_prompt: str) -> dict:
-    """创建新分支并推送，然后创建 PR"""
+def create_branch_and_commit(woodenman_path: str, branch_name: str, pr_title: str, formatted_prompt: str) -> dict:
+    """在独立的 git 工作树中创建新分支、调用 aider 并提交；推送和创建 PR 由发布队列完成"""
     try:
-        logger.info(f"🌿 开始创建分支 {branch_name} 并推送")
-        logger.info(f"📁 工作目录: {woodenman_path}")
+        logger.info(f"🌿 开始创建分支 {branch_name}")
+        logger.info(f"📁 主仓库目录: {woodenman_path}")
         
-        # 切换到 WoodenMan 目录
-        original_cwd = os.getcwd()
-        os.chdir(woodenman_path)
+        # 1. 确保 WoodenMan 仓库存在，并 fetch 最新的 main
+        with span("ensure_repository"):
+            pool = prepare_repository(woodenman_path)
         
-        try:
-            # 1. 确保 WoodenMan 目录有自己的 git 仓库
-            logger.info("🔍 检查 WoodenMan 目录的 git 仓库...")
-            git_dir = os.path.join(woodenman_path, ".git")
+        # 2. 从预热池取出与 main 同步的独立工作树，多个任务可以并发执行而互不影响
+        logger.info(f"🌿 基于 {pool.base} 创建分支 {branch_name} 的工作树...")
+        with pool.worktree(branch_name) as worktree_path:
+            worktree_dir = str(worktree_path)
+            logger.info(f"✅ 创建分支 {branch_name} 成功，工作树: {worktree_dir}")
             
-            if not os.path.exists(git_dir):
-                logger.info("📁 WoodenMan 目录没有 git 仓库，正在初始化...")
-                
-                # 初始化 git 仓库
-                subprocess.run(["git", "init"], cwd=woodenman_path, check=True, capture_output=True, text=True)
-                logger.info("✅ Git 仓库初始化完成")
-                
-                # 设置用户信息
-                subprocess.run(["git", "config", "user.name", "Linear Webhook Handler"], cwd=woodenman_path, check=True, capture_output=True, text=True)
-                subprocess.run(["git", "config", "user.email", "webhook@linear.app"], cwd=woodenman_path, check=True, capture_output=True, text=True)
-                
-                # 添加现有文件并创建初始提交
-                subprocess.run(["git", "add", "."], cwd=woodenman_path, check=True, capture_output=True, text=True)
-                subprocess.run(["git", "commit", "-m", "Initial commit"], cwd=woodenman_path, check=True, capture_output=True, text=True)
-                logger.info("✅ 初始提交创建完成")
-            else:
-                logger.info("✅ WoodenMan 目录已有 git 仓库")
-            
-            # 2. 确保在 main 分支
-            logger.info("🔄 切换到 main 分支...")
-            subprocess.run(["git", "checkout", "main"], cwd=woodenman_path, check=True, capture_output=True, text=True)
-            logger.info("✅ 已切换到 main 分支")
-            
-            # 3. 创建新分支
-            logger.info(f"🌿 创建新分支 {branch_name}...")
-            subprocess.run(["git", "checkout", "-b", branch_name], cwd=woodenman_path, check=True, capture_output=True, text=True)
-            logger.info(f"✅ 创建分支 {branch_name} 成功")
-            
-            # 4. 调用 aider 处理 Linear 事件
+            # 3. 调用 aider 处理 Linear 事件
             logger.info("🤖 开始调用 aider 处理 Linear 事件...")
+            base_commit = git_backend.head(worktree_dir)
             try:
-                vibe = Vibe(woodenman_path)
                 logger.info(f"📝 格式化后的 prompt:\n{formatted_prompt}")
                 
-                # 调用 vibe.code 方法
-                logger.info("🔄 开始调用 vibe.code()...")
-                aider_result = vibe.code(formatted_prompt)
+                # 只把与 Issue 最相关的文件交给 aider，控制上下文大小
+                with span("file_selection"):
+                    files = select_relevant_files(worktree_dir, formatted_prompt) if FILE_SELECTION_TOP_K > 0 else None
+                
+                # 相同 prompt、基准提交和文件集合处理过时直接回放之前的补丁，不再调用 aider
+                cache_key = result_cache.key(formatted_prompt, base_commit, files)
+                with span("result_cache") as record:
+                    cached = result_cache.replay(worktree_dir, cache_key)
+                    if record is not None:
+                        record["attributes"] = {"hit": cached}
+                
+                if cached:
+                    aider_result = {"success": True, "cached": True}
+                else:
+                    with span("vibe_init"):
+                        vibe = Vibe(worktree_dir)
+                    
+                    # 调用 vibe.code 方法
+                    logger.info("🔄 开始调用 vibe.code()...")
+                    aider_result = vibe.code(formatted_prompt, files=files)
                 
                 aider_success = aider_result.get("success", False)
                 logger.info(f"🎯 aider 执行结果: {'成功' if aider_success else '失败'}")
@@ -171,11 +113,14 @@ def create_branch_and_pr(woodenman_path: str, branch_name: str, pr_title: str, p
                     return {
                         "success": False,
                         "error": f"aider 执行失败: {aider_result.get('stderr', 'Unknown error')}",
-                        "branch_name": branch_name
+                        "branch_name": branch_name,
+                        "aider_log": aider_result.get("log_path")
                     }
                 
                 logger.info("✅ aider 执行成功")
                 
+            except CommandCancelled:
+                raise
             except Exception as vibe_error:
                 logger.error(f"Vibe 调用失败: {str(vibe_error)}")
                 return {
@@ -184,66 +129,42 @@ def create_branch_and_pr(woodenman_path: str, branch_name: str, pr_title: str, p
                     "branch_name": branch_name
                 }
             
-            # 5. 检查是否有文件更改并提交
+            # 4. 检查是否有文件更改并提交
             logger.info("🔍 检查文件更改...")
-            status_result = subprocess.run(["git", "status", "--porcelain"], cwd=woodenman_path, capture_output=True, text=True)
-            
-            if status_result.returncode == 0 and status_result.stdout.strip():
-                logger.info("📝 发现文件更改，准备提交...")
-                logger.info(f"更改的文件:\n{status_result.stdout}")
-                
-                # 添加所有更改
-                subprocess.run(["git", "add", "."], cwd=woodenman_path, check=True, capture_output=True, text=True)
-                logger.info("✅ 文件已添加到暂存区")
-                
-                # 提交更改
+            with span("git_commit", backend=git_backend.name):
                 commit_message = f"Linear 事件处理: {pr_title}"
-                subprocess.run(["git", "commit", "-m", commit_message], cwd=woodenman_path, check=True, capture_output=True, text=True)
-                logger.info(f"✅ 提交成功: {commit_message}")
-            else:
-                logger.warning("⚠️  没有发现文件更改，将创建空 PR")
-            
-            # 6. 推送新分支到远程
-            logger.info(f"⬆️  推送分支 {branch_name} 到远程...")
-            subprocess.run(["git", "push", "-u", "origin", branch_name], cwd=woodenman_path, check=True, capture_output=True, text=True)
-            logger.info(f"✅ 推送分支 {branch_name} 成功")
+                commit = git_backend.commit_all(worktree_dir, commit_message)
+                if commit:
+                    logger.info(f"✅ 提交成功: {commit_message} ({commit[:8]})")
+                else:
+                    logger.warning("⚠️  没有发现文件更改，将创建空 PR")
             
-            # 7. 创建 PR (使用 GitHub CLI)
-            logger.info("📋 开始创建 Pull Request...")
-            pr_cmd = [
-                "gh", "pr", "create",
-                "--title", pr_title,
-                "--body", pr_body,
-                "--head", branch_name,
-                "--base", "main"
-                # 移除不存在的标签，避免创建 PR 失败
-            ]
+            # 5. 缓存 aider 的改动（包括 aider 自己的提交），缓存失败不影响任务
+            if not cached and git_backend.head(worktree_dir) != base_commit:
+                try:
+                    with span("result_cache_store"):
+                        result_cache.store(cache_key, base_commit, worktree_dir)
+                except CommandCancelled:
+                    raise
+                except Exception as e:
+                    logger.warning(f"⚠️  缓存 aider 结果失败: {str(e)}")
             
-            logger.info(f"🔧 执行命令: {' '.join(pr_cmd[:6])}...")
-            pr_result = subprocess.run(pr_cmd, capture_output=True, text=True, timeout=60)
-            
-            if pr_result.returncode == 0:
-                pr_url = pr_result.stdout.strip()
-                logger.info(f"🎉 创建 PR 成功: {pr_url}")
-                logger.info(f"📋 PR 标题: {pr_title}")
-                return {
-                    "success": True,
-                    "branch_name": branch_name,
-                    "pr_url": pr_url,
-                    "pr_output": pr_result.stdout
-                }
-            else:
-                logger.error(f"❌ 创建 PR 失败: {pr_result.stderr}")
-                logger.error(f"🔧 命令输出: {pr_result.stdout}")
-                return {
-                    "success": False,
-                    "error": f"创建 PR 失败: {pr_result.stderr}",
-                    "branch_name": branch_name
-                }
-                
-        finally:
-            os.chdir(original_cwd)
+            return {
+                "success": True,
+                "branch_name": branch_name,
+                "commit": commit,
+                "head": git_backend.head(worktree_dir),
+                "cached": cached,
+                "aider_log": aider_result.get("log_path")
+            }
             
+    except CommandCancelled as e:
+        logger.warning(f"⏹️  {e}")
+        return {
+            "success": False,
+            "error": str(e),
+            "cancelled": True
+        }
     except subprocess.CalledProcessError as e:
         logger.error(f"Git 操作失败: {e}")
         return {
@@ -252,7 +173,7 @@ def create_branch_and_pr(woodenman_path: str, branch_name: str, pr_title: str, p
             "returncode": e.returncode
         }
     except Exception as e:
-        logger.error(f"创建分支和 PR 时出错: {str(e)}")
+        logger.error(f"创建分支和提交时出错: {str(e)}")
         return {
             "success": False,
             "error": str(e)
@@ -263,8 +184,8 @@ def call_aider_with_linear_event(formatted_prompt: str, woodenman_path: str, lin
     try:
         logger.info(f"调用 aider 处理 Linear 事件，目标路径: {woodenman_path}")
         
-        # 确保 WoodenMan 路径存在
-        if not os.path.exists(woodenman_path):
+        # 确保 WoodenMan 路径存在（配置了 TARGET_REPO_URL 时首次使用会自动克隆）
+        if not os.path.exists(woodenman_path) and not TARGET_REPO_URL:
             raise Exception(f"WoodenMan 路径不存在: {woodenman_path}")
         
         # 生成分支名和 PR 信息
@@ -316,34 +237,43 @@ def call_aider_with_linear_event(formatted_prompt: str, woodenman_path: str, lin
 *📋 标签触发: `vibe-coding`*
 """
         
-        # 直接创建分支和 PR，aider 调用将在 create_branch_and_pr 中进行
+        # 创建分支、调用 aider 并提交，推送和创建 PR 交给发布队列
         try:
-            logger.info("🔄 开始创建分支和 PR...")
+            logger.info("🔄 开始创建分支并调用 aider...")
             logger.info(f"🌿 分支名: {branch_name}")
             logger.info(f"📋 PR 标题: {pr_title}")
             
-            # 创建分支和 PR，aider 调用包含在其中
-            pr_result = create_branch_and_pr(woodenman_path, branch_name, pr_title, pr_body, formatted_prompt)
+            commit_result = create_branch_and_commit(woodenman_path, branch_name, pr_title, formatted_prompt)
             
-            if pr_result.get("success"):
-                logger.info(f"🎉 PR 创建成功: {pr_result.get('pr_url', 'Unknown')}")
+            if commit_result.get("success"):
+                logger.info(f"✅ 分支 {branch_name} 已提交，等待推送和创建 PR")
                 return {
                     "success": True,
                     "aider_success": True,
                     "branch_name": branch_name,
-                    "pr_result": pr_result
+                    "commit": commit_result.get("commit"),
+                    "cached": commit_result.get("cached", False),
+                    "aider_log": commit_result.get("aider_log"),
+                    "publish": {
+                        "repo_path": str(Path(woodenman_path).resolve()),
+                        "branch_name": branch_name,
+                        "head": commit_result.get("head"),
+                        "base": TARGET_REPO_BRANCH,
+                        "title": pr_title,
+                        "body": pr_body
+                    }
                 }
             else:
-                logger.error(f"❌ PR 创建失败: {pr_result.get('error', 'Unknown error')}")
+                logger.error(f"❌ 处理失败: {commit_result.get('error', 'Unknown error')}")
                 return {
                     "success": False,
                     "aider_success": False,
-                    "error": pr_result.get("error", "Unknown error"),
+                    "error": commit_result.get("error", "Unknown error"),
                     "branch_name": branch_name
                 }
                 
         except Exception as e:
-            logger.error(f"创建分支和 PR 时出错: {str(e)}")
+            logger.error(f"创建分支和提交时出错: {str(e)}")
             return {
                 "success": False,
                 "error": str(e),
@@ -367,6 +297,82 @@ logger = logging.getLogger(__name__)
 # 创建数据库表
 create_db_and_tables()
 
+# SSE 推送任务日志时检查新内容的间隔（秒）
+JOB_LOG_POLL_INTERVAL = 0.5
+
+# 列表接口单页最大条数
+MAX_PAGE_SIZE = 500
+
+# 摘要模式可选的标量字段
+EVENT_SUMMARY_FIELDS = tuple(WebhookEventSummary.model_fields.keys())
+
+def run_vibe_job(job_id: int, payload: dict) -> dict:
+    """后台任务处理函数 - 调用 aider 处理 Linear 事件，提交后将分支交给发布队列"""
+    aider_result = call_aider_with_linear_event(
+        payload.get("formatted_prompt", ""),
+        payload.get("woodenman_path", ""),
+        payload.get("linear_event_info", {})
+    )
+    
+    publish = aider_result.pop("publish", None)
+    if aider_result.get("success"):
+        logger.info(f"任务 {job_id}: aider 处理成功")
+        if publish:
+            # aider worker 不等待推送和创建 PR，直接处理下一个任务
+            with Session(engine) as session:
+                job = session.get(Job, job_id)
+                # 同一分支的发布任务按顺序执行，排队中的旧提交直接被新提交取代
+                publish_job = publish_queue.enqueue(
+                    session, job.event_id if job else None, publish, kind=PUBLISH_JOB_KIND,
+                    coalesce_key=publish_coalesce_key(publish["repo_path"], publish["branch_name"]), debounce=0
+                )
+            aider_result["publish_job_id"] = publish_job.id
+    else:
+        logger.error(f"任务 {job_id}: aider 处理失败: {aider_result.get('error', 'Unknown error')}")
+    
+    return aider_result
+
+# 后台任务队列：aider 任务与发布（推送 + 创建 PR）任务各自使用独立的 worker
+job_queue = JobQueue(handler=run_vibe_job, kinds=["vibe_coding"])
+publish_queue = JobQueue(
+    handler=publish_branch,
+    workers=PUBLISH_WORKERS,
+    max_attempts=PUBLISH_MAX_ATTEMPTS,
+    kinds=[PUBLISH_JOB_KIND],
+    retry_backoff=PUBLISH_RETRY_BACKOFF,
+    retry_backoff_max=PUBLISH_RETRY_BACKOFF_MAX,
+    name="publish"
+)
+QUEUE_DEPTH.callback = job_queue.queue_depth
+PUBLISH_QUEUE_DEPTH.callback = publish_queue.queue_depth
+
+@app.on_event("startup")
+def start_job_queue():
+    job_queue.start()
+    publish_queue.start()
+    
+    # 后台预先探测 aider，第一个任务无需等待 aider 启动
+    threading.Thread(target=aider_capabilities.get, name="aider-probe", daemon=True).start()
+    
+    # 常驻 worker 模式下提前启动 aider 进程
+    if AIDER_WORKER_MODE:
+        aider_worker_pool.configure(build_aider_env())
+        threading.Thread(target=aider_worker_pool.prewarm, name="aider-worker-prewarm", daemon=True).start()
+    
+    # 提前克隆/fetch WoodenMan 并预热工作树，避免第一个任务等待克隆和文件检出
+    woodenman_path = os.path.join(os.path.dirname(__file__), "WoodenMan")
+    if TARGET_REPO_URL or os.path.exists(os.path.join(woodenman_path, ".git")):
+        threading.Thread(target=prepare_repository, args=(woodenman_path,), name="repo-prepare", daemon=True).start()
+
+@app.on_event("shutdown")
+def stop_job_queue():
+    job_queue.stop()
+    publish_queue.stop()
+    pr_client.close()
+    stop_worktree_pools()
+    stop_repo_syncs()
+    aider_worker_pool.shutdown()
+
 def verify_linear_signature(signature: str, body: bytes) -> bool:
     """验证 Linear webhook 签名"""
     secret = os.getenv("LINEAR_WEBHOOK_SECRET")
@@ -397,9 +403,13 @@ def verify_linear_signature(signature: str, body: bytes) -> bool:
 @app.post("/webhook/linear")
 async def handle_linear_webhook(
     request: Request,
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_session)
 ):
     """处理 Linear webhook 请求 - 2025 最新结构"""
+    # 记录各阶段耗时，事件入库后随任务一起保存
+    trace = Trace()
+    request_started = time.perf_counter()
+    outcome = "error"
     try:
         logger.info("收到 Linear webhook 请求")
         
@@ -411,32 +421,59 @@ async def handle_linear_webhook(
         logger.info(f"Linear-Signature: {linear_signature}")
         
         # 验证签名
-        if not verify_linear_signature(linear_signature, body):
+        with trace.span("signature"):
+            signature_valid = verify_linear_signature(linear_signature, body)
+        if not signature_valid:
             logger.error("签名验证失败")
             raise HTTPException(status_code=401, detail="签名验证失败")
         
         logger.info("签名验证通过")
         
-        # 解析 JSON 载荷
-        try:
-            payload_data = json.loads(body.decode('utf-8'))
-            logger.info(f"JSON 解析成功，载荷键: {list(payload_data.keys())}")
-        except json.JSONDecodeError as e:
-            logger.error(f"JSON 解析失败: {e}")
-            raise HTTPException(status_code=400, detail=f"无效的 JSON 载荷: {str(e)}")
+        # 解析 JSON 载荷并预过滤：绝大多数事件与 vibe-coding 无关，直接在字典上判断，无需完整校验和数据库操作
+        with trace.span("parse_prefilter"):
+            prefilter_started = time.perf_counter()
+            try:
+                payload_data = loads_payload(body)
+            except ValueError as e:
+                logger.error(f"JSON 解析失败: {e}")
+                raise HTTPException(status_code=400, detail=f"无效的 JSON 载荷: {str(e)}")
+            
+            skip_response = prefilter_webhook(payload_data)
+            prefilter_seconds = time.perf_counter() - prefilter_started
         
-        try:
-            payload = LinearWebhookPayload(**payload_data)
-            logger.info(f"载荷验证成功: {payload.action} - {payload.type}")
-        except Exception as e:
-            logger.error(f"载荷验证失败: {e}")
-            raise HTTPException(status_code=400, detail=f"载荷格式错误: {str(e)}")
+        # 仍带 vibe-coding 标签的 Issue 的后续修改：有排队中的任务时继续处理，用最新状态取代它
+        refresh_key = refresh_coalesce_key(payload_data) if skip_response is not None and JOB_DEBOUNCE_SECONDS > 0 else None
+        if refresh_key is not None:
+            with trace.span("coalesce_lookup"):
+                pending_job_id = (await session.exec(
+                    select(Job.id)
+                    .where(Job.coalesce_key == refresh_key)
+                    .where(Job.status == JOB_QUEUED)
+                    .limit(1)
+                )).first()
+            if pending_job_id is not None:
+                logger.info(f"🔄 {refresh_key} 有排队中的任务 {pending_job_id}，使用最新状态重新入队")
+                skip_response = None
+        prefilter_stats.record_prefilter(prefilter_seconds, skip_response is not None)
+        if skip_response is not None:
+            outcome = "skipped"
+            return skip_response
+        
+        with trace.span("validate"):
+            validation_started = time.perf_counter()
+            try:
+                payload = LinearWebhookPayload.model_validate(payload_data)
+                logger.info(f"载荷验证成功: {payload.action} - {payload.type}")
+            except Exception as e:
+                logger.error(f"载荷验证失败: {e}")
+                raise HTTPException(status_code=400, detail=f"载荷格式错误: {str(e)}")
+            prefilter_stats.record_validation(time.perf_counter() - validation_started)
         
         # 提取 HTTP 头部信息
         linear_delivery = request.headers.get("Linear-Delivery")
         linear_event = request.headers.get("Linear-Event")
         
-        # 提取基本信息
+        # 提取基本信息（预过滤已确认是新增了 vibe-coding 标签的 Issue 更新事件）
         entity_type = payload.type
         action = payload.action
         data = payload.data
@@ -444,183 +481,196 @@ async def handle_linear_webhook(
         # 获取实体 ID
         entity_id = data.get("id", "unknown")
         
-        # 只处理 Issue 标签变更事件，且必须包含 vibe-coding 标签
-        if entity_type != "Issue" or action != "update":
-            logger.info(f"🚫 跳过非 Issue 更新事件: {entity_type} - {action}")
+        # 同一次投递（Linear 重试）只处理一次：先查进程内缓存，再由唯一约束判断
+        with trace.span("dedup"):
+            delivery_key = idempotency_key(linear_delivery, body)
+            claimed_key = await session.run_sync(idempotency_guard.claim, delivery_key)
+        if claimed_key is None:
+            logger.info(f"🚫 跳过重复投递: {delivery_key}")
+            outcome = "duplicate"
             return {
                 "status": "skipped",
-                "message": f"只处理 Issue 更新事件，当前事件: {entity_type} - {action}",
-                "entity_type": entity_type,
-                "action": action,
-                "entity_id": entity_id
-            }
-        
-        # 检查是否有标签变更 - 使用 updated_from 字段检测标签是否刚刚被添加
-        updated_from = payload.updated_from
-        labels = data.get("labels", [])
-        
-        # 检查 updated_from 中是否包含标签变更
-        labels_updated = False
-        if updated_from and "labels" in updated_from:
-            old_labels = updated_from.get("labels", [])
-            new_labels = labels
-            
-            # 比较新旧标签列表
-            old_label_names = {label.get("name", "").lower() for label in old_labels}
-            new_label_names = {label.get("name", "").lower() for label in labels}
-            
-            # 检查 vibe-coding 标签是否刚刚被添加
-            if "vibe-coding" not in old_label_names and "vibe-coding" in new_label_names:
-                labels_updated = True
-                logger.info(f"✅ 检测到 vibe-coding 标签刚刚被添加")
-                logger.info(f"旧标签: {[label.get('name', '') for label in old_labels]}")
-                logger.info(f"新标签: {[label.get('name', '') for label in new_labels]}")
-            else:
-                logger.info(f"🚫 vibe-coding 标签未新增，跳过事件")
-                logger.info(f"旧标签: {[label.get('name', '') for label in old_labels]}")
-                logger.info(f"新标签: {[label.get('name', '') for label in new_labels]}")
-        else:
-            # 如果没有 updated_from 信息，检查当前是否包含 vibe-coding 标签
-            # 这种情况可能是第一次处理该 Issue
-            has_vibe_coding_label = any(
-                label.get("name", "").lower() == "vibe-coding" 
-                for label in labels
-            )
-            if has_vibe_coding_label:
-                labels_updated = True
-                logger.info(f"✅ 首次检测到包含 vibe-coding 标签的 Issue")
-                logger.info(f"当前标签: {[label.get('name', '') for label in labels]}")
-            else:
-                logger.info(f"🚫 Issue 不包含 vibe-coding 标签")
-                logger.info(f"当前标签: {[label.get('name', '') for label in labels]}")
-        
-        if not labels_updated:
-            return {
-                "status": "skipped",
-                "message": "vibe-coding 标签未新增，跳过事件",
+                "message": "重复投递，该事件已处理过",
                 "entity_type": entity_type,
                 "action": action,
                 "entity_id": entity_id,
-                "current_labels": [label.get("name", "") for label in labels]
+                "linear_delivery": linear_delivery
             }
         
-        # 检查是否最近处理过相同的事件（防重复处理）
-        recent_events = session.exec(
-            select(WebhookEvent)
-            .where(WebhookEvent.entity_id == entity_id)
-            .where(WebhookEvent.entity_type == entity_type)
-            .where(WebhookEvent.action == action)
-            .order_by(WebhookEvent.created_at.desc())
-            .limit(1)
-        ).first()
+        # 未启用防抖合并时，检查是否最近处理过相同的事件（防重复处理）；启用后短时间内的多次修改合并为一个任务
+        # 只取时间戳列：回滚后 ORM 对象会过期，异步会话中无法再懒加载
+        last_processed_at = None
+        if JOB_DEBOUNCE_SECONDS <= 0:
+            with trace.span("entity_window"):
+                last_processed_at = (await session.exec(
+                    select(WebhookEvent.created_at)
+                    .where(WebhookEvent.entity_id == entity_id)
+                    .where(WebhookEvent.entity_type == entity_type)
+                    .where(WebhookEvent.action == action)
+                    .order_by(WebhookEvent.created_at.desc())
+                    .limit(1)
+                )).first()
         
-        if recent_events and recent_events.created_at:
-            import datetime
-            time_diff = datetime.datetime.now() - recent_events.created_at
+        if last_processed_at:
+            time_diff = datetime.utcnow() - last_processed_at
             if time_diff.total_seconds() < 30:  # 30秒内不重复处理
                 logger.info(f"🚫 跳过重复事件，距离上次处理仅 {time_diff.total_seconds():.1f} 秒")
+                await session.rollback()
+                outcome = "throttled"
                 return {
                     "status": "skipped",
                     "message": "跳过重复事件，避免频繁处理",
                     "entity_type": entity_type,
                     "action": action,
                     "entity_id": entity_id,
-                    "last_processed": recent_events.created_at.isoformat()
+                    "last_processed": last_processed_at.isoformat()
                 }
         
         # 创建数据库记录
-        webhook_event = WebhookEvent(
-            linear_delivery=linear_delivery,
-            linear_event=linear_event,
-            linear_signature=linear_signature,
-            action=action,
-            entity_type=entity_type,
-            entity_id=entity_id,
-            entity_url=payload.url,
-            data=data,
-            updated_from=payload.updated_from,
-            webhook_timestamp=payload.webhook_timestamp,
-            webhook_id=payload.webhook_id,
-            raw_payload=json.dumps(payload.model_dump())
-        )
-        
-        session.add(webhook_event)
-        session.commit()
-        session.refresh(webhook_event)
+        with trace.span("db_insert"):
+            webhook_event = WebhookEvent(
+                linear_delivery=linear_delivery,
+                linear_event=linear_event,
+                linear_signature=linear_signature,
+                action=action,
+                entity_type=entity_type,
+                entity_id=entity_id,
+                entity_url=payload.url,
+                webhook_timestamp=payload.webhook_timestamp,
+                webhook_id=payload.webhook_id
+            )
+            if PAYLOAD_STORAGE == "compressed":
+                # 原始请求体只压缩保存一份，data/updated_from 读取时再解析
+                webhook_event.payload_hash = await session.run_sync(store_payload, body)
+            else:
+                webhook_event.data = data
+                webhook_event.updated_from = payload.updated_from
+                webhook_event.raw_payload = json.dumps(payload.model_dump())
+            
+            session.add(webhook_event)
+            await session.flush()
+            claimed_key.event_id = webhook_event.id
+            session.add(claimed_key)
+            await session.commit()
+            await session.refresh(webhook_event)
+            idempotency_guard.remember(delivery_key)
         
         logger.info(f"Webhook 事件处理成功: {action} - {entity_type} - {entity_id}")
         
-        # 调用 aider 处理 Linear 事件
-        aider_result = None
-        try:
-            # 格式化事件为 aider prompt
+        # 格式化事件为 aider prompt
+        with trace.span("format_prompt"):
             formatted_prompt = format_linear_event_for_aider({
                 "action": action,
                 "entity_type": entity_type,
                 "data": data
             })
-            
-            # 获取 WoodenMan 路径
-            woodenman_path = os.path.join(os.path.dirname(__file__), "WoodenMan")
-            
-            # 准备 Linear 事件信息
-            # 对于 Comment 事件，尝试从关联的 Issue 获取标识符
-            linear_identifier = data.get("identifier", "")
-            if not linear_identifier and entity_type == "Comment":
-                # 对于 Comment，尝试从关联的 Issue 获取标识符
-                issue_data = data.get("issue", {})
-                linear_identifier = issue_data.get("identifier", f"COMMENT-{entity_id[:8]}")
-            
-            linear_event_info = {
-                "action": action,
-                "entity_type": entity_type,
-                "entity_id": entity_id,
-                "title": data.get("title", ""),
-                "linear_url": data.get("url", ""),
-                "linear_identifier": linear_identifier,
-                "created_at": webhook_event.created_at.isoformat() if webhook_event.created_at else None
-            }
-            
-            # 调用 aider
-            aider_result = call_aider_with_linear_event(formatted_prompt, woodenman_path, linear_event_info)
-            
-            if aider_result.get("success"):
-                logger.info("aider 处理成功")
-                if aider_result.get("pr_result", {}).get("success"):
-                    logger.info(f"PR 创建成功: {aider_result['pr_result'].get('pr_url', 'Unknown')}")
-            else:
-                logger.error(f"aider 处理失败: {aider_result.get('error', 'Unknown error')}")
-                
-        except Exception as e:
-            logger.error(f"调用 aider 时出错: {str(e)}")
-            aider_result = {"success": False, "error": str(e)}
         
-        return {
-            "status": "success",
-            "message": f"Webhook event {action} for {entity_type} processed",
-            "event_id": webhook_event.id,
-            "linear_delivery": linear_delivery,
-            "aider_result": aider_result
+        # 获取 WoodenMan 路径
+        woodenman_path = os.path.join(os.path.dirname(__file__), "WoodenMan")
+        
+        # 准备 Linear 事件信息
+        # 对于 Comment 事件，尝试从关联的 Issue 获取标识符
+        linear_identifier = data.get("identifier", "")
+        if not linear_identifier and entity_type == "Comment":
+            # 对于 Comment，尝试从关联的 Issue 获取标识符
+            issue_data = data.get("issue", {})
+            linear_identifier = issue_data.get("identifier", f"COMMENT-{entity_id[:8]}")
+        
+        linear_event_info = {
+            "action": action,
+            "entity_type": entity_type,
+            "entity_id": entity_id,
+            "title": data.get("title", ""),
+            "linear_url": data.get("url", ""),
+            "linear_identifier": linear_identifier,
+            "created_at": webhook_event.created_at.isoformat() if webhook_event.created_at else None
         }
         
+        # aider 调用、推送和创建 PR 耗时数分钟，交给后台任务队列处理；阶段耗时与任务在同一事务中提交
+        session.add_all(trace.to_rows(webhook_event.id))
+        job = await session.run_sync(job_queue.enqueue, webhook_event.id, {
+            "formatted_prompt": formatted_prompt,
+            "woodenman_path": woodenman_path,
+            "linear_event_info": linear_event_info
+        }, "vibe_coding", coalesce_key(entity_type, entity_id))
+        
+        outcome = "coalesced" if (job.payload or {}).get("event_ids") else "queued"
+        return JSONResponse(status_code=202, content={
+            "status": "queued",
+            "message": f"Webhook event {action} for {entity_type} queued",
+            "event_id": webhook_event.id,
+            "job_id": job.id,
+            "coalesced_event_ids": (job.payload or {}).get("event_ids"),
+            "run_after": job.run_after.isoformat() if job.run_after else None,
+            "linear_delivery": linear_delivery
+        })
+        
     except HTTPException as e:
         logger.error(f"HTTP 异常: {e.status_code} - {e.detail}")
+        outcome = "rejected"
         raise e
     except Exception as e:
         logger.error(f"处理 webhook 时发生未知错误: {str(e)}", exc_info=True)
-        session.rollback()
+        await session.rollback()
         raise HTTPException(status_code=500, detail=f"处理 webhook 时出错: {str(e)}")
+    finally:
+        WEBHOOKS_TOTAL.inc(outcome=outcome)
+        WEBHOOK_DURATION.observe(time.perf_counter() - request_started, outcome=outcome)
+
+def encode_event_cursor(created_at: datetime, event_id: int) -> str:
+    """将事件的 (created_at, id) 编码为分页游标"""
+    raw = f"{created_at.isoformat()}|{event_id}"
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii")
 
-@app.get("/webhook/events")
+def decode_event_cursor(cursor: str) -> tuple:
+    """解析分页游标"""
+    try:
+        created_at, event_id = base64.urlsafe_b64decode(cursor.encode("ascii")).decode("utf-8").rsplit("|", 1)
+        return datetime.fromisoformat(created_at), int(event_id)
+    except (ValueError, UnicodeDecodeError):
+        raise HTTPException(status_code=400, detail="无效的分页游标")
+
+@app.get("/webhook/events", responses={200: {"model": List[WebhookEventSummary], "description": "summary 或 fields 模式下的响应"}})
 async def get_webhook_events(
+    response: Response,
     skip: int = 0,
     limit: int = 100,
     entity_type: str = None,
     action: str = None,
-    session: Session = Depends(get_session)
+    cursor: Optional[str] = None,
+    summary: bool = False,
+    fields: Optional[str] = None,
+    session: AsyncSession = Depends(get_async_session)
 ):
-    """获取 webhook 事件列表 - 支持过滤"""
-    statement = select(WebhookEvent)
+    """
+    获取 webhook 事件列表 - 支持过滤
+    
+    使用 cursor 进行游标分页：下一页的游标在响应头 X-Next-Cursor 中返回。
+    skip 仅为兼容保留，深分页请使用 cursor。
+    
+    summary=true 或 fields=id,action,... 时只查询标量列，不读取 JSON 数据，
+    完整数据通过 /webhook/events/{event_id} 获取。
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    
+    selected_fields = None
+    if fields:
+        selected_fields = [name.strip() for name in fields.split(",") if name.strip()]
+        unknown = [name for name in selected_fields if name not in EVENT_SUMMARY_FIELDS]
+        if unknown:
+            raise HTTPException(
+                status_code=400,
+                detail=f"不支持的字段: {', '.join(unknown)}，可选字段: {', '.join(EVENT_SUMMARY_FIELDS)}"
+            )
+    elif summary:
+        selected_fields = list(EVENT_SUMMARY_FIELDS)
+    
+    if selected_fields is None:
+        statement = select(WebhookEvent)
+    else:
+        # 游标分页始终需要 created_at 和 id
+        query_fields = list(dict.fromkeys(selected_fields + ["created_at", "id"]))
+        statement = select(*[getattr(WebhookEvent, name) for name in query_fields])
     
     # 添加过滤条件
     if entity_type:
@@ -628,44 +678,192 @@ async def get_webhook_events(
     if action:
         statement = statement.where(WebhookEvent.action == action)
     
-    # 按创建时间降序排列
-    statement = statement.order_by(WebhookEvent.created_at.desc())
-    statement = statement.offset(skip).limit(limit)
+    if cursor:
+        cursor_created_at, cursor_id = decode_event_cursor(cursor)
+        statement = statement.where(or_(
+            WebhookEvent.created_at < cursor_created_at,
+            and_(WebhookEvent.created_at == cursor_created_at, WebhookEvent.id < cursor_id)
+        ))
+    elif skip:
+        statement = statement.offset(skip)
+    
+    # 按创建时间降序排列，id 作为同一时间的稳定排序
+    statement = statement.order_by(WebhookEvent.created_at.desc(), WebhookEvent.id.desc())
+    statement = statement.limit(limit)
+    
+    if selected_fields is None:
+        events = list((await session.exec(statement)).all())
+        events = await session.run_sync(hydrate_events, events)
+        if len(events) == limit:
+            response.headers["X-Next-Cursor"] = encode_event_cursor(events[-1].created_at, events[-1].id)
+        return events
+    
+    # 摘要模式直接构造 JSON，跳过逐行的模型校验和序列化
+    rows = (await session.exec(statement)).all()
+    content = []
+    for row in rows:
+        item = {}
+        for name in selected_fields:
+            value = getattr(row, name)
+            item[name] = value.isoformat() if isinstance(value, datetime) else value
+        content.append(item)
     
-    events = session.exec(statement).all()
-    return events
+    headers = {}
+    if len(rows) == limit:
+        headers["X-Next-Cursor"] = encode_event_cursor(rows[-1].created_at, rows[-1].id)
+    return JSONResponse(content=content, headers=headers)
 
 @app.get("/webhook/events/{event_id}")
 async def get_webhook_event(
     event_id: int,
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_session)
 ):
     """获取特定 webhook 事件"""
     statement = select(WebhookEvent).where(WebhookEvent.id == event_id)
-    event = session.exec(statement).first()
+    event = (await session.exec(statement)).first()
     if not event:
         raise HTTPException(status_code=404, detail="事件未找到")
-    return event
+    return (await session.run_sync(hydrate_events, [event]))[0]
+
+@app.get("/webhook/events/{event_id}/timeline")
+async def get_webhook_event_timeline(
+    event_id: int,
+    session: AsyncSession = Depends(get_async_session)
+):
+    """获取事件从接收到创建 PR 各阶段的耗时时间线"""
+    exists = (await session.exec(select(WebhookEvent.id).where(WebhookEvent.id == event_id))).first()
+    if exists is None:
+        raise HTTPException(status_code=404, detail="事件未找到")
+    spans = (await session.exec(select(EventSpan).where(EventSpan.event_id == event_id))).all()
+    return build_timeline(event_id, list(spans))
 
 @app.get("/webhook/events/by-linear/{linear_delivery}")
 async def get_webhook_event_by_linear_delivery(
     linear_delivery: str,
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_session)
 ):
     """根据 Linear Delivery ID 获取事件"""
     statement = select(WebhookEvent).where(WebhookEvent.linear_delivery == linear_delivery)
-    event = session.exec(statement).first()
+    event = (await session.exec(statement)).first()
     if not event:
         raise HTTPException(status_code=404, detail="事件未找到")
-    return event
+    return (await session.run_sync(hydrate_events, [event]))[0]
+
+@app.get("/jobs")
+async def get_jobs(
+    skip: int = 0,
+    limit: int = 100,
+    status: Optional[str] = None,
+    event_id: Optional[int] = None,
+    session: AsyncSession = Depends(get_async_session)
+):
+    """获取后台任务列表 - 支持按状态和事件过滤"""
+    statement = select(Job)
+    
+    if status:
+        statement = statement.where(Job.status == status)
+    if event_id is not None:
+        statement = statement.where(Job.event_id == event_id)
+    
+    statement = statement.order_by(Job.id.desc()).offset(skip).limit(limit)
+    return (await session.exec(statement)).all()
+
+@app.get("/jobs/{job_id}")
+async def get_job(
+    job_id: int,
+    session: AsyncSession = Depends(get_async_session)
+):
+    """获取特定后台任务的状态和结果"""
+    job = await session.get(Job, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="任务未找到")
+    return job
+
+@app.post("/jobs/{job_id}/cancel")
+async def cancel_job(
+    job_id: int,
+    session: AsyncSession = Depends(get_async_session)
+):
+    """取消任务：排队中的任务不再执行，执行中的任务终止 aider/git/gh 子进程组"""
+    job = await session.get(Job, job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="任务未找到")
+    if job.status not in (JOB_QUEUED, JOB_RUNNING):
+        raise HTTPException(status_code=409, detail=f"任务已结束，状态: {job.status}")
+    
+    queue = publish_queue if job.kind == PUBLISH_JOB_KIND else job_queue
+    job = await session.run_sync(queue.cancel, job_id)
+    if job.status == JOB_RUNNING:
+        if not queue.is_cancelling(job_id):
+            # 任务由其他进程执行，本进程无法终止其子进程
+            raise HTTPException(status_code=409, detail="任务不在本进程中执行，无法取消")
+        return {"job_id": job_id, "status": job.status, "message": "已请求取消，正在终止子进程"}
+    if job.status != JOB_CANCELLED:
+        raise HTTPException(status_code=409, detail=f"任务已结束，状态: {job.status}")
+    return {"job_id": job_id, "status": job.status, "message": "任务已取消"}
+
+@app.get("/jobs/{job_id}/log", response_class=PlainTextResponse)
+async def get_job_log(job_id: int, tail: int = JOB_LOG_TAIL_LINES):
+    """获取任务输出的最后若干行（执行中的任务读取内存缓冲区）"""
+    lines = await asyncio.to_thread(read_log_tail, job_id, max(1, tail))
+    if lines is None:
+        raise HTTPException(status_code=404, detail="任务日志不存在")
+    return "\n".join(lines) + "\n" if lines else ""
+
+@app.get("/jobs/{job_id}/log/stream")
+async def stream_job_log(job_id: int, request: Request):
+    """以 SSE 方式推送任务输出，任务结束且日志读完后发送 end 事件"""
+    path = job_log_path(job_id)
+    if not path.exists() and get_active_log(job_id) is None:
+        raise HTTPException(status_code=404, detail="任务日志不存在")
+    
+    async def events():
+        # 任务刚领取时日志文件可能尚未创建
+        while not path.exists():
+            if get_active_log(job_id) is None or await request.is_disconnected():
+                yield "event: end\ndata: \n\n"
+                return
+            await asyncio.sleep(JOB_LOG_POLL_INTERVAL)
+        
+        with open(path, encoding="utf-8", errors="replace") as f:
+            pending = ""
+            while True:
+                chunk = f.read(65536)
+                if chunk:
+                    pending += chunk
+                    *lines, pending = pending.split("\n")
+                    for line in lines:
+                        yield f"data: {line}\n\n"
+                    continue
+                # 没有新内容：任务已结束则读完剩余内容后收尾，否则稍后再读
+                if get_active_log(job_id) is None:
+                    for line in (pending + f.read()).split("\n"):
+                        if line:
+                            yield f"data: {line}\n\n"
+                    yield "event: end\ndata: \n\n"
+                    return
+                if await request.is_disconnected():
+                    return
+                await asyncio.sleep(JOB_LOG_POLL_INTERVAL)
+    
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
 
 @app.get("/")
 async def root():
     return {"message": "Linear Webhook Handler API", "status": "running"}
 
+@app.get("/metrics")
+def metrics():
+    """Prometheus 文本格式的指标（同步接口，队列长度查询在线程池中执行）"""
+    return Response(content=registry.render(), media_type=CONTENT_TYPE)
+
 @app.get("/health")
 async def health_check():
     return {
         "status": "healthy",
-        "signature_verification": os.getenv("LINEAR_WEBHOOK_SECRET") is not None
+        "signature_verification": os.getenv("LINEAR_WEBHOOK_SECRET") is not None,
+        # 只读取缓存，不在请求中启动 aider
+        "aider": aider_capabilities.peek() or {"available": None, "error": "尚未探测"},
+        "aider_workers": aider_worker_pool.stats() if AIDER_WORKER_MODE else None,
+        "webhook_prefilter": prefilter_stats.stats()
     }
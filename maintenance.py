@@ -0,0 +1,51 @@
+import argparse
+import logging
+
+from sqlalchemy import text
+from sqlmodel import Session
+
+from database import create_db_and_tables, engine
+from job_logs import JOB_LOG_MAX_FILES, JOB_LOG_RETENTION_DAYS, prune_job_logs
+from payload_store import compact_legacy_payloads
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def compact_payloads(batch_size: int, vacuum: bool):
+    """将旧格式事件转换为压缩去重存储"""
+    create_db_and_tables()
+    with Session(engine) as session:
+        converted = compact_legacy_payloads(session, batch_size=batch_size)
+    print(f"✅ 已转换 {converted} 条事件")
+
+    if vacuum and engine.dialect.name == "sqlite":
+        # VACUUM 不能在事务中执行
+        with engine.connect().execution_options(isolation_level="AUTOCOMMIT") as conn:
+            conn.execute(text("VACUUM"))
+        print("✅ 已执行 VACUUM，释放磁盘空间")
+
+
+def prune_logs(max_age_days: float, max_files: int):
+    """按保留天数和文件数上限清理任务日志"""
+    removed = prune_job_logs(max_age_days=max_age_days, max_files=max_files)
+    print(f"✅ 已删除 {removed} 个任务日志")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Linear Webhook Handler 维护命令")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    compact_parser = subparsers.add_parser("compact-payloads", help="将旧事件的 data/updated_from/raw_payload 转换为压缩存储")
+    compact_parser.add_argument("--batch-size", type=int, default=500, help="每批转换的事件数")
+    compact_parser.add_argument("--vacuum", action="store_true", help="转换后执行 VACUUM（仅 SQLite）")
+
+    prune_parser = subparsers.add_parser("prune-job-logs", help="删除过期的任务日志文件")
+    prune_parser.add_argument("--days", type=float, default=JOB_LOG_RETENTION_DAYS, help="保留天数，0 表示不按时间删除")
+    prune_parser.add_argument("--max-files", type=int, default=JOB_LOG_MAX_FILES, help="最多保留的日志文件数，0 表示不限制")
+
+    args = parser.parse_args()
+    if args.command == "compact-payloads":
+        compact_payloads(args.batch_size, args.vacuum)
+    elif args.command == "prune-job-logs":
+        prune_logs(args.days, args.max_files)
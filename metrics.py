@@ -0,0 +1,200 @@
+from abc import ABC, abstractmethod
+from bisect import bisect_left
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+import math
+import threading
+
+# Prometheus 文本格式的 Content-Type
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+LabelValues = Tuple[str, ...]
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(f'{extra[0]}="{extra[1]}"')
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Metric(ABC):
+    """指标基类：按标签值保存数据，每个指标一把锁"""
+
+    kind = "untyped"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"指标 {self.name} 需要标签 {self.labelnames}，收到 {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    @abstractmethod
+    def samples(self) -> List[str]:
+        """当前值对应的 Prometheus 样本行"""
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        lines.extend(self.samples())
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """只增不减的计数器"""
+
+    kind = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Gauge(Metric):
+    """可增可减的仪表；设置 callback 后在抓取时实时计算"""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), callback: Optional[Callable[[], float]] = None):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+        self.callback = callback
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels):
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def samples(self) -> List[str]:
+        if self.callback is not None:
+            return [f"{self.name} {_format_value(self.callback())}"]
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}" for key, value in items]
+
+
+class Histogram(Metric):
+    """固定分桶的直方图"""
+
+    kind = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float], labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # 每组标签: [各分桶计数..., +Inf 计数, 总和]
+        self._values: Dict[LabelValues, List[float]] = {}
+
+    def observe(self, value: float, **labels):
+        key = self._key(labels)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            data = self._values.get(key)
+            if data is None:
+                data = self._values[key] = [0.0] * (len(self.buckets) + 2)
+            data[index] += 1
+            data[-1] += value
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((key, list(data)) for key, data in self._values.items())
+
+        lines = []
+        for key, data in items:
+            cumulative = 0.0
+            for bound, count in zip(self.buckets + (math.inf,), data[:-1]):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, ('le', _format_value(bound)))} {_format_value(cumulative)}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(data[-1])}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {_format_value(cumulative)}")
+        return lines
+
+
+class MetricsRegistry:
+    """进程内指标注册表，按 Prometheus 文本格式输出"""
+
+    def __init__(self):
+        self._metrics: Dict[str, Metric] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Metric) -> Metric:
+        with self._lock:
+            if metric.name in self._metrics:
+                raise ValueError(f"指标已注册: {metric.name}")
+            self._metrics[metric.name] = metric
+        return metric
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+registry = MetricsRegistry()
+
+# 分桶（秒）
+FAST_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5)
+GIT_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+SLOW_BUCKETS = (1.0, 5.0, 15.0, 30.0, 60.0, 120.0, 300.0, 600.0, 1200.0, 1800.0, 3600.0)
+
+WEBHOOKS_TOTAL = registry.register(Counter(
+    "vibe_webhooks_total", "收到的 webhook 请求数，按处理结果分类", ["outcome"]))
+WEBHOOK_DURATION = registry.register(Histogram(
+    "vibe_webhook_duration_seconds", "webhook 请求处理耗时", FAST_BUCKETS, ["outcome"]))
+
+JOBS_TOTAL = registry.register(Counter(
+    "vibe_jobs_total", "执行结束的后台任务数，按任务类型和状态分类", ["kind", "status"]))
+JOBS_IN_FLIGHT = registry.register(Gauge(
+    "vibe_jobs_in_flight", "正在执行的后台任务数"))
+JOB_DURATION = registry.register(Histogram(
+    "vibe_job_duration_seconds", "后台任务执行耗时", SLOW_BUCKETS, ["kind", "status"]))
+JOB_QUEUE_WAIT = registry.register(Histogram(
+    "vibe_job_queue_wait_seconds", "任务从入队到开始执行的等待时间", SLOW_BUCKETS))
+QUEUE_DEPTH = registry.register(Gauge(
+    "vibe_job_queue_depth", "排队中的任务数"))
+PUBLISH_QUEUE_DEPTH = registry.register(Gauge(
+    "vibe_publish_queue_depth", "等待推送和创建 PR 的任务数（包括等待重试的任务）"))
+
+AIDER_RUNS_TOTAL = registry.register(Counter(
+    "vibe_aider_runs_total", "aider 执行次数，按退出码分类", ["exit_code"]))
+AIDER_DURATION = registry.register(Histogram(
+    "vibe_aider_duration_seconds", "aider 执行耗时", SLOW_BUCKETS))
+
+GIT_COMMAND_DURATION = registry.register(Histogram(
+    "vibe_git_command_duration_seconds", "git 子进程耗时，按子命令分类", GIT_BUCKETS, ["command"]))
+PR_CREATE_DURATION = registry.register(Histogram(
+    "vibe_pr_create_duration_seconds", "创建 PR 的耗时", GIT_BUCKETS, ["outcome"]))
+PUBLISH_ATTEMPTS_TOTAL = registry.register(Counter(
+    "vibe_publish_attempts_total", "发布阶段每次尝试的结果，按推送/创建 PR 分类", ["stage", "outcome"]))
+RESULT_CACHE_TOTAL = registry.register(Counter(
+    "vibe_result_cache_total", "aider 结果缓存的查询、写入和淘汰次数，按结果分类", ["outcome"]))
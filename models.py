@@ -1,25 +1,34 @@
 from sqlmodel import SQLModel, Field
-from sqlalchemy import Column, JSON
+from sqlalchemy import Column, Index, JSON, LargeBinary
 from typing import Optional, Dict, Any
 from datetime import datetime
 
 class LinearWebhookPayload(SQLModel):
     """Linear Webhook 请求载荷模型 - 2025 最新结构"""
+    # 部分 pydantic 版本下 SQLModel 的 alias 不参与校验，显式设置 validation_alias 保证 camelCase 字段能被读取
     action: str = Field(description="操作类型: create, update, remove")
     type: str = Field(description="实体类型: Issue, Comment, Project 等")
     data: Dict[str, Any] = Field(description="实体的完整数据")
     url: Optional[str] = Field(default=None, description="实体的 Linear URL")
-    created_at: Optional[str] = Field(default=None, alias="createdAt", description="操作发生时间")
-    updated_from: Optional[Dict[str, Any]] = Field(default=None, alias="updatedFrom", description="更新前的值")
-    webhook_timestamp: Optional[int] = Field(default=None, alias="webhookTimestamp", description="Webhook 发送时间戳")
-    webhook_id: Optional[str] = Field(default=None, alias="webhookId", description="Webhook 唯一标识")
+    created_at: Optional[str] = Field(default=None, alias="createdAt", schema_extra={"validation_alias": "createdAt"}, description="操作发生时间")
+    updated_from: Optional[Dict[str, Any]] = Field(default=None, alias="updatedFrom", schema_extra={"validation_alias": "updatedFrom"}, description="更新前的值")
+    webhook_timestamp: Optional[int] = Field(default=None, alias="webhookTimestamp", schema_extra={"validation_alias": "webhookTimestamp"}, description="Webhook 发送时间戳")
+    webhook_id: Optional[str] = Field(default=None, alias="webhookId", schema_extra={"validation_alias": "webhookId"}, description="Webhook 唯一标识")
 
 class WebhookEvent(SQLModel, table=True):
     """Webhook 事件数据库模型 - 2025 最新结构"""
     __tablename__ = "webhook_events"
+    __table_args__ = (
+        # 防重复处理时按实体查找最近一次事件
+        Index("ix_webhook_events_entity_lookup", "entity_id", "entity_type", "action", "created_at"),
+        # 事件列表按 (created_at, id) 游标分页，过滤条件在前
+        Index("ix_webhook_events_created", "created_at", "id"),
+        Index("ix_webhook_events_type_created", "entity_type", "created_at", "id"),
+        Index("ix_webhook_events_action_created", "action", "created_at", "id"),
+    )
     
     id: Optional[int] = Field(default=None, primary_key=True)
-    linear_delivery: Optional[str] = Field(default=None, max_length=100, description="Linear-Delivery UUID")
+    linear_delivery: Optional[str] = Field(default=None, max_length=100, index=True, description="Linear-Delivery UUID")
     linear_event: str = Field(max_length=100, description="Linear-Event 类型")
     linear_signature: Optional[str] = Field(default=None, max_length=200, description="Linear-Signature")
     action: str = Field(max_length=50, description="操作类型")
@@ -32,3 +41,85 @@ class WebhookEvent(SQLModel, table=True):
     webhook_id: Optional[str] = Field(default=None, max_length=100, description="Webhook ID")
     created_at: datetime = Field(default_factory=datetime.utcnow, description="记录创建时间")
     raw_payload: Optional[str] = Field(default=None, description="原始载荷")
+    payload_hash: Optional[str] = Field(default=None, max_length=64, description="压缩存储的原始请求体哈希（payload_blobs.hash）")
+
+class Job(SQLModel, table=True):
+    """后台任务数据库模型 - 持久化的 vibe-coding 任务队列"""
+    __tablename__ = "jobs"
+    
+    id: Optional[int] = Field(default=None, primary_key=True)
+    event_id: Optional[int] = Field(default=None, foreign_key="webhook_events.id", index=True, description="关联的 Webhook 事件 ID")
+    kind: str = Field(default="vibe_coding", max_length=50, description="任务类型")
+    status: str = Field(default="queued", max_length=20, index=True, description="任务状态: queued, running, succeeded, failed, cancelled, superseded")
+    payload: Optional[Dict[str, Any]] = Field(default=None, sa_column=Column(JSON), description="任务参数")
+    coalesce_key: Optional[str] = Field(default=None, max_length=100, index=True, description="合并键，同一键排队中的旧任务会被新任务取代")
+    run_after: Optional[datetime] = Field(default=None, description="最早执行时间（防抖等待结束的时间）")
+    superseded_by: Optional[int] = Field(default=None, description="取代此任务的新任务 ID")
+    result: Optional[Dict[str, Any]] = Field(default=None, sa_column=Column(JSON), description="任务执行结果")
+    error: Optional[str] = Field(default=None, description="错误信息")
+    attempts: int = Field(default=0, description="已执行次数")
+    created_at: datetime = Field(default_factory=datetime.utcnow, description="入队时间")
+    started_at: Optional[datetime] = Field(default=None, description="开始执行时间")
+    worker_id: Optional[str] = Field(default=None, max_length=100, description="领取任务的进程（主机名:pid:随机后缀）")
+    heartbeat_at: Optional[datetime] = Field(default=None, description="执行中任务最近一次心跳时间，超时未更新视为进程已退出")
+    finished_at: Optional[datetime] = Field(default=None, description="执行结束时间")
+
+class PayloadBlob(SQLModel, table=True):
+    """原始请求体 - 压缩存储并按内容哈希去重，相同载荷只保存一份"""
+    __tablename__ = "payload_blobs"
+    
+    hash: str = Field(primary_key=True, max_length=64, description="原始请求体 SHA-256")
+    codec: str = Field(max_length=10, description="压缩算法: zstd, zlib")
+    size: int = Field(description="原始大小（字节）")
+    data: bytes = Field(sa_column=Column(LargeBinary, nullable=False), description="压缩后的请求体")
+    created_at: datetime = Field(default_factory=datetime.utcnow, description="首次写入时间")
+
+class WebhookEventSummary(SQLModel):
+    """Webhook 事件摘要 - 列表接口只返回标量列，data/updated_from/raw_payload 需通过详情接口获取"""
+    id: Optional[int] = None
+    linear_delivery: Optional[str] = None
+    linear_event: Optional[str] = None
+    action: Optional[str] = None
+    entity_type: Optional[str] = None
+    entity_id: Optional[str] = None
+    entity_url: Optional[str] = None
+    webhook_timestamp: Optional[int] = None
+    webhook_id: Optional[str] = None
+    created_at: Optional[datetime] = None
+
+class IdempotencyKey(SQLModel, table=True):
+    """Webhook 幂等键 - 每次投递（Linear-Delivery 或请求体哈希）只处理一次"""
+    __tablename__ = "webhook_idempotency_keys"
+    
+    key: str = Field(primary_key=True, max_length=128, description="Linear-Delivery UUID 或请求体 SHA-256")
+    event_id: Optional[int] = Field(default=None, foreign_key="webhook_events.id", description="关联的 Webhook 事件 ID")
+    created_at: datetime = Field(default_factory=datetime.utcnow, description="首次收到时间")
+
+class EventSpan(SQLModel, table=True):
+    """事件处理流水线的阶段耗时 - 记录 webhook 处理和后台任务中每个阶段的开始时间与耗时"""
+    __tablename__ = "event_spans"
+    
+    id: Optional[int] = Field(default=None, primary_key=True)
+    event_id: int = Field(foreign_key="webhook_events.id", index=True, description="关联的 Webhook 事件 ID")
+    job_id: Optional[int] = Field(default=None, foreign_key="jobs.id", description="关联的后台任务 ID，webhook 处理阶段为空")
+    name: str = Field(max_length=64, description="阶段名称")
+    parent: Optional[str] = Field(default=None, max_length=64, description="上级阶段名称")
+    depth: int = Field(default=0, description="嵌套层级，0 为顶层阶段")
+    status: str = Field(default="ok", max_length=10, description="阶段结果: ok, error")
+    started_at: datetime = Field(description="开始时间")
+    duration_ms: float = Field(description="耗时（毫秒）")
+    attributes: Optional[Dict[str, Any]] = Field(default=None, sa_column=Column(JSON), description="附加信息")
+
+class ResultCacheEntry(SQLModel, table=True):
+    """aider 结果缓存 - 相同 prompt、基准提交和文件集合的改动补丁，重复事件直接回放"""
+    __tablename__ = "result_cache"
+    
+    key: str = Field(primary_key=True, max_length=64, description="prompt、基准提交、所选文件和模型的 SHA-256")
+    base_commit: str = Field(max_length=64, description="生成补丁时的基准提交")
+    codec: str = Field(max_length=10, description="压缩算法: zstd, zlib")
+    size: int = Field(description="补丁原始大小（字节）")
+    stored_size: int = Field(description="压缩后大小（字节），用于容量上限")
+    data: bytes = Field(sa_column=Column(LargeBinary, nullable=False), description="压缩后的 git diff --binary 补丁")
+    hits: int = Field(default=0, description="命中次数")
+    created_at: datetime = Field(default_factory=datetime.utcnow, description="写入时间")
+    last_used_at: datetime = Field(default_factory=datetime.utcnow, index=True, description="最近写入或命中的时间，按此淘汰")
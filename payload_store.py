@@ -0,0 +1,133 @@
+from sqlmodel import Session, select
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from typing import Dict, Iterable, List, Optional, Tuple
+import hashlib
+import json
+import logging
+import os
+import zlib
+
+from models import PayloadBlob, WebhookEvent
+
+try:
+    import zstandard
+except ImportError:  # zstandard 为可选依赖，未安装时使用 zlib
+    zstandard = None
+
+logger = logging.getLogger(__name__)
+
+# 载荷存储模式: compressed（压缩去重）或 legacy（data/updated_from/raw_payload 三列）
+PAYLOAD_STORAGE = os.getenv("PAYLOAD_STORAGE", "compressed").lower()
+PAYLOAD_COMPRESSION_LEVEL = int(os.getenv("PAYLOAD_COMPRESSION_LEVEL", "6"))
+
+# 旧格式 raw_payload（model_dump 的字段名）到 Linear 原始键名的映射
+LEGACY_FIELD_ALIASES = {
+    "created_at": "createdAt",
+    "updated_from": "updatedFrom",
+    "webhook_timestamp": "webhookTimestamp",
+    "webhook_id": "webhookId"
+}
+
+
+def compress_payload(body: bytes) -> Tuple[str, bytes]:
+    """压缩请求体，优先使用 zstd"""
+    if zstandard is not None:
+        return "zstd", zstandard.ZstdCompressor(level=PAYLOAD_COMPRESSION_LEVEL).compress(body)
+    return "zlib", zlib.compress(body, PAYLOAD_COMPRESSION_LEVEL)
+
+
+def decompress_payload(codec: str, data: bytes) -> bytes:
+    """解压请求体"""
+    if codec == "zstd":
+        if zstandard is None:
+            raise RuntimeError("读取 zstd 压缩的载荷需要安装 zstandard")
+        return zstandard.ZstdDecompressor().decompress(data)
+    if codec == "zlib":
+        return zlib.decompress(data)
+    raise ValueError(f"未知的压缩算法: {codec}")
+
+
+def store_payload(session: Session, body: bytes) -> str:
+    """按内容哈希保存原始请求体，已存在时不重复写入，返回哈希"""
+    payload_hash = hashlib.sha256(body).hexdigest()
+    codec, data = compress_payload(body)
+    values = {"hash": payload_hash, "codec": codec, "size": len(body), "data": data}
+
+    dialect = session.get_bind().dialect.name
+    if dialect == "sqlite":
+        statement = sqlite_insert(PayloadBlob).values(**values).on_conflict_do_nothing(index_elements=["hash"])
+        session.execute(statement)
+    elif dialect == "postgresql":
+        statement = postgresql_insert(PayloadBlob).values(**values).on_conflict_do_nothing(index_elements=["hash"])
+        session.execute(statement)
+    elif session.get(PayloadBlob, payload_hash) is None:
+        session.add(PayloadBlob(**values))
+    return payload_hash
+
+
+def load_payloads(session: Session, hashes: Iterable[str]) -> Dict[str, bytes]:
+    """批量读取并解压请求体"""
+    hashes = list({payload_hash for payload_hash in hashes if payload_hash})
+    if not hashes:
+        return {}
+    blobs = session.exec(select(PayloadBlob).where(PayloadBlob.hash.in_(hashes))).all()
+    return {blob.hash: decompress_payload(blob.codec, blob.data) for blob in blobs}
+
+
+def hydrate_events(session: Session, events: List[WebhookEvent]) -> List[WebhookEvent]:
+    """
+    为压缩存储的事件补全 data、updated_from 和 raw_payload
+
+    事件会先从会话中分离，补全的字段只用于响应，不会写回数据库。
+    """
+    pending = [event for event in events if event.payload_hash and event.data is None]
+    if not pending:
+        return events
+
+    bodies = load_payloads(session, [event.payload_hash for event in pending])
+    for event in pending:
+        body = bodies.get(event.payload_hash)
+        if body is None:
+            continue
+        session.expunge(event)
+        payload = json.loads(body)
+        event.data = payload.get("data")
+        event.updated_from = payload.get("updatedFrom")
+        event.raw_payload = body.decode("utf-8")
+    return events
+
+
+def compact_legacy_payloads(session: Session, batch_size: int = 500) -> int:
+    """
+    将旧格式事件（三列 JSON）转换为压缩存储
+
+    旧记录的 raw_payload 是载荷模型的 JSON，这里把它作为原始请求体保存。
+    """
+    converted = 0
+    while True:
+        events = session.exec(
+            select(WebhookEvent)
+            .where(WebhookEvent.payload_hash.is_(None))
+            .where(WebhookEvent.raw_payload.is_not(None))
+            .order_by(WebhookEvent.id)
+            .limit(batch_size)
+        ).all()
+        if not events:
+            return converted
+
+        for event in events:
+            payload = json.loads(event.raw_payload)
+            # 旧格式使用字段名（snake_case），转换为 Linear 原始的 camelCase 键
+            for field_name, alias in LEGACY_FIELD_ALIASES.items():
+                if field_name in payload:
+                    payload[alias] = payload.pop(field_name)
+            body = json.dumps(payload, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+            event.payload_hash = store_payload(session, body)
+            event.data = None
+            event.updated_from = None
+            event.raw_payload = None
+            session.add(event)
+        session.commit()
+        converted += len(events)
+        logger.info(f"已转换 {converted} 条事件")
@@ -0,0 +1,240 @@
+from abc import ABC, abstractmethod
+from typing import Any, Dict, Optional, Tuple
+import logging
+import os
+import re
+import subprocess
+import threading
+
+import httpx
+
+from git_backend import run_git
+from process_runner import run_command
+
+logger = logging.getLogger(__name__)
+
+# 创建 PR 的方式: gh（GitHub CLI）、rest（直接调用 REST API，复用连接）、auto（配置了 token 时使用 rest）
+PR_CLIENT = os.getenv("PR_CLIENT", "auto").lower()
+PR_CREATE_TIMEOUT = float(os.getenv("PR_CREATE_TIMEOUT", "60"))
+
+# REST 客户端配置；GITHUB_REPOSITORY 为空时从仓库的 origin 地址解析 owner/repo
+GITHUB_TOKEN = os.getenv("GITHUB_TOKEN") or os.getenv("GH_TOKEN")
+GITHUB_API_URL = os.getenv("GITHUB_API_URL", "https://api.github.com").rstrip("/")
+GITHUB_REPOSITORY = os.getenv("GITHUB_REPOSITORY") or None
+GITHUB_MAX_CONNECTIONS = int(os.getenv("GITHUB_MAX_CONNECTIONS", "10"))
+
+# 没有安装 gh 时的错误，重试也不会成功
+GH_NOT_FOUND_ERROR = "未找到 gh 命令，请安装 GitHub CLI 或配置 GITHUB_TOKEN 使用 REST API"
+
+# gh 输出中表示重试也不会成功的错误
+GH_PERMANENT_ERRORS = ("No commits between", "could not find any commits", "gh auth login", "Head sha can't be blank")
+
+PR_URL_PATTERN = re.compile(r"https?://\S+/pull/\d+")
+GITHUB_REMOTE_PATTERN = re.compile(r"github\.com[:/](?P<owner>[^/]+)/(?P<name>[^/]+?)(?:\.git)?/?$")
+
+
+class PullRequestClient(ABC):
+    """
+    创建和更新 Pull Request
+
+    create() 返回结果字典: success、pr_url、existing（PR 已存在），失败时包含 error，
+    以及 retryable（网络错误、限流、服务端错误等稍后重试可能成功的情况）和可选的 retry_after（秒）。
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def create(self, repo_path: str, head: str, base: str, title: str, body: str) -> Dict[str, Any]:
+        """创建 PR，同一分支的 PR 已存在时返回已有 PR 的地址"""
+
+    @abstractmethod
+    def update(self, repo_path: str, pr_url: str, title: str, body: str) -> Dict[str, Any]:
+        """更新已有 PR 的标题和描述（同一 Issue 的后续任务以最新的 Issue 内容更新 PR），返回 success 和 error"""
+
+    def close(self):
+        pass
+
+
+class GhCliClient(PullRequestClient):
+    """通过 gh pr create 创建，仓库和凭据由 gh 根据工作目录的远程地址和登录状态确定"""
+
+    name = "gh"
+
+    def __init__(self, timeout: float = PR_CREATE_TIMEOUT):
+        self.timeout = timeout
+
+    def create(self, repo_path: str, head: str, base: str, title: str, body: str) -> Dict[str, Any]:
+        cmd = ["gh", "pr", "create", "--title", title, "--body", body, "--head", head, "--base", base]
+        logger.info(f"🔧 执行命令: {' '.join(cmd[:6])}...")
+        try:
+            result = run_command(cmd, cwd=repo_path, timeout=self.timeout)
+        except subprocess.TimeoutExpired:
+            return {"success": False, "error": f"gh pr create 超时（{self.timeout:g} 秒）", "retryable": True, "timeout": True}
+        except FileNotFoundError:
+            return {"success": False, "error": GH_NOT_FOUND_ERROR, "retryable": False}
+
+        if result.returncode == 0:
+            return {"success": True, "pr_url": result.stdout.strip().splitlines()[-1], "output": result.stdout}
+
+        # 重试时 PR 可能已在上一次尝试中创建，gh 会在错误信息中给出已有 PR 的地址
+        existing = PR_URL_PATTERN.search(result.stderr) if "already exists" in result.stderr else None
+        if existing:
+            return {"success": True, "pr_url": existing.group(0), "existing": True, "output": result.stderr}
+
+        return {
+            "success": False,
+            "error": f"创建 PR 失败: {result.stderr.strip() or result.stdout.strip()}",
+            "retryable": not any(marker in result.stderr for marker in GH_PERMANENT_ERRORS)
+        }
+
+    def update(self, repo_path: str, pr_url: str, title: str, body: str) -> Dict[str, Any]:
+        cmd = ["gh", "pr", "edit", pr_url, "--title", title, "--body", body]
+        logger.info(f"🔧 执行命令: {' '.join(cmd[:4])}...")
+        try:
+            result = run_command(cmd, cwd=repo_path, timeout=self.timeout)
+        except subprocess.TimeoutExpired:
+            return {"success": False, "error": f"gh pr edit 超时（{self.timeout:g} 秒）"}
+        except FileNotFoundError:
+            return {"success": False, "error": GH_NOT_FOUND_ERROR}
+        if result.returncode == 0:
+            return {"success": True}
+        return {"success": False, "error": f"更新 PR 失败: {result.stderr.strip() or result.stdout.strip()}"}
+
+
+class GitHubRestClient(PullRequestClient):
+    """直接调用 GitHub REST API，进程内共享一个带连接池的 HTTP 客户端，不再为每个 PR 启动 gh"""
+
+    name = "rest"
+
+    def __init__(
+        self,
+        token: Optional[str] = GITHUB_TOKEN,
+        api_url: str = GITHUB_API_URL,
+        repository: Optional[str] = GITHUB_REPOSITORY,
+        timeout: float = PR_CREATE_TIMEOUT,
+        max_connections: int = GITHUB_MAX_CONNECTIONS
+    ):
+        """
+        初始化 REST 客户端
+
+        Args:
+            token: GitHub token（GITHUB_TOKEN 或 GH_TOKEN）
+            api_url: API 地址，GitHub Enterprise 或测试用的本地服务可以修改
+            repository: owner/repo，为空时从仓库的 origin 地址解析
+            timeout: 单个请求的超时（秒）
+            max_connections: 连接池大小
+        """
+        if not token:
+            raise RuntimeError("PR_CLIENT=rest 需要配置 GITHUB_TOKEN")
+        self.repository = repository
+        self._repositories: Dict[str, Tuple[str, str]] = {}
+        self._lock = threading.Lock()
+        self._client = httpx.Client(
+            base_url=api_url,
+            headers={
+                "Authorization": f"Bearer {token}",
+                "Accept": "application/vnd.github+json",
+                "X-GitHub-Api-Version": "2022-11-28",
+                "User-Agent": "linear-webhook-handler",
+            },
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=max_connections, max_keepalive_connections=max_connections)
+        )
+
+    def _repository(self, repo_path: str) -> Tuple[str, str]:
+        """解析 owner/repo，每个仓库只读取一次 origin 地址"""
+        if self.repository:
+            owner, _, name = self.repository.partition("/")
+            return owner, name
+        with self._lock:
+            if repo_path not in self._repositories:
+                url = run_git(["remote", "get-url", "origin"], cwd=repo_path).stdout.strip()
+                match = GITHUB_REMOTE_PATTERN.search(url)
+                if not match:
+                    raise ValueError(f"无法从远程地址解析 GitHub 仓库: {url}，请配置 GITHUB_REPOSITORY")
+                self._repositories[repo_path] = (match.group("owner"), match.group("name"))
+            return self._repositories[repo_path]
+
+    def create(self, repo_path: str, head: str, base: str, title: str, body: str) -> Dict[str, Any]:
+        try:
+            owner, name = self._repository(repo_path)
+        except (ValueError, subprocess.CalledProcessError) as e:
+            return {"success": False, "error": str(e), "retryable": False}
+
+        logger.info(f"🔧 POST /repos/{owner}/{name}/pulls (head={head}, base={base})")
+        try:
+            response = self._client.post(
+                f"/repos/{owner}/{name}/pulls",
+                json={"title": title, "body": body, "head": head, "base": base}
+            )
+            if response.status_code == 201:
+                return {"success": True, "pr_url": response.json()["html_url"]}
+            if response.status_code == 422 and "already exists" in response.text:
+                existing = self._find_open(owner, name, head, base)
+                if existing:
+                    return {"success": True, "pr_url": existing, "existing": True}
+        except httpx.TimeoutException as e:
+            return {"success": False, "error": f"GitHub API 超时: {e}", "retryable": True, "timeout": True}
+        except httpx.TransportError as e:
+            return {"success": False, "error": f"GitHub API 连接失败: {e}", "retryable": True}
+
+        return self._failure(response)
+
+    def update(self, repo_path: str, pr_url: str, title: str, body: str) -> Dict[str, Any]:
+        try:
+            owner, name = self._repository(repo_path)
+        except (ValueError, subprocess.CalledProcessError) as e:
+            return {"success": False, "error": str(e)}
+
+        number = pr_url.rstrip("/").rsplit("/", 1)[-1]
+        logger.info(f"🔧 PATCH /repos/{owner}/{name}/pulls/{number}")
+        try:
+            response = self._client.patch(f"/repos/{owner}/{name}/pulls/{number}", json={"title": title, "body": body})
+        except httpx.HTTPError as e:
+            return {"success": False, "error": f"GitHub API 请求失败: {e}"}
+        if response.status_code == 200:
+            return {"success": True}
+        return {"success": False, "error": f"更新 PR 失败: HTTP {response.status_code} {response.text[:500]}"}
+
+    def _find_open(self, owner: str, name: str, head: str, base: str) -> Optional[str]:
+        """查找同一分支已打开的 PR（上一次尝试已经创建成功但响应丢失时）"""
+        response = self._client.get(
+            f"/repos/{owner}/{name}/pulls",
+            params={"head": f"{owner}:{head}", "base": base, "state": "open"}
+        )
+        if response.status_code == 200 and response.json():
+            return response.json()[0]["html_url"]
+        return None
+
+    def _failure(self, response: httpx.Response) -> Dict[str, Any]:
+        """限流和服务端错误可以重试，其余 4xx 是请求本身的问题"""
+        rate_limited = response.status_code == 429 or (
+            response.status_code == 403
+            and (response.headers.get("retry-after") or response.headers.get("x-ratelimit-remaining") == "0")
+        )
+        result = {
+            "success": False,
+            "error": f"创建 PR 失败: HTTP {response.status_code} {response.text[:500]}",
+            "retryable": rate_limited or response.status_code >= 500
+        }
+        if response.headers.get("retry-after", "").isdigit():
+            result["retry_after"] = int(response.headers["retry-after"])
+        return result
+
+    def close(self):
+        self._client.close()
+
+
+def create_pr_client(name: str = PR_CLIENT) -> PullRequestClient:
+    """按名称创建 PR 客户端；auto 在配置了 GITHUB_TOKEN 时使用 REST API"""
+    if name == "auto":
+        name = "rest" if GITHUB_TOKEN else "gh"
+    if name == "rest":
+        return GitHubRestClient()
+    if name == "gh":
+        return GhCliClient()
+    raise ValueError(f"不支持的 PR_CLIENT: {name}，可选 gh、rest、auto")
+
+
+pr_client = create_pr_client()
+logger.info(f"🔧 PR 客户端: {pr_client.name}")
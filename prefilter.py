@@ -0,0 +1,167 @@
+from typing import Any, Dict, List, Optional
+import json
+import logging
+import threading
+
+try:
+    import orjson
+except ImportError:  # orjson 为可选依赖，未安装时使用标准库 json
+    orjson = None
+
+logger = logging.getLogger(__name__)
+
+VIBE_CODING_LABEL = "vibe-coding"
+
+
+def loads_payload(body: bytes) -> Any:
+    """解析请求体，优先使用 orjson（直接处理 bytes，无需先 decode）"""
+    if orjson is not None:
+        return orjson.loads(body)
+    return json.loads(body.decode("utf-8"))
+
+
+def label_names(labels: Any) -> List[str]:
+    """提取标签名，忽略格式不正确的条目"""
+    if not isinstance(labels, list):
+        return []
+    return [label.get("name") or "" for label in labels if isinstance(label, dict)]
+
+
+def vibe_coding_label_added(data: Dict[str, Any], updated_from: Optional[Dict[str, Any]]) -> bool:
+    """判断 vibe-coding 标签是否刚刚被添加（没有 updatedFrom 标签信息时，以当前是否包含该标签为准）"""
+    new_labels = label_names(data.get("labels"))
+    new_names = {name.lower() for name in new_labels}
+
+    if updated_from and "labels" in updated_from:
+        old_labels = label_names(updated_from.get("labels"))
+        old_names = {name.lower() for name in old_labels}
+        added = VIBE_CODING_LABEL not in old_names and VIBE_CODING_LABEL in new_names
+        if added:
+            logger.info("✅ 检测到 vibe-coding 标签刚刚被添加")
+        else:
+            logger.info("🚫 vibe-coding 标签未新增，跳过事件")
+        logger.info(f"旧标签: {old_labels}")
+        logger.info(f"新标签: {new_labels}")
+        return added
+
+    # 如果没有 updated_from 信息，这种情况可能是第一次处理该 Issue
+    added = VIBE_CODING_LABEL in new_names
+    if added:
+        logger.info("✅ 首次检测到包含 vibe-coding 标签的 Issue")
+    else:
+        logger.info("🚫 Issue 不包含 vibe-coding 标签")
+    logger.info(f"当前标签: {new_labels}")
+    return added
+
+
+def prefilter_webhook(payload_data: Any) -> Optional[Dict[str, Any]]:
+    """
+    在 Pydantic 校验和数据库操作之前，直接基于解析后的字典判断事件是否需要处理
+
+    Args:
+        payload_data: 解析后的请求体
+
+    Returns:
+        跳过事件时返回响应内容；需要继续处理（或格式异常、交给完整校验报错）时返回 None
+    """
+    if not isinstance(payload_data, dict):
+        return None
+
+    entity_type = payload_data.get("type")
+    action = payload_data.get("action")
+    data = payload_data.get("data")
+    if not isinstance(entity_type, str) or not isinstance(action, str) or not isinstance(data, dict):
+        return None
+
+    entity_id = data.get("id", "unknown")
+
+    # 只处理 Issue 标签变更事件，且必须包含 vibe-coding 标签
+    if entity_type != "Issue" or action != "update":
+        logger.info(f"🚫 跳过非 Issue 更新事件: {entity_type} - {action}")
+        return {
+            "status": "skipped",
+            "message": f"只处理 Issue 更新事件，当前事件: {entity_type} - {action}",
+            "entity_type": entity_type,
+            "action": action,
+            "entity_id": entity_id
+        }
+
+    updated_from = payload_data.get("updatedFrom")
+    if not isinstance(updated_from, dict):
+        updated_from = None
+
+    if not vibe_coding_label_added(data, updated_from):
+        return {
+            "status": "skipped",
+            "message": "vibe-coding 标签未新增，跳过事件",
+            "entity_type": entity_type,
+            "action": action,
+            "entity_id": entity_id,
+            "current_labels": label_names(data.get("labels"))
+        }
+    return None
+
+
+def coalesce_key(entity_type: str, entity_id: str) -> str:
+    """同一实体的任务合并键"""
+    return f"{entity_type}:{entity_id}"
+
+
+def refresh_coalesce_key(payload_data: Any) -> Optional[str]:
+    """
+    被预过滤跳过的 Issue 更新（状态、描述等修改）如果仍带有 vibe-coding 标签，返回其合并键
+
+    该 Issue 有排队中的任务时，事件会继续处理，用最新的 Issue 状态取代排队中的任务。
+    """
+    if not isinstance(payload_data, dict):
+        return None
+    data = payload_data.get("data")
+    if payload_data.get("type") != "Issue" or payload_data.get("action") != "update" or not isinstance(data, dict):
+        return None
+    if VIBE_CODING_LABEL not in {name.lower() for name in label_names(data.get("labels"))}:
+        return None
+    return coalesce_key("Issue", data.get("id", "unknown"))
+
+
+class PrefilterStats:
+    """预过滤统计：跳过率，以及按相关事件的平均校验耗时估算被跳过事件节省的时间"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._total = 0
+        self._skipped = 0
+        self._prefilter_seconds = 0.0
+        self._validated = 0
+        self._validation_seconds = 0.0
+
+    def record_prefilter(self, seconds: float, skipped: bool):
+        """记录一次解析+预过滤的耗时与结果"""
+        with self._lock:
+            self._total += 1
+            self._prefilter_seconds += seconds
+            if skipped:
+                self._skipped += 1
+
+    def record_validation(self, seconds: float):
+        """记录通过预过滤的事件在 Pydantic 校验上花费的时间"""
+        with self._lock:
+            self._validated += 1
+            self._validation_seconds += seconds
+
+    def stats(self) -> Dict[str, Any]:
+        """统计信息：节省时间 = 平均校验耗时 × 跳过的事件数"""
+        with self._lock:
+            average_validation = self._validation_seconds / self._validated if self._validated else 0.0
+            return {
+                "parser": "orjson" if orjson is not None else "json",
+                "total": self._total,
+                "skipped": self._skipped,
+                "skip_rate": round(self._skipped / self._total, 4) if self._total else 0.0,
+                "average_prefilter_ms": round(self._prefilter_seconds / self._total * 1000, 3) if self._total else 0.0,
+                "average_validation_ms": round(average_validation * 1000, 3),
+                "seconds_saved": round(self._skipped * average_validation, 6)
+            }
+
+
+# 进程级共享的预过滤统计
+prefilter_stats = PrefilterStats()
@@ -0,0 +1,258 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Callable, Dict, Iterator, List, Optional
+import asyncio
+import codecs
+import logging
+import os
+import signal
+import subprocess
+import threading
+
+logger = logging.getLogger(__name__)
+
+# 子进程管理配置
+PROCESS_KILL_GRACE = float(os.getenv("PROCESS_KILL_GRACE", "5"))
+PROCESS_CHECK_INTERVAL = 0.2
+PROCESS_LINE_LIMIT = 1024 * 1024
+
+# 输出回调：接收 (行内容, 流名称)，返回需要写入 stdin 的内容（用于自动应答交互式提示）
+OutputCallback = Callable[[str, str], Optional[str]]
+
+# 当前线程所属任务的取消信号
+_cancel_event: ContextVar[Optional[threading.Event]] = ContextVar("cancel_event", default=None)
+
+
+class CommandCancelled(Exception):
+    """命令因任务被取消而终止"""
+
+
+@contextmanager
+def cancellation_scope(event: threading.Event) -> Iterator[threading.Event]:
+    """在此范围内执行的命令会在 event 被设置时终止整个进程组"""
+    token = _cancel_event.set(event)
+    try:
+        yield event
+    finally:
+        _cancel_event.reset(token)
+
+
+def current_cancel_event() -> Optional[threading.Event]:
+    """当前任务的取消信号，供不经过 run_command 的长时间操作（例如常驻 aider worker）自行检查"""
+    return _cancel_event.get()
+
+
+@contextmanager
+def uncancellable() -> Iterator[None]:
+    """此范围内的命令不受任务取消影响（例如取消后仍需执行的清理操作）"""
+    token = _cancel_event.set(None)
+    try:
+        yield
+    finally:
+        _cancel_event.reset(token)
+
+
+class _RunnerLoop:
+    """专用于子进程管理的后台事件循环，供同步代码（任务线程）提交命令"""
+
+    def __init__(self):
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+
+    def submit(self, coroutine):
+        with self._lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name="process-runner", daemon=True).start()
+        return asyncio.run_coroutine_threadsafe(coroutine, self._loop).result()
+
+
+_runner = _RunnerLoop()
+
+
+def _kill_group(pgid: int, sig: int = signal.SIGKILL):
+    try:
+        os.killpg(pgid, sig)
+    except ProcessLookupError:
+        pass
+
+
+async def _terminate_group(process: asyncio.subprocess.Process):
+    """先 SIGTERM 整个进程组，宽限期后仍未退出则 SIGKILL"""
+    _kill_group(process.pid, signal.SIGTERM)
+    deadline = asyncio.get_running_loop().time() + PROCESS_KILL_GRACE
+    while process.returncode is None and asyncio.get_running_loop().time() < deadline:
+        await asyncio.sleep(PROCESS_CHECK_INTERVAL)
+    if process.returncode is None:
+        _kill_group(process.pid)
+
+
+async def _run(
+    cmd: List[str],
+    cwd: Optional[str],
+    env: Optional[Dict[str, str]],
+    timeout: Optional[float],
+    idle_timeout: Optional[float],
+    on_output: Optional[OutputCallback],
+    cancel_event: Optional[threading.Event],
+    input: Optional[bytes] = None,
+    text: bool = True
+):
+    """并发读取 stdout/stderr（以及写入 stdin），按总时长、无输出时长和取消信号终止进程组"""
+    process = await asyncio.create_subprocess_exec(
+        *cmd,
+        cwd=cwd,
+        env=env,
+        stdin=subprocess.PIPE if on_output or input is not None else subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+        start_new_session=True,  # 独立进程组，终止时连同 aider 启动的 git 等子进程一起结束
+        limit=PROCESS_LINE_LIMIT
+    )
+    loop = asyncio.get_running_loop()
+    started = last_output = loop.time()
+    captured = {"stdout": [], "stderr": []}
+
+    async def emit(line: str, name: str):
+        if on_output is None:
+            captured[name].append(line)
+            return
+        reply = on_output(line, name)
+        if reply and process.stdin and not process.stdin.is_closing():
+            process.stdin.write(reply.encode("utf-8"))
+            await process.stdin.drain()
+
+    async def pump(stream: asyncio.StreamReader, name: str):
+        nonlocal last_output
+        # 按块读取后自行切分行：readline() 遇到超长的行会丢弃已缓冲的部分；
+        # 增量解码保证被切在两个块之间的多字节字符不会变成替换字符
+        decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        pending = ""
+        while True:
+            data = await stream.read(PROCESS_LINE_LIMIT)
+            if data:
+                last_output = loop.time()
+            if not text:
+                # 二进制输出（例如 git cat-file --batch）不按行切分
+                if not data:
+                    return
+                captured[name].append(data)
+                continue
+
+            pending += decoder.decode(data, final=not data)
+            *lines, pending = pending.split("\n")
+            for line in lines:
+                await emit(line + "\n", name)
+            # 单行超过上限时先交出已读到的部分，内存占用不随行长度增长
+            if pending and (not data or len(pending) >= PROCESS_LINE_LIMIT):
+                await emit(pending, name)
+                pending = ""
+            if not data:
+                return
+
+    async def feed():
+        # 与读取并发写入，输入较大时不会因输出管道写满而互相等待
+        try:
+            process.stdin.write(input)
+            await process.stdin.drain()
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+        finally:
+            process.stdin.close()
+
+    streams = [pump(process.stdout, "stdout"), pump(process.stderr, "stderr")]
+    if input is not None:
+        streams.append(feed())
+    readers = asyncio.ensure_future(asyncio.gather(*streams))
+    # Process.wait() 在部分 Python 版本中要等输出管道关闭才返回，这里直接检查退出码
+    reason = None
+    while process.returncode is None:
+        if readers.done():
+            # 输出已读完，等待进程退出
+            try:
+                await asyncio.wait_for(process.wait(), PROCESS_CHECK_INTERVAL)
+            except asyncio.TimeoutError:
+                pass
+        else:
+            await asyncio.wait({readers}, timeout=PROCESS_CHECK_INTERVAL)
+        if process.returncode is not None:
+            break
+        now = loop.time()
+        if cancel_event is not None and cancel_event.is_set():
+            reason = "cancelled"
+        elif timeout and now - started > timeout:
+            reason = "timeout"
+        elif idle_timeout and now - last_output > idle_timeout:
+            reason = "idle"
+        if reason:
+            break
+
+    if reason:
+        logger.warning(f"⏹️  终止进程组 {process.pid} ({reason}): {' '.join(cmd[:3])}")
+        await _terminate_group(process)
+
+    # 主进程已退出，但后台子进程可能仍持有输出管道：宽限期后结束进程组中剩余的进程
+    try:
+        await asyncio.wait_for(asyncio.shield(readers), PROCESS_KILL_GRACE)
+    except asyncio.TimeoutError:
+        _kill_group(process.pid)
+        try:
+            await asyncio.wait_for(readers, PROCESS_KILL_GRACE)
+        except asyncio.TimeoutError:
+            logger.warning(f"⚠️  进程组 {process.pid} 之外的进程仍持有输出管道，不再读取剩余输出")
+    if readers.done():
+        await process.wait()
+
+    empty = "" if text else b""
+    return process.returncode, empty.join(captured["stdout"]), empty.join(captured["stderr"]), reason
+
+
+def run_command(
+    cmd: List[str],
+    cwd: Optional[str] = None,
+    env: Optional[Dict[str, str]] = None,
+    check: bool = False,
+    timeout: Optional[float] = None,
+    idle_timeout: Optional[float] = None,
+    on_output: Optional[OutputCallback] = None,
+    input: Optional[bytes] = None,
+    text: bool = True
+) -> subprocess.CompletedProcess:
+    """
+    执行命令直到结束（同步接口，由后台事件循环管理子进程）
+
+    Args:
+        cmd: 命令及参数
+        cwd: 工作目录
+        env: 环境变量，默认继承当前进程
+        check: 返回码非 0 时抛出 CalledProcessError
+        timeout: 总时长上限（秒），超时终止进程组并抛出 TimeoutExpired
+        idle_timeout: 无任何输出的时长上限（秒），超时处理同上
+        on_output: 逐行输出回调；设置后输出不再收集到返回值中，并允许回调向 stdin 写入应答
+        input: 写入 stdin 的内容，写完后关闭 stdin（不能与 on_output 同时使用）
+        text: 为 False 时 stdout/stderr 以 bytes 返回，不做解码
+
+    Returns:
+        与 subprocess.run(capture_output=True, text=text) 相同的 CompletedProcess
+
+    Raises:
+        CommandCancelled: 当前任务被取消
+    """
+    cancel_event = _cancel_event.get()
+    if cancel_event is not None and cancel_event.is_set():
+        raise CommandCancelled(f"任务已取消，未执行: {' '.join(cmd[:3])}")
+
+    returncode, stdout, stderr, reason = _runner.submit(
+        _run(list(cmd), cwd, env, timeout, idle_timeout, on_output, cancel_event, input, text)
+    )
+
+    if reason == "cancelled":
+        raise CommandCancelled(f"任务已取消，已终止: {' '.join(cmd[:3])}")
+    if reason is not None:
+        limit = timeout if reason == "timeout" else idle_timeout
+        raise subprocess.TimeoutExpired(cmd, limit, output=stdout, stderr=stderr)
+
+    result = subprocess.CompletedProcess(cmd, returncode, stdout, stderr)
+    if check:
+        result.check_returncode()
+    return result
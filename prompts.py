@@ -0,0 +1,333 @@
+from string import Formatter
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+import json
+import logging
+import os
+import re
+
+from file_selection import BYTES_PER_TOKEN
+
+logger = logging.getLogger(__name__)
+
+# prompt 的 token 预算（按 BYTES_PER_TOKEN 估算）：总预算，以及描述、评论串各自的上限，0 表示不限制
+PROMPT_TOKEN_BUDGET = int(os.getenv("PROMPT_TOKEN_BUDGET", "8000"))
+PROMPT_DESCRIPTION_TOKENS = int(os.getenv("PROMPT_DESCRIPTION_TOKENS", "4000"))
+PROMPT_COMMENTS_TOKENS = int(os.getenv("PROMPT_COMMENTS_TOKENS", "2000"))
+# 评论串中单条评论的上限，避免一条超长评论挤掉其他评论
+PROMPT_COMMENT_TOKENS = int(os.getenv("PROMPT_COMMENT_TOKENS", "500"))
+
+# 摘要时优先保留的段落：以标题、列表、复选框开头，或开头部分包含描述需求的关键词
+_PRIORITY_START = re.compile(r"\s*(#{1,6}\s|[-*+]\s|\d+[.)]\s)")
+_PRIORITY_KEYWORDS = ("must", "should", "acceptance", "expected", "需要", "必须", "验收", "期望")
+_PRIORITY_SCAN_CHARS = 300
+# 摘要只扫描文本开头预算若干倍的部分，超长描述的末尾直接省略，避免在 webhook 请求中逐段处理数 MB 文本
+PROMPT_SUMMARY_SCAN_FACTOR = int(os.getenv("PROMPT_SUMMARY_SCAN_FACTOR", "16"))
+
+Reducer = Callable[[Any, int], str]
+
+
+def estimate_tokens(text: str) -> int:
+    """粗略估算 token 数，与文件选择使用同一口径"""
+    return len(text.encode("utf-8")) // BYTES_PER_TOKEN
+
+
+def _fits(text: str, budget: int) -> bool:
+    # UTF-8 每个字符最多 4 字节，短文本无需编码即可判断
+    return len(text) * 4 <= budget * BYTES_PER_TOKEN or estimate_tokens(text) <= budget
+
+
+def truncate_text(text: str, budget: int) -> str:
+    """按预算截断，尽量在换行处断开"""
+    if budget <= 0 or _fits(text, budget):
+        return text
+    limit = budget * BYTES_PER_TOKEN
+    head = text.encode("utf-8")[:limit].decode("utf-8", errors="ignore")
+    cut = head.rfind("\n")
+    if cut > len(head) // 2:
+        head = head[:cut]
+    return f"{head.rstrip()}\n[… 已截断，省略 {len(text) - len(head)} 字符]"
+
+
+def _blocks(text: str) -> List[str]:
+    """按空行切分段落，代码块整体作为一段"""
+    blocks, current, in_code = [], [], False
+    for line in text.splitlines():
+        if line.lstrip().startswith("```"):
+            in_code = not in_code
+        if not line.strip() and not in_code:
+            if current:
+                blocks.append("\n".join(current))
+                current = []
+            continue
+        current.append(line)
+    if current:
+        blocks.append("\n".join(current))
+    return blocks
+
+
+def _block_priority(index: int, block: str) -> int:
+    """0: 第一段，1: 标题/列表/需求，2: 普通段落，3: 代码块"""
+    if index == 0:
+        return 0
+    if block.startswith("```") or block.lstrip().startswith("```"):
+        return 3
+    if _PRIORITY_START.match(block):
+        return 1
+    head = block[:_PRIORITY_SCAN_CHARS].lower()
+    if any(keyword in head for keyword in _PRIORITY_KEYWORDS):
+        return 1
+    return 2
+
+
+def summarize_text(text: str, budget: int) -> str:
+    """
+    超出预算的长文本做抽取式摘要
+
+    保留第一段，然后依次保留标题/列表/需求关键词所在的段落、普通段落，代码块最后；
+    放不下的段落以省略标记代替，输出保持原文顺序。
+    只处理开头 PROMPT_SUMMARY_SCAN_FACTOR 倍预算的内容，其余部分整体省略。
+    """
+    if budget <= 0 or _fits(text, budget):
+        return text
+
+    scan_limit = budget * BYTES_PER_TOKEN * PROMPT_SUMMARY_SCAN_FACTOR if PROMPT_SUMMARY_SCAN_FACTOR > 0 else len(text)
+    tail = text[scan_limit:]
+    if tail:
+        # 在段落边界截断，避免把最后一段切成半段
+        cut = text.rfind("\n\n", 0, scan_limit)
+        if cut > scan_limit // 2:
+            tail = text[cut:]
+            scan_limit = cut
+    blocks = _blocks(text[:scan_limit])
+    priorities = [_block_priority(index, block) for index, block in enumerate(blocks)]
+
+    # 为省略标记预留空间
+    remaining = budget - 16
+    selected: Dict[int, str] = {}
+    for index in sorted(range(len(blocks)), key=lambda i: (priorities[i], i)):
+        if remaining <= 0:
+            break
+        block = blocks[index]
+        tokens = estimate_tokens(block) + 1
+        if tokens > remaining:
+            # 只截断高优先级段落，普通段落放不下就整段省略
+            if priorities[index] > 1 or remaining < 32:
+                continue
+            block = truncate_text(block, remaining - 8)
+            tokens = estimate_tokens(block) + 1
+        selected[index] = block
+        remaining -= tokens
+
+    parts, skipped = [], 0
+    for index, block in enumerate(blocks):
+        if index in selected:
+            if skipped:
+                parts.append(f"[… 省略 {skipped} 段]")
+                skipped = 0
+            parts.append(selected[index])
+        else:
+            skipped += 1
+    if skipped:
+        parts.append(f"[… 省略 {skipped} 段]")
+    if tail:
+        parts.append(f"[… 其余 {len(tail)} 字符未纳入摘要]")
+    logger.info(f"✂️  长文本摘要: {estimate_tokens(text)} -> 约 {budget} tokens，保留 {len(selected)}/{len(blocks)} 段")
+    return "\n\n".join(parts)
+
+
+def _comment_nodes(comments: Any) -> List[Dict[str, Any]]:
+    """评论可以是列表，也可以是 GraphQL 形式的 {"nodes": [...]}"""
+    if isinstance(comments, dict):
+        comments = comments.get("nodes") or []
+    return [comment for comment in comments or [] if isinstance(comment, dict) and comment.get("body")]
+
+
+def summarize_thread(comments: Any, budget: int) -> str:
+    """评论串按时间排列，预算不足时保留最新的评论，更早的评论只给出数量"""
+    nodes = sorted(_comment_nodes(comments), key=lambda comment: comment.get("createdAt") or "")
+    lines: List[str] = []
+    remaining = budget if budget > 0 else None
+    for comment in reversed(nodes):
+        user = (comment.get("user") or {}).get("name", "Unknown")
+        body = summarize_text(comment["body"].strip(), PROMPT_COMMENT_TOKENS)
+        line = f"- {user}: {body}"
+        if remaining is not None:
+            tokens = estimate_tokens(line) + 1
+            if tokens > remaining and lines:
+                break
+            remaining -= tokens
+        lines.append(line)
+    omitted = len(nodes) - len(lines)
+    if omitted:
+        lines.append(f"[… 更早的 {omitted} 条评论已省略]")
+    return "\n".join(reversed(lines))
+
+
+class PromptTemplate:
+    """预编译的模板：加载时把 {field} 占位符解析成片段，渲染时只做一次 join"""
+
+    def __init__(self, source: str):
+        self.segments: List[Tuple[str, Optional[str]]] = [
+            (literal, field) for literal, field, _, _ in Formatter().parse(source)
+        ]
+
+    def render(self, values: Dict[str, Any]) -> str:
+        parts = []
+        for literal, field in self.segments:
+            parts.append(literal)
+            if field is not None:
+                parts.append(str(values.get(field, "")))
+        return "".join(parts)
+
+
+class Section:
+    """prompt 中的一个部分：when 字段为空时整段省略；设置 reducer 时该字段按预算截断或摘要"""
+
+    def __init__(
+        self,
+        name: str,
+        template: str,
+        when: Optional[str] = None,
+        field: Optional[str] = None,
+        budget: int = 0,
+        reducer: Optional[Reducer] = None
+    ):
+        self.name = name
+        self.template = PromptTemplate(template)
+        self.when = when
+        self.field = field
+        self.budget = budget
+        self.reducer = reducer
+
+
+class PromptSpec:
+    """按顺序渲染各部分；可压缩部分的预算取自身上限与总预算剩余部分中的较小值"""
+
+    def __init__(self, sections: Sequence[Section], budget: int = PROMPT_TOKEN_BUDGET):
+        self.sections = list(sections)
+        self.budget = budget
+
+    def render(self, values: Dict[str, Any]) -> str:
+        active = [section for section in self.sections if section.when is None or values.get(section.when)]
+        rendered: Dict[str, str] = {}
+
+        fixed_tokens = 0
+        for section in active:
+            if section.reducer is None:
+                rendered[section.name] = section.template.render(values)
+                fixed_tokens += estimate_tokens(rendered[section.name])
+
+        remaining = self.budget - fixed_tokens if self.budget > 0 else None
+        for section in active:
+            if section.reducer is None:
+                continue
+            budget = section.budget
+            if remaining is not None:
+                # 总预算已被固定部分占满时仍保留一小段，避免完全丢失描述
+                budget = min(budget, remaining) if budget > 0 else remaining
+                budget = max(budget, 64)
+            content = section.reducer(values.get(section.field), budget)
+            rendered[section.name] = section.template.render({**values, section.field: content})
+            if remaining is not None:
+                remaining -= estimate_tokens(rendered[section.name])
+
+        return "".join(rendered[section.name] for section in active)
+
+
+ISSUE_PROMPT = PromptSpec([
+    Section("header", "Linear Issue {action}: {identifier} - {title}\nTeam: {team_name} ({team_key})\nState: {state}\n"),
+    Section("assignee", "Assignee: {assignee}\n", when="assignee"),
+    Section("labels", "Labels: {labels}\n{vibe_marker}", when="labels"),
+    Section("description", "Description:\n{description}\n", when="description",
+            field="description", budget=PROMPT_DESCRIPTION_TOKENS, reducer=summarize_text),
+    Section("comments", "Comments:\n{comments}\n", when="comments",
+            field="comments", budget=PROMPT_COMMENTS_TOKENS, reducer=summarize_thread),
+    Section("url", "URL: {url}\n"),
+    Section("task", (
+        "\n🤖 AI CODING TASK:\n"
+        "Please analyze this Linear Issue and implement the requested changes in the WoodenMan project.\n"
+        "Focus on the issue description and any specific requirements mentioned.\n"
+        "Make sure to create meaningful commits and a clear PR description.\n"
+    )),
+])
+
+COMMENT_PROMPT = PromptSpec([
+    Section("header", "Linear Comment {action}\nUser: {user}\nIssue: {issue_identifier} - {issue_title}\n"),
+    Section("body", "Comment:\n{body}\n", field="body", budget=PROMPT_DESCRIPTION_TOKENS, reducer=summarize_text),
+    Section("issue", "\nIssue Context:\n- Issue ID: {issue_id}\n- Issue URL: {issue_url}\n", when="issue"),
+    Section("issue_state", "- Issue State: {issue_state}\n", when="issue_state"),
+    Section("issue_team", "- Team: {issue_team_name} ({issue_team_key})\n", when="issue_team_name"),
+])
+
+REACTION_PROMPT = PromptSpec([
+    Section("header", "Linear Reaction {action}: {emoji}\nUser: {user}\nComment: {comment}\n"),
+])
+
+GENERIC_PROMPT = PromptSpec([
+    Section("body", "Linear {entity_type} {action}: {data}", field="data", budget=PROMPT_TOKEN_BUDGET, reducer=truncate_text),
+])
+
+
+def build_issue_prompt(action: str, data: dict) -> str:
+    """Issue 事件的 aider prompt"""
+    team = data.get("team") or {}
+    labels = [label.get("name", "") for label in data.get("labels") or []]
+    vibe_coding = any(name.lower() == "vibe-coding" for name in labels)
+    return ISSUE_PROMPT.render({
+        "action": action.upper(),
+        "identifier": data.get("identifier", ""),
+        "title": data.get("title", ""),
+        "team_name": team.get("name", "Unknown"),
+        "team_key": team.get("key", ""),
+        "state": (data.get("state") or {}).get("name", "Unknown"),
+        "assignee": (data.get("assignee") or {}).get("name", "Unknown") if data.get("assignee") else "",
+        "labels": ", ".join(labels),
+        "vibe_marker": "🎯 VIBE-CODING LABEL DETECTED - This issue requires AI coding assistance!\n" if vibe_coding else "",
+        "description": data.get("description") or "",
+        "comments": _comment_nodes(data.get("comments")),
+        "url": data.get("url", ""),
+    })
+
+
+def build_comment_prompt(action: str, data: dict) -> str:
+    """Comment 事件的 aider prompt，附带所属 Issue 的上下文"""
+    issue = data.get("issue") or {}
+    return COMMENT_PROMPT.render({
+        "action": action.upper(),
+        "user": (data.get("user") or {}).get("name", "Unknown"),
+        "issue_identifier": issue.get("identifier", "Unknown"),
+        "issue_title": issue.get("title", ""),
+        "body": data.get("body", ""),
+        "issue": bool(issue),
+        "issue_id": issue.get("id", "Unknown"),
+        "issue_url": issue.get("url", "Unknown"),
+        "issue_state": (issue.get("state") or {}).get("name", "Unknown") if issue.get("state") else "",
+        "issue_team_name": (issue.get("team") or {}).get("name", "Unknown") if issue.get("team") else "",
+        "issue_team_key": (issue.get("team") or {}).get("key", ""),
+    })
+
+
+def build_reaction_prompt(action: str, data: dict) -> str:
+    """Reaction 事件的 aider prompt，只引用评论开头"""
+    body = (data.get("comment") or {}).get("body", "")
+    return REACTION_PROMPT.render({
+        "action": action.upper(),
+        "emoji": data.get("emoji", ""),
+        "user": (data.get("user") or {}).get("name", "Unknown"),
+        "comment": body[:100] + ("..." if len(body) > 100 else ""),
+    })
+
+
+def build_prompt(action: str, entity_type: str, data: dict) -> str:
+    """按实体类型构建 aider prompt"""
+    if entity_type == "Issue":
+        return build_issue_prompt(action, data)
+    if entity_type == "Comment":
+        return build_comment_prompt(action, data)
+    if entity_type == "Reaction":
+        return build_reaction_prompt(action, data)
+    return GENERIC_PROMPT.render({
+        "entity_type": entity_type,
+        "action": action,
+        "data": json.dumps(data, ensure_ascii=False, indent=2),
+    })
@@ -0,0 +1,219 @@
+from typing import Any, Dict, Optional, Set, Tuple
+import hashlib
+import logging
+import os
+import subprocess
+import threading
+import time
+
+from sqlmodel import Session, select
+
+from database import engine
+from git_backend import git_backend, run_git
+from metrics import PR_CREATE_DURATION, PUBLISH_ATTEMPTS_TOTAL
+from models import Job
+from pr_client import pr_client
+from process_runner import uncancellable
+from repo_sync import REPO_REMOTE
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+# 发布阶段（推送分支 + 创建 PR）的任务类型与 worker 数量，与 aider 任务分开执行
+PUBLISH_JOB_KIND = "publish"
+PUBLISH_WORKERS = int(os.getenv("PUBLISH_WORKERS", "4"))
+
+# 失败重试：最多执行次数，第 n 次重试前等待 PUBLISH_RETRY_BACKOFF * 2^(n-1) 秒，不超过上限
+PUBLISH_MAX_ATTEMPTS = int(os.getenv("PUBLISH_MAX_ATTEMPTS", "5"))
+PUBLISH_RETRY_BACKOFF = float(os.getenv("PUBLISH_RETRY_BACKOFF", "5"))
+PUBLISH_RETRY_BACKOFF_MAX = float(os.getenv("PUBLISH_RETRY_BACKOFF_MAX", "300"))
+
+
+class _PushBatch:
+    def __init__(self):
+        # 分支名 -> (要推送的提交, 远程分支应当指向的提交，None 表示远程分支应当不存在)
+        self.branches: Dict[str, Tuple[str, Optional[str]]] = {}
+        self.results: Dict[str, Dict[str, Any]] = {}
+        self.done = False
+
+
+class PushBatcher:
+    """
+    合并同一仓库的并发推送
+
+    同一仓库同时只有一个 git push 在执行；执行期间到达的分支进入下一批，
+    上一次推送结束后由其中一个线程用一条 git push 推送整批分支，只需一次连接和协商。
+    """
+
+    def __init__(self, remote: str = REPO_REMOTE):
+        self.remote = remote
+        self._condition = threading.Condition()
+        self._waiting: Dict[str, _PushBatch] = {}
+        self._pushing: Set[str] = set()
+
+    def push(self, repo_path: str, branch: str, commit: str, expected: Optional[str]) -> Dict[str, Any]:
+        """
+        将提交推送到远程分支，返回该分支的结果（success、error、retryable、stale、batch_size）
+
+        远程分支只在仍指向 expected（为 None 时要求分支不存在）时才会被更新（--force-with-lease），
+        因此可以用重新构建的提交覆盖本服务上一次推送的内容，但不会覆盖其他人推送的提交。
+        """
+        with self._condition:
+            batch = self._waiting.get(repo_path)
+            if batch is None:
+                batch = self._waiting[repo_path] = _PushBatch()
+            batch.branches[branch] = (commit, expected)
+
+            # 等待上一批推送完成，由最先发现仓库空闲的线程推送这一批
+            while not batch.done:
+                if repo_path not in self._pushing and self._waiting.get(repo_path) is batch:
+                    del self._waiting[repo_path]
+                    self._pushing.add(repo_path)
+                    break
+                self._condition.wait()
+            else:
+                return batch.results[branch]
+
+        try:
+            # 推送结果由整批分支共享，不随当前任务取消而中断
+            with uncancellable():
+                batch.results = self._push(repo_path, dict(sorted(batch.branches.items())))
+        except Exception as e:
+            batch.results = {name: {"success": False, "error": f"推送失败: {e}", "retryable": True} for name in batch.branches}
+        finally:
+            with self._condition:
+                batch.done = True
+                self._pushing.discard(repo_path)
+                self._condition.notify_all()
+        return batch.results[branch]
+
+    def _push(self, repo_path: str, branches: Dict[str, Tuple[str, Optional[str]]]) -> Dict[str, Dict[str, Any]]:
+        """一条 git push 推送多个分支，按 --porcelain 输出区分每个分支的结果"""
+        logger.info(f"⬆️  推送 {len(branches)} 个分支到 {self.remote}: {', '.join(branches)}")
+        leases = [f"--force-with-lease=refs/heads/{name}:{expected or ''}" for name, (_, expected) in branches.items()]
+        refspecs = [f"{commit}:refs/heads/{name}" for name, (commit, _) in branches.items()]
+        result = run_git(["push", "--porcelain", *leases, self.remote, *refspecs], cwd=repo_path, check=False)
+
+        statuses = {}
+        for line in result.stdout.splitlines():
+            parts = line.split("\t")
+            if len(parts) >= 3 and ":" in parts[1]:
+                statuses[parts[1].split(":", 1)[1]] = (parts[0], parts[2])
+
+        results = {}
+        for name in branches:
+            flag, summary = statuses.get(f"refs/heads/{name}", (None, ""))
+            if flag is None:
+                # 没有逐个分支的结果，通常是连接或认证失败
+                results[name] = {"success": False, "error": f"推送失败: {result.stderr.strip()}", "retryable": True}
+            elif flag == "!":
+                # 被远程拒绝（远程分支已被其他提交更新、钩子拒绝），重试也不会成功
+                results[name] = {
+                    "success": False, "error": f"推送被拒绝: {summary}", "retryable": False, "stale": "stale info" in summary
+                }
+            else:
+                results[name] = {"success": True, "up_to_date": flag == "="}
+            results[name]["batch_size"] = len(branches)
+        return results
+
+
+push_batcher = PushBatcher()
+
+
+def publish_coalesce_key(repo_path: str, branch_name: str) -> str:
+    """同一仓库同一分支的发布任务合并键：按顺序执行，排队中的旧任务被新任务取代"""
+    return f"publish:{hashlib.sha1(repo_path.encode('utf-8')).hexdigest()[:12]}:{branch_name}"
+
+
+def _published_commit(coalesce_key: str) -> Optional[str]:
+    """同一分支最近一次由发布任务推送的提交（包括推送成功但创建 PR 失败的任务），从未推送过时返回 None"""
+    with Session(engine) as session:
+        results = session.exec(
+            select(Job.result)
+            .where(Job.coalesce_key == coalesce_key)
+            .order_by(Job.id.desc())
+        ).all()
+    for result in results:
+        if result and result.get("pushed_commit"):
+            return result["pushed_commit"]
+    return None
+
+
+def _remote_commit(repo_path: str, branch_name: str) -> Optional[str]:
+    """远程分支当前指向的提交，分支不存在时返回 None；无法连接远程时抛出 CalledProcessError"""
+    result = run_git(["ls-remote", REPO_REMOTE, f"refs/heads/{branch_name}"], cwd=repo_path)
+    return result.stdout.split("\t", 1)[0] or None
+
+
+def _remote_commit_or_none(repo_path: str, branch_name: str) -> Optional[str]:
+    """远程分支当前指向的提交，读取失败时返回 None"""
+    try:
+        return _remote_commit(repo_path, branch_name)
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired):
+        return None
+
+
+def publish_branch(job_id: int, payload: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    发布任务处理函数 - 推送 aider 任务提交的分支并创建 PR
+
+    每次重试都重新推送（已推送的分支不会重复传输）；PR 已存在时视为成功，重试是幂等的。
+    同一 Issue 的后续任务（重复投递、合并后的新任务、缓存回放）推送到同一分支，覆盖上一次发布的提交并更新已有的 PR。
+    """
+    repo_path = payload["repo_path"]
+    branch_name = payload["branch_name"]
+    # 旧版本入队的任务没有记录提交，推送本地分支当前指向的提交
+    commit = payload.get("head") or git_backend.resolve(repo_path, f"refs/heads/{branch_name}")
+    expected = _published_commit(publish_coalesce_key(repo_path, branch_name))
+    if expected is None:
+        # 没有发布记录（旧版本推送的分支、手动创建的分支）：以远程分支当前指向的提交作为租约，由本服务接管
+        try:
+            expected = _remote_commit(repo_path, branch_name)
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired) as e:
+            PUBLISH_ATTEMPTS_TOTAL.inc(stage="push", outcome="retryable")
+            logger.error(f"❌ 任务 {job_id}: 读取远程分支 {branch_name} 失败: {e.stderr}")
+            return {"success": False, "error": f"读取远程分支失败: {e.stderr}", "retryable": True, "stage": "push", "branch_name": branch_name}
+
+    with span("git_push") as record:
+        push = push_batcher.push(repo_path, branch_name, commit, expected)
+        if record is not None:
+            record["attributes"] = {"batch_size": push.get("batch_size", 1)}
+    if push.get("stale") and _remote_commit_or_none(repo_path, branch_name) == commit:
+        # 上一次尝试已经推送成功，只是没有来得及记录结果（例如进程在推送后退出）
+        push = {"success": True, "up_to_date": True, "batch_size": push.get("batch_size", 1)}
+    if not push["success"]:
+        PUBLISH_ATTEMPTS_TOTAL.inc(stage="push", outcome="retryable" if push.get("retryable") else "failure")
+        logger.error(f"❌ 任务 {job_id}: 推送分支 {branch_name} 失败: {push['error']}")
+        return {**push, "stage": "push", "branch_name": branch_name}
+    logger.info(f"✅ 推送分支 {branch_name} ({commit[:8]}) 成功")
+
+    pr_started = time.perf_counter()
+    with span("pr_create", client=pr_client.name):
+        pr = pr_client.create(repo_path, branch_name, payload.get("base", "main"), payload["title"], payload["body"])
+    if pr["success"]:
+        outcome = "success"
+    else:
+        outcome = "timeout" if pr.get("timeout") else "failure"
+    PR_CREATE_DURATION.observe(time.perf_counter() - pr_started, outcome=outcome)
+
+    if not pr["success"]:
+        PUBLISH_ATTEMPTS_TOTAL.inc(stage="pr", outcome="retryable" if pr.get("retryable") else "failure")
+        logger.error(f"❌ 任务 {job_id}: {pr['error']}")
+        return {**pr, "stage": "pr", "branch_name": branch_name, "pushed_commit": commit}
+
+    if pr.get("existing"):
+        # 同一 Issue 的后续任务：分支已更新，PR 的标题和描述也换成最新的 Issue 内容；更新失败不影响发布结果
+        with span("pr_update", client=pr_client.name):
+            updated = pr_client.update(repo_path, pr["pr_url"], payload["title"], payload["body"])
+        if not updated["success"]:
+            logger.warning(f"⚠️  任务 {job_id}: {updated['error']}")
+
+    PUBLISH_ATTEMPTS_TOTAL.inc(stage="pr", outcome="success")
+    logger.info(f"🎉 {'PR 已存在' if pr.get('existing') else '创建 PR 成功'}: {pr['pr_url']}")
+    return {
+        "success": True,
+        "branch_name": branch_name,
+        "pushed_commit": commit,
+        "pr_url": pr["pr_url"],
+        "existing": bool(pr.get("existing"))
+    }
@@ -0,0 +1,393 @@
+from collections import Counter
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+import ast
+import hashlib
+import json
+import logging
+import math
+import os
+import re
+import sqlite3
+import threading
+
+try:
+    import fcntl
+except ImportError:  # 非 POSIX 平台没有 fcntl，只在进程内加锁
+    fcntl = None
+
+from git_backend import run_git
+
+logger = logging.getLogger(__name__)
+
+# 索引文件存放目录
+REPO_INDEX_DIR = os.getenv("REPO_INDEX_DIR", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".repo_index"))
+
+# 建立索引时跳过的目录
+EXCLUDED_DIRS = {"__pycache__", ".git", "venv", "env", ".venv", ".env", "node_modules"}
+
+# BM25 参数
+BM25_K1 = 1.5
+BM25_B = 0.75
+
+_IDENTIFIER_RE = re.compile(r"[A-Za-z_][A-Za-z0-9_]*")
+_CAMEL_RE = re.compile(r"[A-Z]+(?=[A-Z][a-z])|[A-Z]?[a-z]+|[A-Z]+|[0-9]+")
+
+STOPWORDS = {
+    "the", "and", "for", "this", "that", "with", "from", "are", "was", "not", "but", "have", "has",
+    "you", "your", "will", "can", "should", "into", "any", "all", "make", "sure", "please", "issue",
+    "linear", "self", "none", "true", "false", "return", "import", "def", "class", "if", "else", "in",
+    "is", "of", "to", "on", "or", "be", "it", "as", "an", "at", "by"
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+CREATE TABLE IF NOT EXISTS blobs (
+    blob_sha TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    length INTEGER NOT NULL,
+    terms TEXT NOT NULL,
+    symbols TEXT NOT NULL,
+    imports TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    blob_sha TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    length INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS postings (
+    term TEXT NOT NULL,
+    path TEXT NOT NULL,
+    tf INTEGER NOT NULL,
+    PRIMARY KEY (term, path)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ix_postings_path ON postings (path);
+CREATE TABLE IF NOT EXISTS symbols (
+    name TEXT NOT NULL,
+    path TEXT NOT NULL,
+    PRIMARY KEY (name, path)
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS ix_symbols_path ON symbols (path);
+CREATE TABLE IF NOT EXISTS imports (
+    path TEXT NOT NULL,
+    module TEXT NOT NULL,
+    PRIMARY KEY (path, module)
+) WITHOUT ROWID;
+"""
+
+
+def tokenize(text: str) -> List[str]:
+    """将文本拆分为小写词项，同时拆分 snake_case 和 camelCase 标识符"""
+    tokens = []
+    for identifier in _IDENTIFIER_RE.findall(text):
+        parts = [identifier.lower()]
+        for piece in identifier.split("_"):
+            parts.extend(part.lower() for part in _CAMEL_RE.findall(piece))
+        for part in set(parts):
+            if len(part) > 1 and part not in STOPWORDS:
+                tokens.append(part)
+    return tokens
+
+
+def analyze_source(source: str) -> Tuple[Set[str], Set[str]]:
+    """提取模块中定义的符号（类、函数、顶层变量）和导入的模块"""
+    try:
+        tree = ast.parse(source)
+    except (SyntaxError, ValueError):
+        return set(), set()
+
+    symbols = set()
+    imports = set()
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.ClassDef)):
+            symbols.add(node.name)
+        elif isinstance(node, ast.Import):
+            imports.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            imports.add(node.module)
+    for node in tree.body:
+        if isinstance(node, ast.Assign):
+            for target in node.targets:
+                if isinstance(target, ast.Name):
+                    symbols.add(target.id)
+    return symbols, imports
+
+
+def bm25(frequency: int, document_frequency: int, total: int, length: int, average_length: float) -> float:
+    """单个词项的 BM25 得分"""
+    idf = math.log(1 + (total - document_frequency + 0.5) / (document_frequency + 0.5))
+    length_norm = BM25_K1 * (1 - BM25_B + BM25_B * length / (average_length or 1.0))
+    return idf * frequency * (BM25_K1 + 1) / (frequency + length_norm)
+
+
+def is_indexed_path(path: str) -> bool:
+    """是否为需要建立索引的 Python 文件"""
+    relative = Path(path)
+    return relative.suffix == ".py" and not EXCLUDED_DIRS.intersection(relative.parts[:-1])
+
+
+def _git(args: List[str], cwd: str, input: Optional[bytes] = None) -> bytes:
+    # 经由 run_git 执行：受任务取消和超时控制，并计入 git 命令耗时指标
+    return run_git(args, cwd=cwd, input=input, text=False).stdout
+
+
+class RepoIndex:
+    """持久化的仓库索引 - 以 blob 哈希为键存储文件、符号、导入和大小，按 git diff 增量更新"""
+
+    def __init__(self, repo_path: str, db_path: Optional[str] = None):
+        """
+        初始化仓库索引
+
+        Args:
+            repo_path: 仓库或其任意工作树的路径，同一对象库的工作树共享一个索引
+            db_path: SQLite 文件路径，默认位于 REPO_INDEX_DIR 下
+        """
+        common_dir = _git(["rev-parse", "--path-format=absolute", "--git-common-dir"], str(Path(repo_path).resolve())).decode().strip()
+        # 工作树用完即删，读取对象统一在共享的 git 目录中执行
+        self.repo_path = common_dir
+        if db_path is None:
+            name = f"{Path(common_dir).parent.name}-{hashlib.sha1(common_dir.encode()).hexdigest()[:10]}.db"
+            db_path = os.path.join(REPO_INDEX_DIR, name)
+        self.db_path = db_path
+        Path(self.db_path).parent.mkdir(parents=True, exist_ok=True)
+
+        self._lock = threading.RLock()
+        with self._connect() as conn:
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self) -> Iterator[sqlite3.Connection]:
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def indexed_commit(self) -> Optional[str]:
+        """返回索引当前对应的提交"""
+        with self._connect() as conn:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'commit'").fetchone()
+        return row[0] if row else None
+
+    @contextmanager
+    def _exclusive(self) -> Iterator[None]:
+        """索引只保存一个提交的状态，同步和基于该状态的查询在进程内和进程间互斥"""
+        with self._lock:
+            if fcntl is None:
+                yield
+                return
+            with open(self.db_path + ".lock", "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def sync(self, commit: str = "HEAD", worktree: Optional[str] = None) -> str:
+        """
+        将索引同步到指定提交
+
+        首次同步遍历整个提交树；之后只根据 git diff 处理变化的文件，
+        内容未变的 blob 直接复用已解析的结果。
+        只同步不查询时使用；需要读取该提交的文件或排序时使用 snapshot()。
+
+        Args:
+            commit: 提交或引用
+            worktree: 在该工作树中解析引用（例如工作树自己的 HEAD），默认在主仓库中解析
+        """
+        with self.snapshot(commit, worktree) as resolved:
+            return resolved
+
+    @contextmanager
+    def snapshot(self, commit: str = "HEAD", worktree: Optional[str] = None) -> Iterator[str]:
+        """
+        同步到指定提交，并在退出前保持该状态
+
+        HEAD 不同的工作树并发使用同一索引时，期间其他任务（包括其他进程）不会把索引移到另一个提交，
+        files()、rank()、size_of() 等查询读到的都是该提交的文件。
+        """
+        commit = _git(["rev-parse", "--verify", f"{commit}^{{commit}}"], worktree or self.repo_path).decode().strip()
+        with self._exclusive():
+            previous = self.indexed_commit()
+            if previous != commit:
+                if previous and self._has_commit(previous):
+                    changes = self._changed_files(previous, commit)
+                    logger.info(f"📇 增量更新索引 {previous[:8]} -> {commit[:8]}，变化文件 {len(changes)} 个")
+                else:
+                    changes = self._all_files(commit)
+                    logger.info(f"📇 全量构建索引 {commit[:8]}，文件 {len(changes)} 个")
+                self._apply(commit, changes)
+            yield commit
+
+    def files(self) -> List[str]:
+        """返回已索引的文件（相对路径）"""
+        with self._connect() as conn:
+            return [row[0] for row in conn.execute("SELECT path FROM files ORDER BY path")]
+
+    def file_count(self) -> int:
+        with self._connect() as conn:
+            return conn.execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    def size_of(self, path: str) -> int:
+        with self._connect() as conn:
+            row = conn.execute("SELECT size FROM files WHERE path = ?", (path,)).fetchone()
+        return row[0] if row else 0
+
+    def imports_of(self, path: str) -> List[str]:
+        with self._connect() as conn:
+            return [row[0] for row in conn.execute("SELECT module FROM imports WHERE path = ? ORDER BY module", (path,))]
+
+    def rank(self, query: str) -> List[Tuple[str, float]]:
+        """按与查询文本的相关度对文件排序，只读取查询词项的倒排记录"""
+        query_terms = sorted(set(tokenize(query)))
+        if not query_terms:
+            return []
+
+        placeholders = ",".join("?" * len(query_terms))
+        with self._connect() as conn:
+            total, total_length = conn.execute("SELECT COUNT(*), COALESCE(SUM(length), 0) FROM files").fetchone()
+            if not total:
+                return []
+            average_length = total_length / total
+
+            document_frequency = dict(conn.execute(
+                f"SELECT term, COUNT(*) FROM postings WHERE term IN ({placeholders}) GROUP BY term",
+                query_terms
+            ))
+            postings = conn.execute(
+                f"SELECT p.term, p.path, p.tf, f.length FROM postings p JOIN files f ON f.path = p.path "
+                f"WHERE p.term IN ({placeholders})",
+                query_terms
+            ).fetchall()
+            symbol_hits = conn.execute(
+                f"SELECT path, COUNT(*) FROM symbols WHERE name IN ({placeholders}) GROUP BY path",
+                query_terms
+            ).fetchall()
+
+        scores: Dict[str, float] = Counter()
+        for term, path, frequency, length in postings:
+            scores[path] += bm25(frequency, document_frequency[term], total, length, average_length)
+
+        # 查询中直接提到的符号或文件名更可能是需要修改的文件
+        query_set = set(query_terms)
+        for path, hits in symbol_hits:
+            scores[path] += 2.0 * hits
+        for path in list(scores):
+            scores[path] += 1.0 * len(query_set & set(tokenize(Path(path).stem)))
+
+        ranked = [(path, score) for path, score in scores.items() if score > 0]
+        ranked.sort(key=lambda item: (-item[1], item[0]))
+        return ranked
+
+    def _has_commit(self, commit: str) -> bool:
+        return run_git(["cat-file", "-e", f"{commit}^{{commit}}"], cwd=self.repo_path, check=False).returncode == 0
+
+    def _all_files(self, commit: str) -> Dict[str, Optional[str]]:
+        """列出提交中所有需要索引的文件及其 blob 哈希"""
+        output = _git(["ls-tree", "-r", "-z", commit], self.repo_path).decode("utf-8", errors="surrogateescape")
+        files = {}
+        for entry in output.split("\0"):
+            if not entry:
+                continue
+            info, path = entry.split("\t", 1)
+            _, kind, blob_sha = info.split()
+            if kind == "blob" and is_indexed_path(path):
+                files[path] = blob_sha
+        return files
+
+    def _changed_files(self, old: str, new: str) -> Dict[str, Optional[str]]:
+        """对比两个提交，返回变化文件的新 blob 哈希（删除的文件为 None）"""
+        output = _git(["diff", "--raw", "--no-abbrev", "--no-renames", "-z", old, new, "--", "*.py"], self.repo_path).decode("utf-8", errors="surrogateescape")
+        fields = output.split("\0")
+        changes = {}
+        for index in range(0, len(fields) - 1, 2):
+            info, path = fields[index], fields[index + 1]
+            if not info.startswith(":") or not is_indexed_path(path):
+                continue
+            _, _, _, new_sha, status = info[1:].split()
+            changes[path] = None if status == "D" else new_sha
+        return changes
+
+    def _read_blobs(self, blob_shas: Iterable[str]) -> Dict[str, bytes]:
+        """通过 git cat-file --batch 一次性读取多个 blob"""
+        blob_shas = list(blob_shas)
+        if not blob_shas:
+            return {}
+        output = _git(["cat-file", "--batch"], self.repo_path, input=("\n".join(blob_shas) + "\n").encode())
+        contents = {}
+        position = 0
+        while position < len(output):
+            header_end = output.index(b"\n", position)
+            header = output[position:header_end].decode().split()
+            position = header_end + 1
+            if len(header) < 3:
+                continue
+            size = int(header[2])
+            contents[header[0]] = output[position:position + size]
+            position += size + 1
+        return contents
+
+    def _apply(self, commit: str, changes: Dict[str, Optional[str]]):
+        """将文件变化写入索引"""
+        with self._connect() as conn:
+            new_shas = {sha for sha in changes.values() if sha}
+            known = set()
+            for chunk in _chunks(sorted(new_shas), 500):
+                placeholders = ",".join("?" * len(chunk))
+                known.update(row[0] for row in conn.execute(f"SELECT blob_sha FROM blobs WHERE blob_sha IN ({placeholders})", chunk))
+
+            # 只解析索引中没有的 blob
+            for blob_sha, content in self._read_blobs(new_shas - known).items():
+                source = content.decode("utf-8", errors="ignore")
+                terms = Counter(tokenize(source))
+                symbols, imports = analyze_source(source)
+                conn.execute(
+                    "INSERT OR REPLACE INTO blobs (blob_sha, size, length, terms, symbols, imports) VALUES (?, ?, ?, ?, ?, ?)",
+                    (blob_sha, len(content), sum(terms.values()), json.dumps(terms), json.dumps(sorted(symbols)), json.dumps(sorted(imports)))
+                )
+
+            for path, blob_sha in changes.items():
+                conn.execute("DELETE FROM files WHERE path = ?", (path,))
+                conn.execute("DELETE FROM postings WHERE path = ?", (path,))
+                conn.execute("DELETE FROM symbols WHERE path = ?", (path,))
+                conn.execute("DELETE FROM imports WHERE path = ?", (path,))
+                if blob_sha is None:
+                    continue
+
+                row = conn.execute("SELECT size, length, terms, symbols, imports FROM blobs WHERE blob_sha = ?", (blob_sha,)).fetchone()
+                if row is None:
+                    continue
+                size, length, terms_json, symbols_json, imports_json = row
+                terms = Counter(json.loads(terms_json))
+                # 文件路径本身也参与检索
+                terms.update(tokenize(path))
+
+                conn.execute("INSERT INTO files (path, blob_sha, size, length) VALUES (?, ?, ?, ?)", (path, blob_sha, size, length + len(tokenize(path))))
+                conn.executemany("INSERT INTO postings (term, path, tf) VALUES (?, ?, ?)", [(term, path, tf) for term, tf in terms.items()])
+                conn.executemany("INSERT INTO symbols (name, path) VALUES (?, ?)", [(name.lower(), path) for name in set(s.lower() for s in json.loads(symbols_json))])
+                conn.executemany("INSERT INTO imports (path, module) VALUES (?, ?)", [(path, module) for module in json.loads(imports_json)])
+
+            conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('commit', ?)", (commit,))
+
+
+def _chunks(items: List[str], size: int) -> Iterator[List[str]]:
+    for start in range(0, len(items), size):
+        yield items[start:start + size]
+
+
+_indexes: Dict[str, RepoIndex] = {}
+_indexes_lock = threading.Lock()
+
+
+def get_repo_index(repo_path: str) -> RepoIndex:
+    """获取仓库对应的持久化索引（同一对象库的所有工作树共享）"""
+    common_dir = _git(["rev-parse", "--path-format=absolute", "--git-common-dir"], str(Path(repo_path).resolve())).decode().strip()
+    with _indexes_lock:
+        if common_dir not in _indexes:
+            _indexes[common_dir] = RepoIndex(repo_path)
+        return _indexes[common_dir]
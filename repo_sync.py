@@ -0,0 +1,210 @@
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+import logging
+import os
+import subprocess
+import threading
+import time
+
+from git_backend import git_backend, run_git
+
+logger = logging.getLogger(__name__)
+
+# 目标仓库来源：本地路径或远程 URL，为空时直接使用已有的本地仓库（没有 .git 时就地初始化）
+TARGET_REPO_URL = os.getenv("TARGET_REPO_URL") or None
+TARGET_REPO_BRANCH = os.getenv("TARGET_REPO_BRANCH", "main")
+
+# 首次克隆的过滤器（blob:none 为只下载提交和树、文件内容按需获取）与深度（0 表示完整历史）
+REPO_CLONE_FILTER = os.getenv("REPO_CLONE_FILTER", "blob:none")
+REPO_CLONE_DEPTH = int(os.getenv("REPO_CLONE_DEPTH", "0"))
+
+# 后台 fetch 基准分支的间隔（秒），任务开始时距上次 fetch 超过该时间也会先 fetch（0 表示不 fetch）
+REPO_FETCH_INTERVAL = float(os.getenv("REPO_FETCH_INTERVAL", "60"))
+
+REPO_REMOTE = "origin"
+
+
+class RepoSync:
+    """目标仓库同步 - 按需从配置的来源克隆，并定期只 fetch 基准分支"""
+
+    def __init__(
+        self,
+        path: str,
+        url: Optional[str] = TARGET_REPO_URL,
+        branch: str = TARGET_REPO_BRANCH,
+        clone_filter: str = REPO_CLONE_FILTER,
+        depth: int = REPO_CLONE_DEPTH,
+        fetch_interval: float = REPO_FETCH_INTERVAL
+    ):
+        """
+        初始化仓库同步
+
+        Args:
+            path: 本地仓库路径（例如 WoodenMan）
+            url: 克隆来源，本地路径或远程 URL
+            branch: 基准分支
+            clone_filter: 部分克隆过滤器，空字符串表示完整克隆
+            depth: 浅克隆深度，0 表示完整历史
+            fetch_interval: 后台 fetch 间隔（秒）
+        """
+        self.path = Path(path).resolve()
+        self.url = url
+        self.branch = branch
+        self.clone_filter = clone_filter
+        self.depth = max(0, depth)
+        self.fetch_interval = fetch_interval
+
+        self.has_remote = False
+        self.last_fetch: Optional[float] = None
+        self._listeners: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_ref(self) -> str:
+        """任务分支的起点：有远程仓库时为 fetch 下来的远程跟踪分支"""
+        return f"{REPO_REMOTE}/{self.branch}" if self.has_remote else self.branch
+
+    def add_listener(self, listener: Callable[[], None]):
+        """注册基准分支更新后的回调（例如唤醒工作树预热池）"""
+        with self._lock:
+            if listener not in self._listeners:
+                self._listeners.append(listener)
+
+    def ensure(self):
+        """本地仓库不存在时克隆（或就地初始化），并确认是否配置了远程仓库"""
+        with self._lock:
+            if not (self.path / ".git").exists():
+                if self.url:
+                    self._clone()
+                else:
+                    logger.info(f"📁 {self.path} 没有 git 仓库，正在初始化...")
+                    commit = git_backend.init_repository(str(self.path), self.branch)
+                    logger.info(f"✅ Git 仓库初始化完成，初始提交 {commit[:8]}")
+
+            remotes = run_git(["remote"], cwd=str(self.path), check=False).stdout.split()
+            if REPO_REMOTE not in remotes or self.fetch_interval <= 0 or self.last_fetch is not None:
+                return
+            self.has_remote = True
+            try:
+                self._fetch()
+            except subprocess.CalledProcessError as e:
+                # 暂时无法访问远程仓库：已有远程跟踪分支时继续使用，否则退回本地分支
+                tracking = run_git(["rev-parse", "--verify", "--quiet", f"refs/remotes/{REPO_REMOTE}/{self.branch}"], cwd=str(self.path), check=False)
+                self.has_remote = tracking.returncode == 0
+                logger.warning(f"⚠️  fetch 失败，任务将基于 {self.base_ref}: {e.stderr}")
+
+    def _clone_url(self) -> str:
+        """本地路径使用 file:// 协议，否则 git 会忽略 --filter 和 --depth"""
+        if os.path.isdir(self.url):
+            return Path(self.url).resolve().as_uri()
+        return self.url
+
+    def _clone(self):
+        cmd = ["clone", "--single-branch", "--branch", self.branch, "--origin", REPO_REMOTE]
+        if self.clone_filter:
+            cmd.append(f"--filter={self.clone_filter}")
+        if self.depth:
+            cmd.extend(["--depth", str(self.depth)])
+        cmd.extend([self._clone_url(), str(self.path)])
+
+        logger.info(f"📥 克隆 {self.url} 到 {self.path} (filter={self.clone_filter or '无'}, depth={self.depth or '完整'})...")
+        started = time.perf_counter()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        run_git(cmd, cwd=str(self.path.parent))
+        run_git(["config", "user.name", "Linear Webhook Handler"], cwd=str(self.path))
+        run_git(["config", "user.email", "webhook@linear.app"], cwd=str(self.path))
+        logger.info(f"✅ 克隆完成，耗时 {time.perf_counter() - started:.1f} 秒")
+
+    def _fetch(self) -> bool:
+        """只 fetch 基准分支到远程跟踪分支，返回其是否移动（调用方持有锁）"""
+        tracking = f"refs/remotes/{REPO_REMOTE}/{self.branch}"
+        before = run_git(["rev-parse", "--verify", "--quiet", tracking], cwd=str(self.path), check=False).stdout.strip()
+        run_git(["fetch", "--quiet", "--no-tags", REPO_REMOTE, f"+refs/heads/{self.branch}:{tracking}"], cwd=str(self.path))
+        after = run_git(["rev-parse", "--verify", tracking], cwd=str(self.path)).stdout.strip()
+        self.last_fetch = time.monotonic()
+
+        if before == after:
+            return False
+        logger.info(f"🔄 {self.base_ref} 已更新: {before[:8] or '无'} -> {after[:8]}")
+        return True
+
+    def fetch(self) -> bool:
+        """fetch 基准分支，移动时通知监听者"""
+        with self._lock:
+            if not self.has_remote:
+                return False
+            changed = self._fetch()
+            listeners = list(self._listeners)
+        if changed:
+            for listener in listeners:
+                listener()
+        return changed
+
+    def ensure_fresh(self):
+        """距上次 fetch 超过间隔时先 fetch；fetch 失败时继续使用本地已有的基准分支"""
+        if not self.has_remote:
+            return
+        if self.last_fetch is not None and time.monotonic() - self.last_fetch < self.fetch_interval:
+            return
+        try:
+            self.fetch()
+        except subprocess.CalledProcessError as e:
+            logger.warning(f"⚠️  fetch {self.base_ref} 失败，使用本地版本: {e.stderr}")
+
+    def start(self):
+        """启动后台定期 fetch 线程"""
+        if self._thread or not self.has_remote:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._fetch_loop, name="repo-sync", daemon=True)
+        self._thread.start()
+        logger.info(f"🔁 仓库同步已启动，每 {self.fetch_interval:g} 秒 fetch {self.base_ref}")
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+
+    def _fetch_loop(self):
+        while not self._stop.wait(self.fetch_interval):
+            try:
+                self.fetch()
+            except Exception as e:
+                logger.error(f"fetch {self.base_ref} 失败: {str(e)}")
+
+
+_syncs: Dict[str, RepoSync] = {}
+_syncs_lock = threading.Lock()
+# 每个仓库路径一把锁：首次克隆可能很慢，只阻塞同一仓库的调用方
+_path_locks: Dict[str, threading.Lock] = {}
+
+
+def get_repo_sync(repo_path: str) -> RepoSync:
+    """获取仓库对应的同步器（进程内共享，首次获取时克隆/初始化并启动后台 fetch）"""
+    key = str(Path(repo_path).resolve())
+    with _syncs_lock:
+        if key in _syncs:
+            return _syncs[key]
+        path_lock = _path_locks.setdefault(key, threading.Lock())
+
+    with path_lock:
+        with _syncs_lock:
+            if key in _syncs:
+                return _syncs[key]
+        repo_sync = RepoSync(key)
+        repo_sync.ensure()
+        repo_sync.start()
+        with _syncs_lock:
+            _syncs[key] = repo_sync
+        return repo_sync
+
+
+def stop_repo_syncs():
+    """停止所有后台 fetch 线程"""
+    with _syncs_lock:
+        syncs = list(_syncs.values())
+    for repo_sync in syncs:
+        repo_sync.stop()
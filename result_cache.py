@@ -0,0 +1,183 @@
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from sqlmodel import Session, select
+from sqlalchemy import delete, func, update
+from sqlalchemy.dialects.postgresql import insert as postgresql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from typing import Iterator, List, Optional
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+from database import engine
+from git_backend import run_git
+from metrics import RESULT_CACHE_TOTAL
+from models import ResultCacheEntry
+from payload_store import compress_payload, decompress_payload
+from vibe import resolve_aider_model
+
+logger = logging.getLogger(__name__)
+
+# aider 结果缓存：相同 prompt、基准提交和所选文件再次触发时回放之前的补丁，不再调用 aider
+RESULT_CACHE_ENABLED = os.getenv("RESULT_CACHE_ENABLED", "true").lower() == "true"
+# 缓存总容量上限（压缩后字节数），超出时淘汰最久未使用的条目
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+# 单个补丁的上限（原始字节数），更大的改动不缓存
+RESULT_CACHE_MAX_ENTRY_BYTES = int(os.getenv("RESULT_CACHE_MAX_ENTRY_BYTES", str(8 * 1024 * 1024)))
+# 超过该天数未使用的条目被淘汰（0 表示不按时间淘汰）
+RESULT_CACHE_TTL_DAYS = float(os.getenv("RESULT_CACHE_TTL_DAYS", "30"))
+
+
+@contextmanager
+def _patch_file(data: Optional[bytes] = None) -> Iterator[str]:
+    """工作树之外的临时补丁文件，用完删除"""
+    fd, path = tempfile.mkstemp(prefix="vibe-result-", suffix=".patch")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            if data:
+                f.write(data)
+        yield path
+    finally:
+        os.unlink(path)
+
+
+class ResultCache:
+    """
+    aider 结果缓存
+
+    键为 prompt、基准提交、所选文件集合和 aider 模型的哈希，值为 aider 在该基准提交上产生的
+    git diff --binary 补丁（压缩存储在数据库中，多个进程共享）。命中时在新工作树中 git apply 后直接提交。
+    写入时淘汰过期条目，并按最近使用时间淘汰到容量上限以内。
+    """
+
+    def __init__(
+        self,
+        enabled: bool = RESULT_CACHE_ENABLED,
+        max_bytes: int = RESULT_CACHE_MAX_BYTES,
+        max_entry_bytes: int = RESULT_CACHE_MAX_ENTRY_BYTES,
+        ttl_days: float = RESULT_CACHE_TTL_DAYS
+    ):
+        self.enabled = enabled and max_bytes > 0
+        self.max_bytes = max_bytes
+        self.max_entry_bytes = max_entry_bytes
+        self.ttl_days = ttl_days
+
+    def key(self, prompt: str, base_commit: Optional[str], files: Optional[List[str]]) -> Optional[str]:
+        """缓存键；基准提交未知时不缓存"""
+        if not self.enabled or not base_commit:
+            return None
+        # files 为 None 表示交给 aider 全部文件，与空列表（由 aider 自行选择）区分
+        material = json.dumps(
+            [prompt, base_commit, sorted(files) if files is not None else None, resolve_aider_model()],
+            ensure_ascii=False
+        )
+        return hashlib.sha256(material.encode("utf-8")).hexdigest()
+
+    def lookup(self, key: Optional[str]) -> Optional[bytes]:
+        """读取补丁并更新最近使用时间，未命中返回 None"""
+        if key is None:
+            return None
+        with Session(engine) as session:
+            entry = session.get(ResultCacheEntry, key)
+            if entry is None:
+                RESULT_CACHE_TOTAL.inc(outcome="miss")
+                return None
+            patch = decompress_payload(entry.codec, entry.data)
+            session.execute(
+                update(ResultCacheEntry)
+                .where(ResultCacheEntry.key == key)
+                .values(hits=ResultCacheEntry.hits + 1, last_used_at=datetime.utcnow())
+            )
+            session.commit()
+        RESULT_CACHE_TOTAL.inc(outcome="hit")
+        return patch
+
+    def replay(self, worktree_dir: str, key: Optional[str]) -> bool:
+        """
+        命中时将补丁应用到工作树（同时写入索引），返回是否已应用
+
+        补丁无法应用时（例如工作树内容与基准提交不一致）删除该条目，由调用方照常执行 aider。
+        """
+        patch = self.lookup(key)
+        if patch is None:
+            return False
+        with _patch_file(patch) as path:
+            result = run_git(["apply", "--index", "--binary", "--whitespace=nowarn", path], cwd=worktree_dir, check=False)
+        if result.returncode != 0:
+            logger.warning(f"⚠️  缓存的补丁无法应用，删除缓存并重新执行 aider: {result.stderr.strip()}")
+            RESULT_CACHE_TOTAL.inc(outcome="stale")
+            self.invalidate(key)
+            return False
+        logger.info(f"♻️  命中结果缓存 {key[:12]}，已回放 {len(patch)} 字节的补丁")
+        return True
+
+    def store(self, key: Optional[str], base_commit: str, worktree_dir: str) -> bool:
+        """保存工作树 HEAD 相对基准提交的改动（包括 aider 自己的提交），返回是否已写入"""
+        if key is None:
+            return False
+        with _patch_file() as path:
+            run_git(["diff", "--binary", "--no-color", "--no-ext-diff", f"--output={path}", base_commit, "HEAD"], cwd=worktree_dir)
+            with open(path, "rb") as f:
+                patch = f.read()
+        if not patch:
+            return False
+        if len(patch) > self.max_entry_bytes:
+            logger.info(f"补丁 {len(patch)} 字节超过 RESULT_CACHE_MAX_ENTRY_BYTES，不缓存")
+            RESULT_CACHE_TOTAL.inc(outcome="skipped")
+            return False
+
+        codec, data = compress_payload(patch)
+        values = {
+            "key": key, "base_commit": base_commit, "codec": codec,
+            "size": len(patch), "stored_size": len(data), "data": data
+        }
+        with Session(engine) as session:
+            dialect = session.get_bind().dialect.name
+            if dialect == "sqlite":
+                session.execute(sqlite_insert(ResultCacheEntry).values(**values).on_conflict_do_nothing(index_elements=["key"]))
+            elif dialect == "postgresql":
+                session.execute(postgresql_insert(ResultCacheEntry).values(**values).on_conflict_do_nothing(index_elements=["key"]))
+            elif session.get(ResultCacheEntry, key) is None:
+                session.add(ResultCacheEntry(**values))
+            session.commit()
+            self.evict(session)
+        RESULT_CACHE_TOTAL.inc(outcome="stored")
+        logger.info(f"💾 已缓存 aider 结果 {key[:12]}（补丁 {len(patch)} 字节，压缩后 {len(data)} 字节）")
+        return True
+
+    def invalidate(self, key: str):
+        with Session(engine) as session:
+            session.execute(delete(ResultCacheEntry).where(ResultCacheEntry.key == key))
+            session.commit()
+
+    def evict(self, session: Session) -> int:
+        """淘汰过期条目，再按最近使用时间从旧到新淘汰到容量上限以内，返回淘汰数量"""
+        evicted = 0
+        if self.ttl_days > 0:
+            cutoff = datetime.utcnow() - timedelta(days=self.ttl_days)
+            evicted += session.execute(delete(ResultCacheEntry).where(ResultCacheEntry.last_used_at < cutoff)).rowcount or 0
+
+        total = session.exec(select(func.coalesce(func.sum(ResultCacheEntry.stored_size), 0))).one()
+        if total > self.max_bytes:
+            victims = []
+            for key, stored_size in session.exec(
+                select(ResultCacheEntry.key, ResultCacheEntry.stored_size).order_by(ResultCacheEntry.last_used_at)
+            ):
+                if total <= self.max_bytes:
+                    break
+                victims.append(key)
+                total -= stored_size
+            session.execute(delete(ResultCacheEntry).where(ResultCacheEntry.key.in_(victims)))
+            evicted += len(victims)
+
+        session.commit()
+        if evicted:
+            RESULT_CACHE_TOTAL.inc(evicted, outcome="evicted")
+            logger.info(f"🧹 结果缓存淘汰 {evicted} 条")
+        return evicted
+
+
+# 进程级共享的结果缓存
+result_cache = ResultCache()
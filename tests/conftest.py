@@ -0,0 +1,67 @@
+import os
+import subprocess
+import sys
+import tempfile
+
+import pytest
+
+# 模块在导入时读取环境变量：测试使用临时数据库和日志目录，不影响本地的 linear_webhook.db
+_TEST_DIR = tempfile.mkdtemp(prefix="vibe-tests-")
+os.environ.setdefault("DATABASE_URL", f"sqlite:///{os.path.join(_TEST_DIR, 'test.db')}")
+os.environ.setdefault("JOB_LOG_DIR", os.path.join(_TEST_DIR, "job_logs"))
+os.environ.setdefault("WORKTREE_ROOT", os.path.join(_TEST_DIR, "worktrees"))
+
+# 测试仓库的提交身份，不依赖本机的 git 配置
+for _name in ("AUTHOR", "COMMITTER"):
+    os.environ.setdefault(f"GIT_{_name}_NAME", "Vibe Tests")
+    os.environ.setdefault(f"GIT_{_name}_EMAIL", "tests@example.com")
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+def git(cwd, *args) -> str:
+    return subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True, text=True).stdout.strip()
+
+
+def commit_file(repo, name, content, message=None) -> str:
+    """在仓库中写入文件并提交，返回提交 SHA"""
+    with open(os.path.join(repo, name), "w") as f:
+        f.write(content)
+    git(repo, "add", name)
+    git(repo, "commit", "-q", "-m", message or f"update {name}")
+    return git(repo, "rev-parse", "HEAD")
+
+
+@pytest.fixture
+def remote(tmp_path):
+    """带一个 main 分支提交的裸仓库"""
+    bare = str(tmp_path / "remote.git")
+    git(str(tmp_path), "init", "-q", "--bare", "-b", "main", bare)
+    seed = str(tmp_path / "seed")
+    git(str(tmp_path), "clone", "-q", bare, seed)
+    git(seed, "checkout", "-q", "-b", "main")
+    commit_file(seed, "README.md", "hello\n", "initial commit")
+    git(seed, "push", "-q", "origin", "main")
+    return bare
+
+
+@pytest.fixture
+def clone(tmp_path, remote):
+    """remote 的普通克隆"""
+    path = str(tmp_path / "clone")
+    git(str(tmp_path), "clone", "-q", remote, path)
+    return path
+
+
+@pytest.fixture
+def database():
+    """创建数据表，测试结束后清空任务表"""
+    import models  # noqa: F401 - 注册数据表
+    from database import create_db_and_tables, engine
+    from sqlmodel import Session, delete
+
+    create_db_and_tables()
+    yield engine
+    with Session(engine) as session:
+        session.exec(delete(models.Job))
+        session.commit()
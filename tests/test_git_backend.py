@@ -0,0 +1,52 @@
+import subprocess
+
+import pytest
+
+from conftest import commit_file, git
+from git_backend import Pygit2GitBackend, SubprocessGitBackend, pygit2
+
+BACKENDS = [SubprocessGitBackend]
+if pygit2 is not None:
+    BACKENDS.append(Pygit2GitBackend)
+
+
+@pytest.fixture(params=BACKENDS, ids=lambda cls: cls.name)
+def backend(request):
+    return request.param()
+
+
+def test_create_branch(backend, clone):
+    backend.create_branch(clone, "feature")
+    assert git(clone, "symbolic-ref", "HEAD") == "refs/heads/feature"
+    with pytest.raises(subprocess.CalledProcessError):
+        backend.create_branch(clone, "feature")
+
+
+def test_force_create_branch_resets_existing_branch(backend, clone):
+    base = git(clone, "rev-parse", "HEAD")
+    git(clone, "checkout", "-q", "-b", "feature")
+    commit_file(clone, "a.txt", "a\n")
+    git(clone, "checkout", "-q", "--detach", base)
+
+    backend.create_branch(clone, "feature", force=True)
+    assert git(clone, "symbolic-ref", "HEAD") == "refs/heads/feature"
+    assert git(clone, "rev-parse", "feature") == base
+
+
+def test_force_create_current_branch(backend, clone):
+    git(clone, "checkout", "-q", "-b", "feature")
+    head = commit_file(clone, "a.txt", "a\n")
+
+    # 与 git checkout -B 一致：分支就是当前 HEAD 时也可以重置
+    backend.create_branch(clone, "feature", force=True)
+    assert git(clone, "symbolic-ref", "HEAD") == "refs/heads/feature"
+    assert git(clone, "rev-parse", "feature") == head
+
+
+def test_commit_all(backend, clone):
+    assert backend.commit_all(clone, "nothing") is None
+    with open(f"{clone}/new.txt", "w") as f:
+        f.write("new\n")
+    commit = backend.commit_all(clone, "add new.txt")
+    assert commit == git(clone, "rev-parse", "HEAD")
+    assert backend.status(clone) == []
@@ -0,0 +1,53 @@
+import os
+import time
+
+import pytest
+
+import job_logs
+from job_logs import open_job_log, prune_job_logs, read_log_tail
+
+
+@pytest.fixture
+def log_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(job_logs, "JOB_LOG_DIR", str(tmp_path))
+    return tmp_path
+
+
+def _write_log(log_dir, job_id, age_days=0.0):
+    path = log_dir / f"job-{job_id}.log"
+    path.write_text(f"job {job_id}\n")
+    mtime = time.time() - age_days * 86400
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def test_prune_by_age(log_dir):
+    old = _write_log(log_dir, 1, age_days=30)
+    recent = _write_log(log_dir, 2, age_days=1)
+    assert prune_job_logs(max_age_days=14, max_files=0) == 1
+    assert not old.exists()
+    assert recent.exists()
+
+
+def test_prune_by_count_keeps_newest(log_dir):
+    paths = [_write_log(log_dir, job_id, age_days=10 - job_id) for job_id in range(1, 6)]
+    assert prune_job_logs(max_age_days=0, max_files=2) == 3
+    assert [path.exists() for path in paths] == [False, False, False, True, True]
+
+
+def test_active_log_is_kept(log_dir):
+    with open_job_log(7) as job_log:
+        job_log.write("running")
+        os.utime(job_logs.job_log_path(7), (0, 0))
+        assert prune_job_logs(max_age_days=1, max_files=0) == 0
+        assert read_log_tail(7) == ["running"]
+
+
+def test_finished_job_prunes_old_logs(log_dir, monkeypatch):
+    monkeypatch.setattr(job_logs, "JOB_LOG_MAX_FILES", 2)
+    for job_id in range(1, 4):
+        _write_log(log_dir, job_id, age_days=1)
+    with open_job_log(4) as job_log:
+        job_log.write("done")
+    assert read_log_tail(4) == ["done"]
+    assert sorted(path.name for path in log_dir.iterdir()) == ["job-3.log", "job-4.log"]
@@ -0,0 +1,26 @@
+import zlib
+
+import pytest
+
+import payload_store
+from payload_store import compress_payload, decompress_payload
+
+BODY = b'{"action": "create", "type": "Issue", "data": {"title": "hello"}}' * 50
+
+
+def test_round_trip():
+    codec, data = compress_payload(BODY)
+    assert codec == ("zstd" if payload_store.zstandard is not None else "zlib")
+    assert len(data) < len(BODY)
+    assert decompress_payload(codec, data) == BODY
+
+
+def test_zlib_payload_is_always_readable():
+    assert decompress_payload("zlib", zlib.compress(BODY)) == BODY
+
+
+def test_zstd_payload_requires_zstandard(monkeypatch):
+    monkeypatch.setattr(payload_store, "zstandard", None)
+    with pytest.raises(RuntimeError):
+        decompress_payload("zstd", b"\x28\xb5\x2f\xfd")
+    assert compress_payload(BODY)[0] == "zlib"
@@ -0,0 +1,171 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+import pytest
+
+import publisher
+from conftest import commit_file, git
+from pr_client import GH_NOT_FOUND_ERROR, GhCliClient, GitHubRestClient, PullRequestClient
+
+
+class FakeGitHub(ThreadingHTTPServer):
+    """进程内的 GitHub REST API：记录请求，按 responses 队列返回预设的失败响应"""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), _Handler)
+        self.requests = []
+        self.responses = []
+        self.prs = {}
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class _Handler(BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def _reply(self, status, body, headers=None):
+        data = json.dumps(body).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for key, value in (headers or {}).items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _handle(self, method):
+        server = self.server
+        url = urlparse(self.path)
+        length = int(self.headers.get("Content-Length") or 0)
+        body = json.loads(self.rfile.read(length)) if length else None
+        server.requests.append((method, url.path, body, self.headers.get("Authorization")))
+        if server.responses:
+            return self._reply(*server.responses.pop(0))
+
+        if method == "POST" and url.path == "/repos/o/r/pulls":
+            if body["head"] in server.prs:
+                return self._reply(422, {"message": "Validation Failed", "errors": [{"message": "A pull request already exists for o:" + body["head"]}]})
+            number = len(server.prs) + 1
+            server.prs[body["head"]] = {"number": number, "html_url": f"https://github.com/o/r/pull/{number}", **body}
+            return self._reply(201, server.prs[body["head"]])
+        if method == "GET" and url.path == "/repos/o/r/pulls":
+            head = parse_qs(url.query)["head"][0].split(":", 1)[1]
+            return self._reply(200, [server.prs[head]] if head in server.prs else [])
+        if method == "PATCH" and url.path.startswith("/repos/o/r/pulls/"):
+            number = int(url.path.rsplit("/", 1)[-1])
+            pr = next(pr for pr in server.prs.values() if pr["number"] == number)
+            pr.update(body)
+            return self._reply(200, pr)
+        self._reply(404, {"message": "Not Found"})
+
+    def do_GET(self):
+        self._handle("GET")
+
+    def do_POST(self):
+        self._handle("POST")
+
+    def do_PATCH(self):
+        self._handle("PATCH")
+
+
+@pytest.fixture
+def github():
+    server = FakeGitHub()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+@pytest.fixture
+def client(github):
+    client = GitHubRestClient(token="test-token", api_url=github.url, repository="o/r", timeout=5)
+    yield client
+    client.close()
+
+
+def test_create(client, github):
+    result = client.create("/unused", "feature", "main", "title", "body")
+    assert result == {"success": True, "pr_url": "https://github.com/o/r/pull/1"}
+    method, path, body, auth = github.requests[0]
+    assert (method, path, auth) == ("POST", "/repos/o/r/pulls", "Bearer test-token")
+    assert body == {"title": "title", "body": "body", "head": "feature", "base": "main"}
+
+
+def test_server_error_is_retryable(client, github):
+    github.responses.append((502, {"message": "Bad Gateway"}, {"Retry-After": "7"}))
+    result = client.create("/unused", "feature", "main", "title", "body")
+    assert not result["success"]
+    assert result["retryable"]
+    assert result["retry_after"] == 7
+
+    # 重试时请求正常完成
+    assert client.create("/unused", "feature", "main", "title", "body")["success"]
+    assert len(github.prs) == 1
+
+
+def test_validation_error_is_not_retryable(client, github):
+    github.responses.append((422, {"message": "Validation Failed", "errors": [{"message": "No commits between main and feature"}]}))
+    result = client.create("/unused", "feature", "main", "title", "body")
+    assert not result["success"]
+    assert not result["retryable"]
+
+
+def test_existing_pr_is_looked_up(client, github):
+    first = client.create("/unused", "feature", "main", "title", "body")
+    result = client.create("/unused", "feature", "main", "title", "body")
+    assert result == {"success": True, "pr_url": first["pr_url"], "existing": True}
+    method, path, _, _ = github.requests[-1]
+    assert (method, path) == ("GET", "/repos/o/r/pulls")
+
+
+def test_update(client, github):
+    pr = client.create("/unused", "feature", "main", "title", "body")
+    assert client.update("/unused", pr["pr_url"], "new title", "new body") == {"success": True}
+    assert github.prs["feature"]["title"] == "new title"
+    assert github.prs["feature"]["body"] == "new body"
+    assert github.requests[-1][:2] == ("PATCH", "/repos/o/r/pulls/1")
+
+
+def test_publish_updates_existing_pr(clone, remote, database, client, github, monkeypatch):
+    monkeypatch.setattr(publisher, "pr_client", client)
+    git(clone, "checkout", "-q", "-b", "vibe-coding-abc")
+    head = commit_file(clone, "a.txt", "first\n")
+    payload = {"repo_path": clone, "branch_name": "vibe-coding-abc", "base": "main", "title": "first", "body": "first body"}
+
+    first = publisher.publish_branch(1, {**payload, "head": head})
+    assert first["success"] and not first["existing"], first
+
+    # 同一 Issue 的后续任务：PR 已存在，标题和描述更新为最新内容
+    rebuilt = commit_file(clone, "a.txt", "second\n")
+    second = publisher.publish_branch(2, {**payload, "head": rebuilt, "title": "second", "body": "second body"})
+    assert second["success"] and second["existing"], second
+    assert second["pr_url"] == first["pr_url"]
+    assert github.prs["vibe-coding-abc"]["title"] == "second"
+    assert github.prs["vibe-coding-abc"]["body"] == "second body"
+    assert git(remote, "rev-parse", "refs/heads/vibe-coding-abc") == rebuilt
+
+
+def test_missing_gh_is_not_retryable(clone, monkeypatch):
+    monkeypatch.setenv("PATH", "/nonexistent")
+    client = GhCliClient(timeout=5)
+    result = client.create(clone, "feature", "main", "title", "body")
+    assert result == {"success": False, "error": GH_NOT_FOUND_ERROR, "retryable": False}
+    assert client.update(clone, "https://github.com/o/r/pull/1", "title", "body") == {"success": False, "error": GH_NOT_FOUND_ERROR}
+
+
+def test_incomplete_client_cannot_be_created():
+    class CreateOnly(PullRequestClient):
+        def create(self, repo_path, head, base, title, body):
+            return {"success": True, "pr_url": ""}
+
+    with pytest.raises(TypeError):
+        CreateOnly()
@@ -0,0 +1,23 @@
+import sys
+
+from process_runner import run_command
+
+
+def test_long_line_is_not_truncated():
+    result = run_command([sys.executable, "-c", "import sys; sys.stderr.write('x' * 5000000)"])
+    assert result.stderr == "x" * 5000000
+
+
+def test_multibyte_characters_across_chunks():
+    result = run_command([sys.executable, "-c", "import sys; sys.stdout.write('é' * 3000000 + '\\nend\\n')"])
+    assert result.stdout == "é" * 3000000 + "\nend\n"
+
+
+def test_on_output_receives_lines_in_order():
+    lines = []
+    run_command(
+        [sys.executable, "-c", "print('a'); print('b' * 3000000); print('c', end='')"],
+        on_output=lambda line, name: lines.append(line) or None
+    )
+    assert lines[0] == "a\n"
+    assert "".join(lines) == "a\n" + "b" * 3000000 + "\nc"
@@ -0,0 +1,92 @@
+from sqlmodel import Session
+
+import publisher
+from conftest import commit_file, git
+from models import Job
+
+
+class StubPullRequestClient:
+    name = "stub"
+
+    def __init__(self):
+        self.created = []
+
+    def create(self, repo_path, head, base, title, body):
+        self.created.append(head)
+        return {"success": True, "pr_url": f"https://example.com/pull/{len(self.created)}"}
+
+    def update(self, repo_path, pr_url, title, body):
+        return {"success": True}
+
+
+def _publish(clone, branch, head, job_id=1):
+    return publisher.publish_branch(job_id, {
+        "repo_path": clone, "branch_name": branch, "head": head, "base": "main", "title": "title", "body": "body"
+    })
+
+
+def _record(clone, branch, result):
+    with Session(publisher.engine) as session:
+        session.add(Job(kind=publisher.PUBLISH_JOB_KIND, status="succeeded", result=result,
+                        coalesce_key=publisher.publish_coalesce_key(clone, branch)))
+        session.commit()
+
+
+def test_unrecorded_remote_branch_is_taken_over(clone, remote, database, monkeypatch):
+    monkeypatch.setattr(publisher, "pr_client", StubPullRequestClient())
+    # 旧版本推送过的分支：远程已存在，但没有发布记录
+    git(clone, "checkout", "-q", "-b", "vibe/abc")
+    old = commit_file(clone, "a.txt", "old\n")
+    git(clone, "push", "-q", "origin", "vibe/abc")
+
+    git(clone, "reset", "-q", "--hard", "main")
+    new = commit_file(clone, "a.txt", "rebuilt\n")
+    assert new != old
+
+    result = _publish(clone, "vibe/abc", new)
+    assert result["success"], result
+    assert result["pushed_commit"] == new
+    assert git(remote, "rev-parse", "refs/heads/vibe/abc") == new
+
+
+def test_new_branch_is_created(clone, remote, database, monkeypatch):
+    monkeypatch.setattr(publisher, "pr_client", StubPullRequestClient())
+    git(clone, "checkout", "-q", "-b", "vibe/new")
+    head = commit_file(clone, "b.txt", "b\n")
+
+    result = _publish(clone, "vibe/new", head)
+    assert result["success"], result
+    assert git(remote, "rev-parse", "refs/heads/vibe/new") == head
+
+
+def test_foreign_push_after_recorded_publish_is_not_overwritten(clone, remote, database, monkeypatch, tmp_path):
+    monkeypatch.setattr(publisher, "pr_client", StubPullRequestClient())
+    git(clone, "checkout", "-q", "-b", "vibe/human")
+    ours = commit_file(clone, "c.txt", "ours\n")
+    assert _publish(clone, "vibe/human", ours)["success"]
+    _record(clone, "vibe/human", {"success": True, "pushed_commit": ours})
+
+    # 其他人在本服务发布之后推送到同一分支
+    other = str(tmp_path / "other")
+    git(str(tmp_path), "clone", "-q", "-b", "vibe/human", remote, other)
+    theirs = commit_file(other, "c.txt", "theirs\n")
+    git(other, "push", "-q", "origin", "vibe/human")
+
+    git(clone, "reset", "-q", "--hard", "main")
+    rebuilt = commit_file(clone, "c.txt", "rebuilt\n")
+    result = _publish(clone, "vibe/human", rebuilt, job_id=2)
+    assert not result["success"]
+    assert result["stage"] == "push"
+    assert not result["retryable"]
+    assert git(remote, "rev-parse", "refs/heads/vibe/human") == theirs
+
+
+def test_unreachable_remote_is_retryable(clone, database, monkeypatch):
+    monkeypatch.setattr(publisher, "pr_client", StubPullRequestClient())
+    git(clone, "remote", "set-url", "origin", "/nonexistent/remote.git")
+    head = git(clone, "rev-parse", "HEAD")
+
+    result = _publish(clone, "vibe/offline", head)
+    assert not result["success"]
+    assert result["retryable"]
+    assert result["stage"] == "push"
@@ -0,0 +1,96 @@
+import threading
+import time
+
+import pytest
+
+import repo_sync
+from conftest import commit_file, git
+from repo_sync import RepoSync, get_repo_sync
+
+
+@pytest.fixture
+def upstream(tmp_path, remote):
+    """向 remote 推送新提交用的克隆"""
+    path = str(tmp_path / "upstream")
+    git(str(tmp_path), "clone", "-q", remote, path)
+    return path
+
+
+def test_ensure_makes_blobless_clone(tmp_path, remote):
+    sync = RepoSync(str(tmp_path / "repo"), url=remote, fetch_interval=60)
+    sync.ensure()
+
+    path = str(sync.path)
+    assert git(path, "config", "remote.origin.partialclonefilter") == "blob:none"
+    assert git(path, "config", "remote.origin.promisor") == "true"
+    assert sync.has_remote
+    assert sync.base_ref == "origin/main"
+    assert git(path, "rev-parse", "origin/main") == git(remote, "rev-parse", "main")
+
+
+def test_fetch_notices_upstream_push(tmp_path, remote, upstream):
+    sync = RepoSync(str(tmp_path / "repo"), url=remote, fetch_interval=60)
+    sync.ensure()
+    calls = []
+    sync.add_listener(lambda: calls.append(1))
+
+    assert not sync.fetch()
+    assert calls == []
+
+    pushed = commit_file(upstream, "new.txt", "new\n")
+    git(upstream, "push", "-q", "origin", "main")
+    assert sync.fetch()
+    assert calls == [1]
+    assert git(str(sync.path), "rev-parse", "origin/main") == pushed
+
+
+def test_base_ref_keeps_tracking_branch_when_fetch_fails(tmp_path, remote):
+    path = str(tmp_path / "repo")
+    RepoSync(path, url=remote, fetch_interval=60).ensure()
+    git(path, "remote", "set-url", "origin", str(tmp_path / "missing.git"))
+
+    sync = RepoSync(path, url=None, fetch_interval=60)
+    sync.ensure()
+    assert sync.has_remote
+    assert sync.base_ref == "origin/main"
+
+
+def test_base_ref_falls_back_to_local_branch_when_fetch_fails(tmp_path):
+    path = str(tmp_path / "repo")
+    git(str(tmp_path), "init", "-q", "-b", "main", path)
+    commit_file(path, "README.md", "local\n")
+    git(path, "remote", "add", "origin", str(tmp_path / "missing.git"))
+
+    sync = RepoSync(path, url=None, fetch_interval=60)
+    sync.ensure()
+    assert not sync.has_remote
+    assert sync.base_ref == "main"
+    # 没有远程时 fetch 不做任何事
+    assert not sync.fetch()
+
+
+def test_get_repo_sync_clones_once(tmp_path, remote, monkeypatch):
+    clones = []
+    original_clone = RepoSync._clone
+
+    def slow_clone(self):
+        clones.append(self.path)
+        time.sleep(0.2)
+        original_clone(self)
+
+    monkeypatch.setattr(RepoSync, "_clone", slow_clone)
+    monkeypatch.setattr(repo_sync, "RepoSync", lambda path: RepoSync(path, url=remote, fetch_interval=0))
+    monkeypatch.setattr(repo_sync, "_syncs", {})
+    monkeypatch.setattr(repo_sync, "_path_locks", {})
+
+    path = str(tmp_path / "repo")
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(get_repo_sync(path))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(clones) == 1
+    assert len(results) == 8
+    assert all(result is results[0] for result in results)
@@ -0,0 +1,133 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, timedelta
+from functools import wraps
+from typing import Any, Dict, Iterator, List, Optional
+import time
+
+from models import EventSpan
+
+# 当前线程/协程正在记录的流水线追踪
+_current_trace: ContextVar[Optional["Trace"]] = ContextVar("vibe_trace", default=None)
+
+
+class Trace:
+    """本地的阶段耗时追踪 - 类似 OpenTelemetry span，但只保存到数据库，不对外导出"""
+
+    def __init__(self, job_id: Optional[int] = None):
+        self.job_id = job_id
+        self.spans: List[Dict[str, Any]] = []
+        self._stack: List[str] = []
+
+    @contextmanager
+    def span(self, name: str, **attributes) -> Iterator[Dict[str, Any]]:
+        """记录一个阶段的耗时；阶段内抛出的异常会标记为 error 并继续向上抛出"""
+        record = {
+            "name": name,
+            "parent": self._stack[-1] if self._stack else None,
+            "depth": len(self._stack),
+            "status": "ok",
+            "started_at": datetime.utcnow(),
+            "duration_ms": 0.0,
+            "attributes": dict(attributes) or None,
+        }
+        self.spans.append(record)
+        self._stack.append(name)
+        started = time.perf_counter()
+        try:
+            yield record
+        except BaseException as e:
+            record["status"] = "error"
+            record["attributes"] = {**(record["attributes"] or {}), "error": f"{type(e).__name__}: {e}"[:500]}
+            raise
+        finally:
+            record["duration_ms"] = round((time.perf_counter() - started) * 1000, 3)
+            self._stack.pop()
+
+    def add(self, name: str, started_at: datetime, finished_at: datetime, **attributes):
+        """补记一个已知起止时间的阶段（例如任务在队列中的等待时间）"""
+        self.spans.append({
+            "name": name,
+            "parent": self._stack[-1] if self._stack else None,
+            "depth": len(self._stack),
+            "status": "ok",
+            "started_at": started_at,
+            "duration_ms": round((finished_at - started_at).total_seconds() * 1000, 3),
+            "attributes": dict(attributes) or None,
+        })
+
+    @contextmanager
+    def activate(self) -> Iterator["Trace"]:
+        """设为当前追踪，调用链中的 span()/traced() 会记录到此追踪"""
+        token = _current_trace.set(self)
+        try:
+            yield self
+        finally:
+            _current_trace.reset(token)
+
+    def to_rows(self, event_id: int) -> List[EventSpan]:
+        """转换为待写入数据库的 EventSpan 记录"""
+        return [EventSpan(event_id=event_id, job_id=self.job_id, **record) for record in self.spans]
+
+
+@contextmanager
+def span(name: str, **attributes) -> Iterator[Optional[Dict[str, Any]]]:
+    """在当前追踪中记录阶段耗时，没有激活的追踪时不做任何事"""
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+    with trace.span(name, **attributes) as record:
+        yield record
+
+
+def traced(name: str):
+    """装饰器：将整个函数调用记录为一个阶段"""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def build_timeline(event_id: int, spans: List[EventSpan]) -> Dict[str, Any]:
+    """
+    将事件的阶段记录整理为时间线
+
+    Returns:
+        包含总耗时、按开始时间排序的阶段列表（带相对起点的偏移）以及按阶段名汇总的耗时
+    """
+    if not spans:
+        return {"event_id": event_id, "started_at": None, "finished_at": None, "total_ms": 0.0, "stages": {}, "spans": []}
+
+    origin = min(item.started_at for item in spans)
+    finished = max(item.started_at + timedelta(milliseconds=item.duration_ms) for item in spans)
+
+    # 嵌套阶段同时计入自身和上级阶段，例如 aider 的耗时也包含在 job 中
+    stages: Dict[str, float] = {}
+    for item in spans:
+        stages[item.name] = round(stages.get(item.name, 0.0) + item.duration_ms, 3)
+
+    return {
+        "event_id": event_id,
+        "started_at": origin,
+        "finished_at": finished,
+        "total_ms": round((finished - origin).total_seconds() * 1000, 3),
+        "stages": stages,
+        "spans": [
+            {
+                "name": item.name,
+                "parent": item.parent,
+                "depth": item.depth,
+                "job_id": item.job_id,
+                "status": item.status,
+                "started_at": item.started_at,
+                "offset_ms": round((item.started_at - origin).total_seconds() * 1000, 3),
+                "duration_ms": item.duration_ms,
+                "attributes": item.attributes,
+            }
+            for item in sorted(spans, key=lambda item: (item.started_at, item.id or 0))
+        ],
+    }
@@ -1,8 +1,12 @@
 import subprocess
 import os
+import re
 import sys
+import tempfile
+import threading
+import time
 from pathlib import Path
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Tuple
 import json
 import logging
 from dotenv import load_dotenv
@@ -10,10 +14,143 @@ from dotenv import load_dotenv
 # 优先加载 .env 文件中的环境变量
 load_dotenv()
 
+from aider_worker import AIDER_WORKER_MODE, aider_worker_pool
+from file_selection import discover_python_files
+from job_logs import JobLog, current_job_log
+from metrics import AIDER_DURATION, AIDER_RUNS_TOTAL
+from process_runner import CommandCancelled, run_command
+from tracing import span, traced
+
 # 配置日志
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Aider 能力探测缓存有效期（秒），探测失败的结果只缓存较短时间以便尽快恢复
+AIDER_PROBE_TTL = float(os.getenv("AIDER_PROBE_TTL", "3600"))
+AIDER_PROBE_FAILURE_TTL = float(os.getenv("AIDER_PROBE_FAILURE_TTL", "60"))
+
+# aider 子进程的总时长上限和无输出时长上限（秒），超时后终止整个进程组
+AIDER_TIMEOUT = float(os.getenv("AIDER_TIMEOUT", "1800"))
+AIDER_IDLE_TIMEOUT = float(os.getenv("AIDER_IDLE_TIMEOUT", "300"))
+
+# prompt 超过该字节数时写入临时文件并通过 --message-file 传给 aider，避免命令行参数超过 ARG_MAX（0 表示总是使用文件）
+AIDER_MESSAGE_FILE_THRESHOLD = int(os.getenv("AIDER_MESSAGE_FILE_THRESHOLD", "16384"))
+
+# 非交互运行时附加的参数
+AIDER_NON_INTERACTIVE_FLAGS = [
+    "--no-show-model-warnings",
+    "--yes",  # 自动确认所有提示
+    "--no-check-update",  # 不检查更新
+    "--no-analytics"  # 禁用分析
+]
+
+def resolve_aider_model() -> Optional[str]:
+    """根据环境变量解析 aider 实际使用的模型名称"""
+    aider_model = os.getenv("AIDER_OPENAI_MODEL")
+    if not aider_model:
+        return os.getenv("AIDER_MODEL")
+    # 使用正确的 deepseek 模型名称
+    if "deepseek" in aider_model.lower():
+        return "deepseek/deepseek-chat"
+    return aider_model
+
+def build_aider_env(project_path: Optional[Path] = None) -> Dict[str, str]:
+    """构建运行 aider 的环境变量（从 .env 文件加载 aider 相关配置）"""
+    env = os.environ.copy()
+    if project_path is not None:
+        env["AIDER_WORK_DIR"] = str(project_path)
+    
+    aider_api_key = os.getenv("AIDER_OPENAI_API_KEY")
+    aider_api_base = os.getenv("AIDER_OPENAI_API_BASE")
+    
+    # 设置 DeepSeek API 配置
+    if aider_api_key:
+        env["DEEPSEEK_API_KEY"] = aider_api_key
+        env["OPENAI_API_KEY"] = aider_api_key  # 兼容性设置
+    if aider_api_base:
+        env["DEEPSEEK_API_BASE"] = aider_api_base
+        env["OPENAI_API_BASE"] = aider_api_base  # 兼容性设置
+    if os.getenv("AIDER_OPENAI_MODEL"):
+        env["AIDER_MODEL"] = resolve_aider_model()
+    return env
+
+class AiderCapabilityCache:
+    """Aider 能力缓存 - 进程内共享，避免每个事件都启动一次 aider 进行探测"""
+    
+    def __init__(self, ttl: float = AIDER_PROBE_TTL, failure_ttl: float = AIDER_PROBE_FAILURE_TTL):
+        self.ttl = ttl
+        self.failure_ttl = failure_ttl
+        self._entries: Dict[str, Tuple[float, Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+    
+    def get(self, aider_path: str = "aider", refresh: bool = False) -> Dict[str, Any]:
+        """获取 aider 能力信息，缓存过期或不存在时重新探测"""
+        # 同一时间只允许一个线程探测，其他线程等待后直接复用结果
+        with self._lock:
+            entry = self._entries.get(aider_path)
+            if entry and not refresh and time.monotonic() < entry[0]:
+                return entry[1]
+            
+            capabilities = self._probe(aider_path)
+            ttl = self.ttl if capabilities["available"] else self.failure_ttl
+            self._entries[aider_path] = (time.monotonic() + ttl, capabilities)
+            return capabilities
+    
+    def peek(self, aider_path: str = "aider") -> Optional[Dict[str, Any]]:
+        """返回已缓存的能力信息（可能已过期），不触发探测"""
+        entry = self._entries.get(aider_path)
+        return entry[1] if entry else None
+    
+    def invalidate(self, aider_path: Optional[str] = None):
+        """清除缓存"""
+        with self._lock:
+            if aider_path is None:
+                self._entries.clear()
+            else:
+                self._entries.pop(aider_path, None)
+    
+    def _probe(self, aider_path: str) -> Dict[str, Any]:
+        """执行 aider --version 和 aider --help，解析版本和支持的参数"""
+        capabilities = {
+            "aider_path": aider_path,
+            "available": False,
+            "version": None,
+            "flags": [],
+            "model": resolve_aider_model(),
+            "checked_at": time.time(),
+            "error": None
+        }
+        try:
+            result = subprocess.run(
+                [aider_path, "--version"],
+                capture_output=True,
+                text=True,
+                timeout=10
+            )
+            if result.returncode != 0:
+                capabilities["error"] = f"Aider 不可用: {result.stderr}"
+                return capabilities
+            capabilities["available"] = True
+            capabilities["version"] = result.stdout.strip()
+            logger.info(f"Aider 版本: {capabilities['version']}")
+            
+            help_result = subprocess.run(
+                [aider_path, "--help"],
+                capture_output=True,
+                text=True,
+                timeout=10
+            )
+            if help_result.returncode == 0:
+                capabilities["flags"] = sorted(set(re.findall(r"(?<![\w-])--[a-z0-9][a-z0-9-]*", help_result.stdout)))
+        except FileNotFoundError:
+            capabilities["error"] = f"找不到 Aider 可执行文件: {aider_path}"
+        except subprocess.TimeoutExpired:
+            capabilities["error"] = "Aider 启动超时"
+        return capabilities
+
+# 进程级共享的 aider 能力缓存
+aider_capabilities = AiderCapabilityCache()
+
 class Vibe:
     """Vibe 类 - 使用 Aider 对 Python 项目进行编码"""
     
@@ -39,75 +176,82 @@ class Vibe:
         self._check_aider_available()
     
     def _check_aider_available(self):
-        """检查 Aider 是否可用"""
-        try:
-            result = subprocess.run(
-                [self.aider_path, "--version"],
-                capture_output=True,
-                text=True,
-                timeout=10
-            )
-            if result.returncode != 0:
-                raise RuntimeError(f"Aider 不可用: {result.stderr}")
-            logger.info(f"Aider 版本: {result.stdout.strip()}")
-        except FileNotFoundError:
-            raise RuntimeError(f"找不到 Aider 可执行文件: {self.aider_path}")
-        except subprocess.TimeoutExpired:
-            raise RuntimeError("Aider 启动超时")
+        """检查 Aider 是否可用（使用进程级缓存）"""
+        self.capabilities = aider_capabilities.get(self.aider_path)
+        if not self.capabilities["available"]:
+            raise RuntimeError(self.capabilities["error"])
+    
+    def _non_interactive_flags(self) -> List[str]:
+        """返回当前 aider 版本支持的非交互参数"""
+        supported = set(self.capabilities.get("flags") or [])
+        if not supported:
+            return list(AIDER_NON_INTERACTIVE_FLAGS)
+        return [flag for flag in AIDER_NON_INTERACTIVE_FLAGS if flag in supported]
     
+    @traced("aider")
     def code(self, requirements: str, files: Optional[List[str]] = None) -> Dict[str, Any]:
         """
         使用 Aider 对项目进行编码
         
         Args:
             requirements: 编码需求描述
-            files: 要处理的文件列表，如果为 None 则处理所有 Python 文件
+            files: 要处理的文件列表，如果为 None 则处理所有 Python 文件；空列表表示不预先添加文件，由 aider 根据 repo map 自行选择
         
         Returns:
             包含执行结果的字典
         """
+        started = time.perf_counter()
+        result = self._run_aider(requirements, files)
+        AIDER_DURATION.observe(time.perf_counter() - started)
+        AIDER_RUNS_TOTAL.inc(exit_code=str(result.get("returncode")))
+        return result
+    
+    def _use_message_file(self, requirements: str) -> bool:
+        """prompt 较大且 aider 支持 --message-file 时通过文件传递"""
+        if len(requirements.encode("utf-8")) <= AIDER_MESSAGE_FILE_THRESHOLD and AIDER_MESSAGE_FILE_THRESHOLD > 0:
+            return False
+        supported = self.capabilities.get("flags")
+        return not supported or "--message-file" in supported
+    
+    def _run_aider(self, requirements: str, files: Optional[List[str]]) -> Dict[str, Any]:
+        """构建命令并执行 aider（子进程或常驻 worker）"""
+        message_file = None
         try:
             # 构建 Aider 命令
             cmd = [self.aider_path]
             
             # 添加文件参数
-            if files:
+            file_args = []
+            if files is not None:
                 for file_path in files:
                     full_path = self.project_path / file_path
                     if full_path.exists():
-                        cmd.append(str(full_path))
+                        file_args.append(str(full_path))
                     else:
                         logger.warning(f"文件不存在，跳过: {file_path}")
             else:
                 # 自动发现 Python 文件
-                python_files = self._discover_python_files()
-                cmd.extend(python_files)
+                with span("discover_files"):
+                    file_args = self._discover_python_files()
             
-            # 添加需求作为消息
-            cmd.extend(["--message", requirements])
+            # 常驻 worker 模式：复用已完成导入的 aider 进程
+            if AIDER_WORKER_MODE:
+                return self._code_with_worker(requirements, file_args)
             
-            # 设置工作目录和环境变量
-            env = os.environ.copy()
-            env["AIDER_WORK_DIR"] = str(self.project_path)
+            cmd.extend(file_args)
             
-            # 从 .env 文件加载 aider 相关环境变量
-            aider_api_key = os.getenv("AIDER_OPENAI_API_KEY")
-            aider_api_base = os.getenv("AIDER_OPENAI_API_BASE")
-            aider_model = os.getenv("AIDER_OPENAI_MODEL")
+            # 添加需求作为消息；大 prompt 写入工作树之外的临时文件，不会被提交
+            if self._use_message_file(requirements):
+                fd, message_file = tempfile.mkstemp(prefix="aider-message-", suffix=".md")
+                with os.fdopen(fd, "w", encoding="utf-8") as f:
+                    f.write(requirements)
+                logger.info(f"📄 prompt 共 {len(requirements.encode('utf-8'))} 字节，通过 --message-file 传递: {message_file}")
+                cmd.extend(["--message-file", message_file])
+            else:
+                cmd.extend(["--message", requirements])
             
-            # 设置 DeepSeek API 配置
-            if aider_api_key:
-                env["DEEPSEEK_API_KEY"] = aider_api_key
-                env["OPENAI_API_KEY"] = aider_api_key  # 兼容性设置
-            if aider_api_base:
-                env["DEEPSEEK_API_BASE"] = aider_api_base
-                env["OPENAI_API_BASE"] = aider_api_base  # 兼容性设置
-            if aider_model:
-                # 使用正确的 deepseek 模型名称
-                if "deepseek" in aider_model.lower():
-                    env["AIDER_MODEL"] = "deepseek/deepseek-chat"
-                else:
-                    env["AIDER_MODEL"] = aider_model
+            # 设置工作目录和环境变量
+            env = build_aider_env(self.project_path)
             
             logger.info(f"执行命令: {' '.join(cmd)}")
             logger.info(f"工作目录: {self.project_path}")
@@ -116,90 +260,48 @@ class Vibe:
             # 执行 Aider
             logger.info("🚀 开始执行 aider...")
             
-            # 使用 Popen 来实时获取输出，并添加参数来避免交互式提示
-            cmd.extend([
-                "--no-show-model-warnings",
-                "--yes",  # 自动确认所有提示
-                "--no-check-update",  # 不检查更新
-                "--no-analytics"  # 禁用分析
-            ])
-            
-            process = subprocess.Popen(
-                cmd,
-                cwd=self.project_path,
-                stdout=subprocess.PIPE,
-                stderr=subprocess.PIPE,
-                stdin=subprocess.PIPE,  # 添加 stdin 来处理交互式输入
-                text=True,
-                env=env,
-                bufsize=1,
-                universal_newlines=True
-            )
-            
-            stdout_lines = []
-            stderr_lines = []
-            
-            # 实时读取输出并处理交互式提示
-            while True:
-                output = process.stdout.readline()
-                if output == '' and process.poll() is not None:
-                    break
-                if output:
-                    output_line = output.strip()
-                    logger.info(f"📤 aider: {output_line}")
-                    stdout_lines.append(output)
-                    
-                    # 处理交互式提示
-                    if "Open documentation url for more info?" in output_line:
-                        logger.info("🤖 自动回答 'No' 以避免交互式提示")
-                        process.stdin.write("N\n")
-                        process.stdin.flush()
-                    elif "Don't ask again" in output_line:
-                        logger.info("🤖 自动回答 'D' 以不再询问")
-                        process.stdin.write("D\n")
-                        process.stdin.flush()
-                    elif "Yes" in output_line and "No" in output_line and "Don't ask again" in output_line:
-                        logger.info("🤖 自动回答 'N' 以跳过文档链接")
-                        process.stdin.write("N\n")
-                        process.stdin.flush()
+            # 添加参数来避免交互式提示
+            cmd.extend(self._non_interactive_flags())
             
-            # 读取剩余输出
-            remaining_stdout, remaining_stderr = process.communicate()
-            if remaining_stdout:
-                logger.info(f"📤 aider: {remaining_stdout}")
-                stdout_lines.append(remaining_stdout)
-            if remaining_stderr:
-                logger.info(f"⚠️  aider: {remaining_stderr}")
-                stderr_lines.append(remaining_stderr)
+            # 输出逐行写入任务日志（没有任务上下文时只保留内存中的最近几行），不在内存中累积完整输出
+            output = current_job_log() or JobLog()
             
-            returncode = process.returncode
-            stdout = ''.join(stdout_lines)
-            stderr = ''.join(stderr_lines)
+            def handle_output(line: str, stream: str) -> Optional[str]:
+                """写入任务日志，并返回交互式提示的自动应答"""
+                output_line = line.strip()
+                logger.debug(f"📤 aider[{stream}]: {output_line}")
+                output.write(line)
+                
+                if "Open documentation url for more info?" in output_line:
+                    logger.info("🤖 自动回答 'No' 以避免交互式提示")
+                    return "N\n"
+                if "Don't ask again" in output_line:
+                    logger.info("🤖 自动回答 'D' 以不再询问")
+                    return "D\n"
+                return None
             
-            logger.info(f"✅ aider 执行完成，返回码: {returncode}")
-            if stdout and not any(line.strip() for line in stdout_lines if line.strip()):
-                logger.info(f"📤 aider 完整输出:\n{stdout}")
-            if stderr and not any(line.strip() for line in stderr_lines if line.strip()):
-                logger.info(f"⚠️  aider 完整错误输出:\n{stderr}")
+            # stdout/stderr 并发读取，超过总时长或长时间无输出时终止整个进程组
+            try:
+                result = run_command(
+                    cmd,
+                    cwd=str(self.project_path),
+                    env=env,
+                    timeout=AIDER_TIMEOUT,
+                    idle_timeout=AIDER_IDLE_TIMEOUT,
+                    on_output=handle_output
+                )
+            except subprocess.TimeoutExpired as e:
+                logger.error(f"⏰ aider 执行超时（上限 {e.timeout} 秒），已终止进程组")
+                output.write(f"Aider 执行超时（上限 {e.timeout} 秒），已终止")
+                return self._summarize(-1, output, " ".join(cmd))
+            except CommandCancelled:
+                logger.warning("⏹️  任务已取消，aider 进程组已终止")
+                output.write("任务已取消，aider 已终止")
+                return self._summarize(-1, output, " ".join(cmd))
             
-            return {
-                "success": returncode == 0,
-                "returncode": returncode,
-                "stdout": stdout,
-                "stderr": stderr,
-                "command": " ".join(cmd),
-                "project_path": str(self.project_path)
-            }
+            logger.info(f"✅ aider 执行完成，返回码: {result.returncode}，输出 {output.lines} 行 / {output.bytes} 字节")
+            return self._summarize(result.returncode, output, " ".join(cmd))
             
-        except subprocess.TimeoutExpired:
-            return {
-                "success": False,
-                "returncode": -1,
-                "stdout": "",
-                "stderr": "Aider 执行超时",
-                "command": " ".join(cmd),
-                "project_path": str(self.project_path)
-            }
         except Exception as e:
             return {
                 "success": False,
@@ -209,25 +311,59 @@ class Vibe:
                 "command": " ".join(cmd),
                 "project_path": str(self.project_path)
             }
+        finally:
+            if message_file:
+                os.unlink(message_file)
     
-    def _discover_python_files(self) -> List[str]:
-        """发现项目中的 Python 文件"""
-        python_files = []
+    def _code_with_worker(self, requirements: str, file_args: List[str]) -> Dict[str, Any]:
+        """通过常驻 aider worker 执行编码任务，参数与子进程模式相同"""
+        logger.info(f"🚀 使用常驻 aider worker 执行任务，工作目录: {self.project_path}")
+        started = time.monotonic()
         
-        # 常见的 Python 文件模式
-        patterns = ["*.py", "**/*.py"]
+        args = file_args + self._non_interactive_flags()
+        model = resolve_aider_model()
+        if model:
+            args.extend(["--model", model])
         
-        for pattern in patterns:
-            for file_path in self.project_path.glob(pattern):
-                # 跳过 __pycache__ 和 .git 目录
-                if "__pycache__" in str(file_path) or ".git" in str(file_path):
-                    continue
-                
-                # 跳过虚拟环境目录
-                if any(venv_dir in str(file_path) for venv_dir in ["venv", "env", ".venv", ".env"]):
-                    continue
-                
-                python_files.append(str(file_path))
+        # 输出在执行过程中逐行写入任务日志，SSE 接口可以实时看到
+        output = current_job_log() or JobLog()
+        aider_worker_pool.configure(build_aider_env())
+        try:
+            result = aider_worker_pool.run(
+                str(self.project_path), args, requirements,
+                on_output=output.write, timeout=AIDER_TIMEOUT, idle_timeout=AIDER_IDLE_TIMEOUT
+            )
+        except subprocess.TimeoutExpired as e:
+            logger.error(f"⏰ aider 执行超时（上限 {e.timeout} 秒），已终止常驻 worker")
+            output.write(f"Aider 执行超时（上限 {e.timeout} 秒），已终止")
+            return self._summarize(-1, output, "aider-worker")
+        except CommandCancelled:
+            logger.warning("⏹️  任务已取消，常驻 aider worker 已终止")
+            output.write("任务已取消，aider 已终止")
+            return self._summarize(-1, output, "aider-worker")
+        
+        logger.info(f"✅ 常驻 aider worker 执行完成，耗时 {time.monotonic() - started:.1f} 秒")
+        if result.get("error"):
+            output.write_text(result["error"])
+        return self._summarize(0 if result.get("success") else 1, output, "aider-worker")
+    
+    def _summarize(self, returncode: int, output: JobLog, command: str) -> Dict[str, Any]:
+        """执行结果只包含输出摘要，完整输出保存在任务日志文件中"""
+        summary = output.summary()
+        tail = summary.pop("tail")
+        return {
+            "success": returncode == 0,
+            "returncode": returncode,
+            "stdout": tail,
+            "stderr": tail if returncode != 0 else "",
+            **summary,
+            "command": command,
+            "project_path": str(self.project_path)
+        }
+    
+    def _discover_python_files(self) -> List[str]:
+        """发现项目中的 Python 文件（去重，跳过缓存、.git 和虚拟环境目录）"""
+        python_files = [str(self.project_path / relative) for relative in discover_python_files(self.project_path)]
         
         logger.info(f"发现 {len(python_files)} 个 Python 文件")
         return python_files
@@ -277,35 +413,10 @@ class Vibe:
             cmd.extend(["--message", requirements])
             
             # 添加参数来避免交互式提示
-            cmd.extend([
-                "--no-show-model-warnings",
-                "--yes",  # 自动确认所有提示
-                "--no-check-update",  # 不检查更新
-                "--no-analytics"  # 禁用分析
-            ])
+            cmd.extend(self._non_interactive_flags())
             
             # 设置环境变量
-            env = os.environ.copy()
-            env["AIDER_WORK_DIR"] = str(self.project_path)
-            
-            # 从 .env 文件加载 aider 相关环境变量
-            aider_api_key = os.getenv("AIDER_OPENAI_API_KEY")
-            aider_api_base = os.getenv("AIDER_OPENAI_API_BASE")
-            aider_model = os.getenv("AIDER_OPENAI_MODEL")
-            
-            # 设置 DeepSeek API 配置
-            if aider_api_key:
-                env["DEEPSEEK_API_KEY"] = aider_api_key
-                env["OPENAI_API_KEY"] = aider_api_key  # 兼容性设置
-            if aider_api_base:
-                env["DEEPSEEK_API_BASE"] = aider_api_base
-                env["OPENAI_API_BASE"] = aider_api_base  # 兼容性设置
-            if aider_model:
-                # 使用正确的 deepseek 模型名称
-                if "deepseek" in aider_model.lower():
-                    env["AIDER_MODEL"] = "deepseek/deepseek-chat"
-                else:
-                    env["AIDER_MODEL"] = aider_model
+            env = build_aider_env(self.project_path)
             
             logger.info(f"启动交互模式，命令: {' '.join(cmd)}")
             logger.info(f"工作目录: {self.project_path}")
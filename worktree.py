@@ -0,0 +1,282 @@
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Iterator, List, Optional
+import logging
+import os
+import shutil
+import subprocess
+import threading
+import uuid
+
+from git_backend import git_backend, run_git
+from process_runner import uncancellable
+from tracing import span
+
+logger = logging.getLogger(__name__)
+
+# 工作树存放目录
+WORKTREE_ROOT = os.getenv("WORKTREE_ROOT", os.path.join(os.path.dirname(os.path.abspath(__file__)), ".worktrees"))
+
+# 预热池配置
+WORKTREE_POOL_SIZE = int(os.getenv("WORKTREE_POOL_SIZE", "2"))
+WORKTREE_POOL_REFRESH_INTERVAL = float(os.getenv("WORKTREE_POOL_REFRESH_INTERVAL", "30"))
+
+
+class WorktreeManager:
+    """Git 工作树管理器 - 每个任务使用独立的 git worktree，共享同一个对象库"""
+
+    def __init__(self, repo_path: str, worktree_root: Optional[str] = None):
+        """
+        初始化工作树管理器
+
+        Args:
+            repo_path: 主仓库路径（例如 WoodenMan）
+            worktree_root: 工作树存放目录，默认为 WORKTREE_ROOT/<仓库名>
+        """
+        self.repo_path = Path(repo_path).resolve()
+        self.worktree_root = Path(worktree_root or os.path.join(WORKTREE_ROOT, self.repo_path.name)).resolve()
+
+        # git worktree add/remove 会修改主仓库的 .git/worktrees 元数据，串行执行更安全
+        self._lock = threading.Lock()
+
+    def create(self, branch_name: str, base: str = "main") -> Path:
+        """基于 base 创建分支（已存在时重置到 base），并检出到独立的工作树"""
+        self.worktree_root.mkdir(parents=True, exist_ok=True)
+        worktree_path = self.worktree_root / f"{branch_name}-{uuid.uuid4().hex[:6]}"
+
+        with self._lock:
+            run_git(["worktree", "add", "-B", branch_name, str(worktree_path), base], cwd=str(self.repo_path))
+
+        logger.info(f"🌳 已创建工作树 {worktree_path} (分支 {branch_name}，基于 {base})")
+        return worktree_path
+
+    def create_detached(self, commit: str) -> Path:
+        """创建处于分离 HEAD 状态的工作树，供预热池使用"""
+        self.worktree_root.mkdir(parents=True, exist_ok=True)
+        worktree_path = self.worktree_root / f"pool-{uuid.uuid4().hex[:8]}"
+
+        with self._lock:
+            run_git(["worktree", "add", "--detach", str(worktree_path), commit], cwd=str(self.repo_path))
+
+        logger.info(f"🌳 已创建预热工作树 {worktree_path} ({commit[:8]})")
+        return worktree_path
+
+    def list_managed(self) -> List[Path]:
+        """列出 worktree_root 下由本管理器创建的工作树"""
+        result = run_git(["worktree", "list", "--porcelain"], cwd=str(self.repo_path), check=False)
+        paths = []
+        for line in result.stdout.splitlines():
+            if line.startswith("worktree "):
+                path = Path(line[len("worktree "):]).resolve()
+                if path.parent == self.worktree_root:
+                    paths.append(path)
+        return paths
+
+    def remove(self, worktree_path: Path):
+        """删除工作树，分支保留在共享仓库中"""
+        with self._lock:
+            result = run_git(["worktree", "remove", "--force", str(worktree_path)], cwd=str(self.repo_path), check=False)
+            if result.returncode != 0:
+                logger.warning(f"⚠️  git worktree remove 失败，直接删除目录: {result.stderr.strip()}")
+                shutil.rmtree(worktree_path, ignore_errors=True)
+            run_git(["worktree", "prune"], cwd=str(self.repo_path), check=False)
+
+        logger.info(f"🧹 已清理工作树 {worktree_path}")
+
+    @contextmanager
+    def worktree(self, branch_name: str, base: str = "main") -> Iterator[Path]:
+        """创建工作树并在使用完毕后自动清理"""
+        worktree_path = self.create(branch_name, base)
+        try:
+            yield worktree_path
+        finally:
+            self.remove(worktree_path)
+
+
+class WorktreePool:
+    """工作树预热池 - 始终保持若干个与 main 同步的干净工作树，任务开始时直接取用"""
+
+    def __init__(
+        self,
+        manager: WorktreeManager,
+        size: int = WORKTREE_POOL_SIZE,
+        base: str = "main",
+        refresh_interval: float = WORKTREE_POOL_REFRESH_INTERVAL
+    ):
+        """
+        初始化预热池
+
+        Args:
+            manager: 工作树管理器
+            size: 保持空闲的工作树数量，为 0 时每个任务都新建工作树
+            base: 新分支的基准分支
+            refresh_interval: 后台检查基准分支是否移动的间隔（秒）
+        """
+        self.manager = manager
+        self.size = max(0, size)
+        self.base = base
+        self.refresh_interval = refresh_interval
+
+        self._idle: List[Path] = []
+        self._idle_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._wakeup = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        """接管遗留的工作树并启动后台补充线程"""
+        if self._thread or self.size == 0:
+            return
+
+        # 上次进程遗留的工作树重置后直接放回池中，避免重复检出文件
+        for path in self.manager.list_managed():
+            if path.name.startswith("pool-"):
+                self._release_to_pool(path)
+            else:
+                self.manager.remove(path)
+
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._refresh_loop, name="worktree-pool", daemon=True)
+        self._thread.start()
+        logger.info(f"🔥 工作树预热池已启动，目标数量: {self.size}")
+
+    def stop(self, timeout: float = 5.0):
+        """停止后台补充线程，空闲工作树保留在磁盘上供下次启动复用"""
+        self._stop.set()
+        self._wakeup.set()
+        if self._thread:
+            self._thread.join(timeout=timeout)
+            self._thread = None
+
+    def base_commit(self) -> str:
+        """获取基准分支当前指向的提交"""
+        return git_backend.resolve(str(self.manager.repo_path), self.base)
+
+    def wake(self):
+        """基准分支移动后立即同步空闲工作树，不等待下一次定期刷新"""
+        self._wakeup.set()
+
+    def idle_count(self) -> int:
+        """返回空闲工作树数量"""
+        with self._idle_lock:
+            return len(self._idle)
+
+    def acquire(self, branch_name: str) -> Path:
+        """
+        取出一个预热好的工作树并切换到任务分支，池为空时退化为新建工作树
+
+        同一 Issue 的每个任务使用同一个分支名：上一个任务留下的同名分支重置到最新的基准提交后重新构建，
+        推送时再以 --force-with-lease 更新远程分支和已有的 PR。
+        """
+        commit = self.base_commit()
+        with self._idle_lock:
+            worktree_path = self._idle.pop() if self._idle else None
+
+        if worktree_path is None:
+            logger.info("⏳ 预热池为空，直接创建工作树")
+            return self.manager.create(branch_name, self.base)
+
+        try:
+            self._sync_to(worktree_path, commit)
+            git_backend.create_branch(str(worktree_path), branch_name, force=True)
+        except subprocess.CalledProcessError:
+            self.manager.remove(worktree_path)
+            raise
+        finally:
+            self._wakeup.set()
+
+        logger.info(f"⚡ 从预热池取出工作树 {worktree_path} (分支 {branch_name}，基于 {commit[:8]})")
+        return worktree_path
+
+    def release(self, worktree_path: Path):
+        """任务结束后重置工作树并放回池中，池已满时删除"""
+        if self.size == 0:
+            self.manager.remove(worktree_path)
+            return
+        self._release_to_pool(worktree_path)
+        self._wakeup.set()
+
+    @contextmanager
+    def worktree(self, branch_name: str) -> Iterator[Path]:
+        """从预热池取出工作树并在使用完毕后归还"""
+        with span("worktree_acquire"):
+            worktree_path = self.acquire(branch_name)
+        try:
+            yield worktree_path
+        finally:
+            # 任务被取消时仍需重置并归还工作树
+            with span("worktree_release"), uncancellable():
+                self.release(worktree_path)
+
+    def refresh(self):
+        """将空闲工作树同步到最新的基准提交，并补充到目标数量"""
+        commit = self.base_commit()
+
+        with self._idle_lock:
+            idle = list(self._idle)
+        for worktree_path in idle:
+            try:
+                self._sync_to(worktree_path, commit)
+            except subprocess.CalledProcessError as e:
+                logger.warning(f"⚠️  同步预热工作树失败，将其删除: {e.stderr}")
+                with self._idle_lock:
+                    if worktree_path in self._idle:
+                        self._idle.remove(worktree_path)
+                self.manager.remove(worktree_path)
+
+        while self.idle_count() < self.size and not self._stop.is_set():
+            worktree_path = self.manager.create_detached(commit)
+            with self._idle_lock:
+                self._idle.append(worktree_path)
+
+    def _sync_to(self, worktree_path: Path, commit: str):
+        """将工作树以分离 HEAD 的方式切换到指定提交，并清除所有本地修改"""
+        if git_backend.head(str(worktree_path)) != commit:
+            git_backend.checkout_detached(str(worktree_path), commit)
+
+    def _release_to_pool(self, worktree_path: Path):
+        """重置工作树（丢弃修改、脱离任务分支）后放回池中"""
+        try:
+            git_backend.reset_clean(str(worktree_path), self.base_commit())
+        except subprocess.CalledProcessError as e:
+            logger.warning(f"⚠️  重置工作树失败，将其删除: {e.stderr}")
+            self.manager.remove(worktree_path)
+            return
+
+        with self._idle_lock:
+            if len(self._idle) < self.size:
+                self._idle.append(worktree_path)
+                return
+        self.manager.remove(worktree_path)
+
+    def _refresh_loop(self):
+        """后台线程：定期或在工作树被取用后补充预热池"""
+        while not self._stop.is_set():
+            try:
+                self.refresh()
+            except Exception as e:
+                logger.error(f"刷新工作树预热池失败: {str(e)}")
+            self._wakeup.wait(self.refresh_interval)
+            self._wakeup.clear()
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_worktree_pool(repo_path: str, base: str = "main") -> WorktreePool:
+    """获取仓库对应的工作树预热池（进程内共享，首次获取时以 base 为基准分支启动）"""
+    key = str(Path(repo_path).resolve())
+    with _pools_lock:
+        if key not in _pools:
+            pool = WorktreePool(WorktreeManager(key), base=base)
+            pool.start()
+            _pools[key] = pool
+        return _pools[key]
+
+
+def stop_worktree_pools():
+    """停止所有预热池的后台线程"""
+    with _pools_lock:
+        for pool in _pools.values():
+            pool.stop()